@@ -0,0 +1,527 @@
+"""HTTP load benchmark.
+
+Seeds a throwaway database, serves create_app() from the Werkzeug dev server
+or gunicorn in a subprocess, and runs each traffic scenario for a fixed time
+with a number of concurrent clients. Reports throughput, p50/p95/p99 latency
+and the peak RSS of the server processes per scenario, and stores them as JSON:
+
+    python bench/http_bench.py run --server werkzeug --json results/dev.json
+    python bench/http_bench.py run --server gunicorn --workers 4 --json results/g4.json
+    python bench/http_bench.py run --database-url postgresql://localhost/bench_tmp --scenarios list_repositories,share_view
+
+A server that cannot be started or seeded is listed under "failures" in the
+JSON; the other servers still run and the exit status is 1.
+
+Two result files are compared scenario by scenario; the exit status is 1 when
+throughput dropped or latency or memory grew by more than the threshold:
+
+    python bench/http_bench.py compare results/before.json results/after.json --threshold 0.15
+
+The database named by --database-url must be empty: it is migrated and filled
+with bench users. Clients are threads in this process, so on small machines
+compare runs made with the same --concurrency and on the same host.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import io
+import urllib.request
+import urllib.error
+from datetime import datetime, timezone
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(BENCH)
+sys.path.insert(0, BACKEND)
+# The sibling script, however this one is started (as a script, with -m or imported)
+sys.path.insert(0, BENCH)
+
+from login_burst import percentile
+
+PASSWORD = 'bench-password'
+SIZES = {'k': 1024, 'm': 1024 * 1024}
+
+
+class BenchError(Exception):
+    """A server could not be set up; its scenarios are skipped and the failure is recorded."""
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1:] in SIZES:
+        return int(float(text[:-1]) * SIZES[text[-1]])
+    return int(text)
+
+def format_size(size):
+    for suffix, factor in (('m', SIZES['m']), ('k', SIZES['k'])):
+        if size >= factor and size % factor == 0:
+            return f'{size // factor}{suffix}'
+    return str(size)
+
+
+# HTTP client
+
+def request(url, method='GET', body=None, headers=None):
+    """(status, seconds, bytes received, response body) for one request; connection errors count as status 0."""
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    start = time.perf_counter()
+    content = b''
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            content = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        content = e.read()
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start, len(content), content
+
+def json_request(url, payload, headers=None):
+    return request(url, 'POST', json.dumps(payload).encode(), {'Content-Type': 'application/json', **(headers or {})})
+
+def multipart(filename, content):
+    boundary = f'bench{random.getrandbits(64):016x}'
+    body = b''.join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'.encode(),
+        content,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+# Database and server
+
+def seed_database(database_url, users, hash_method):
+    """Migrate the database and add approved bench users (in this process, before the server starts)."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    os.chdir(BACKEND)
+    with contextlib.redirect_stdout(io.StringIO()):
+        from server.app import create_app
+        app = create_app()
+
+    from flask_migrate import upgrade
+    from werkzeug.security import generate_password_hash
+    from server.extensions import db
+    from server.models import User
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        try:
+            upgrade(directory='server/migrations')
+            password_hash = generate_password_hash(PASSWORD, hash_method or app.config['PASSWORD_HASH_METHOD'])
+            db.session.add_all([
+                User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash=password_hash, is_approved=True)
+                for i in range(users)
+            ])
+            db.session.commit()
+        except Exception as e:
+            raise BenchError(f'Seeding the database failed: {e}') from e
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(kind, workers, threads, work, database_url, hash_workers):
+    port = free_port()
+    env = {
+        **os.environ,
+        'PYTHONPATH': BACKEND + os.pathsep + os.environ.get('PYTHONPATH', ''),
+        'DATABASE_URL': database_url,
+        'PASSWORD_HASH_WORKERS': str(hash_workers),
+        'UPLOAD_FOLDER': os.path.join(work, 'uploads'),  # absolute: stored paths are resolved against the app root
+        'METRICS_DIR': os.path.join(work, 'metrics'),
+    }
+    if kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                   '--bind', f'127.0.0.1:{port}', 'server.app:create_app()']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'server.app:create_app()', 'run',
+                   '--port', str(port), '--no-reload', '--no-debugger', '--with-threads']
+
+    # Run from the work directory so uploads and archives stay out of the source tree
+    log = open(os.path.join(work, f'{kind}.log'), 'ab')
+    process = subprocess.Popen(command, cwd=work, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise BenchError(f'{kind} exited with {process.returncode}, see {log.name}')
+        if request(f'{base}/health')[0] == 200:
+            return process, base
+        time.sleep(0.2)
+    stop_server(process)
+    raise BenchError(f'{kind} did not answer /health within 60 seconds, see {log.name}')
+
+def stop_server(process):
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+# Memory
+
+def process_tree(root):
+    """root and its descendants, from /proc (Linux only)."""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            with contextlib.suppress(OSError):
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces; fields resume after its closing parenthesis
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+    tree, frontier = {root}, [root]
+    while frontier:
+        pid = frontier.pop()
+        children = [child for child, parent in parents.items() if parent == pid]
+        tree.update(children)
+        frontier.extend(children)
+    return tree
+
+def rss_bytes(pids):
+    total = 0
+    for pid in pids:
+        with contextlib.suppress(OSError):
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+    return total
+
+class RSSSampler:
+    """Largest total RSS of the server's processes while the scenario runs."""
+
+    def __init__(self, root, interval=0.25):
+        self.root = root
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = rss_bytes(process_tree(self.root))
+            self.peak = max(self.peak or 0, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.isdir('/proc'):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+# Scenarios
+
+class Fixture:
+    """Data created through the API before measuring: tokens, a repository, a file and a share link."""
+
+    def __init__(self, base, users, download_size):
+        self.base = base
+        self.users = users
+        self.tokens = []
+        for i in range(users):
+            status, _, _, content = json_request(f'{base}/api/login', {'username': f'bench{i}', 'password': PASSWORD})
+            if status != 200:
+                raise BenchError(f'Login of bench{i} failed with {status}')
+            self.tokens.append(json.loads(content)['access_token'])
+
+        owner = self.auth(0)
+        for i in range(20):
+            json_request(f'{base}/api/repositories', {'name': f'bench repository {i}'}, owner)
+        status, _, _, content = json_request(f'{base}/api/repositories', {'name': 'bench downloads'}, owner)
+        self.repository_id = json.loads(content)['id']
+
+        body, headers = multipart('download.pdf', os.urandom(download_size))
+        status, _, _, content = request(f'{base}/api/files/repositories/{self.repository_id}/upload', 'POST', body,
+                                        {**owner, **headers})
+        if status != 201:
+            raise BenchError(f'Seeding the download file failed with {status}: {content[:200]!r}')
+        self.file_id = json.loads(content)['id']
+        self.download_size = download_size
+
+        status, _, _, content = json_request(f'{base}/api/repositories/{self.repository_id}/share',
+                                             {'permission': 'view'}, owner)
+        if status != 201:
+            raise BenchError(f'Creating the share link failed with {status}: {content[:200]!r}')
+        self.share_token = json.loads(content)['token']
+
+    def auth(self, client):
+        return {'Authorization': f'Bearer {self.tokens[client % self.users]}'}
+
+
+def login(fixture, client, rng):
+    return json_request(f'{fixture.base}/api/login',
+                        {'username': f'bench{client % fixture.users}', 'password': PASSWORD})
+
+def list_repositories(fixture, client, rng):
+    return request(f'{fixture.base}/api/repositories', headers=fixture.auth(0))
+
+def share_view(fixture, client, rng):
+    return request(f'{fixture.base}/api/share/{fixture.share_token}')
+
+def download_full(fixture, client, rng):
+    return request(f'{fixture.base}/api/files/{fixture.file_id}/download', headers=fixture.auth(0))
+
+def download_range(fixture, client, rng, length=64 * 1024):
+    start = rng.randrange(max(1, fixture.download_size - length))
+    headers = {**fixture.auth(0), 'Range': f'bytes={start}-{start + length - 1}'}
+    return request(f'{fixture.base}/api/files/{fixture.file_id}/download', headers=headers)
+
+def upload(size):
+    block = os.urandom(size)
+
+    def upload_file(fixture, client, rng):
+        # A fresh prefix per request, so content-addressed storage cannot deduplicate it
+        body, headers = multipart('upload.pdf', os.urandom(16) + block[16:])
+        return request(f'{fixture.base}/api/files/repositories/{fixture.repository_id}/upload', 'POST', body,
+                       {**fixture.auth(0), **headers})
+    return upload_file
+
+def mixed(upload_size):
+    small_upload = upload(upload_size)
+    weighted = [(list_repositories, 40), (share_view, 30), (download_full, 10), (download_range, 10),
+                (small_upload, 5), (login, 5)]
+    population = [scenario for scenario, _ in weighted]
+    weights = [weight for _, weight in weighted]
+
+    def mixed_traffic(fixture, client, rng):
+        return rng.choices(population, weights)[0](fixture, client, rng)
+    return mixed_traffic
+
+def build_scenarios(upload_sizes):
+    scenarios = {
+        'login': login,
+        'list_repositories': list_repositories,
+        'share_view': share_view,
+        'download_full': download_full,
+        'download_range': download_range,
+    }
+    for size in upload_sizes:
+        scenarios[f'upload_{format_size(size)}'] = upload(size)
+    scenarios['mixed'] = mixed(min(upload_sizes))
+    return scenarios
+
+
+def run_scenario(name, scenario, fixture, args, server_pid):
+    def client_loop(client, deadline, samples):
+        rng = random.Random(args.seed * 1000 + client)
+        while time.perf_counter() < deadline:
+            samples.append(scenario(fixture, client, rng)[:3])
+
+    def drive(seconds):
+        samples = [[] for _ in range(args.concurrency)]
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=client_loop, args=(i, deadline, samples[i]))
+                   for i in range(args.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [sample for client in samples for sample in client], time.perf_counter() - started
+
+    if args.warmup:
+        drive(args.warmup)
+    with RSSSampler(server_pid) as rss:
+        samples, elapsed = drive(args.duration)
+
+    ok = [seconds for status, seconds, _ in samples if 200 <= status < 300]
+    received = sum(size for status, _, size in samples if 200 <= status < 300)
+    ms = lambda p: round(percentile(ok, p) * 1000, 2) if ok else None
+    return {
+        'scenario': name,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'error_statuses': sorted({status for status, _, _ in samples if not 200 <= status < 300}),
+        'duration': round(elapsed, 2),
+        'throughput': round(len(ok) / elapsed, 2),
+        'received_mb_per_s': round(received / elapsed / SIZES['m'], 2),
+        'p50_ms': ms(50),
+        'p95_ms': ms(95),
+        'p99_ms': ms(99),
+        'peak_rss_mb': round(rss.peak / SIZES['m'], 1) if rss.peak else None,
+    }
+
+
+def git_commit():
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    return None
+
+def run(args):
+    upload_sizes = [parse_size(size) for size in args.upload_sizes.split(',')]
+    scenarios = build_scenarios(upload_sizes)
+    names = list(scenarios) if args.scenarios == 'all' else args.scenarios.split(',')
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (available: {', '.join(scenarios)})")
+
+    results = []
+    failures = []
+    seeded = False
+    for kind in args.server:
+        workers = args.workers if kind == 'gunicorn' else 1
+        # Each server gets a fresh SQLite database; a given database is seeded once and shared
+        work = tempfile.mkdtemp(prefix='bench-')
+        database_url = args.database_url or 'sqlite:///' + os.path.join(work, 'bench.db')
+        process = None
+        failed = False
+        try:
+            if not (args.database_url and seeded):
+                seed_database(database_url, args.users, args.hash_method)
+                seeded = True
+            process, base = start_server(kind, args.workers, args.threads, work, database_url, args.hash_workers)
+            fixture = Fixture(base, args.users, parse_size(args.download_size))
+            for name in names:
+                result = {'server': kind, 'workers': workers,
+                          **run_scenario(name, scenarios[name], fixture, args, process.pid)}
+                print_result(result)
+                results.append(result)
+        except BenchError as e:
+            # The other servers still run, and the results file records why this one has none
+            print(f'{kind:>8} x{workers:<2} failed: {e}', file=sys.stderr, flush=True)
+            failures.append({'server': kind, 'workers': workers, 'error': str(e)})
+            failed = True
+        finally:
+            if process is not None:
+                stop_server(process)
+            # A failed server's log is kept for the error message to point at
+            if not (args.keep or failed):
+                shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': 'postgresql' if args.database_url else 'sqlite',
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'upload_sizes': args.upload_sizes,
+            'download_size': args.download_size,
+            'hash_workers': args.hash_workers,
+            'seed': args.seed,
+        },
+        'results': results,
+        'failures': failures,
+    }
+
+def print_result(result):
+    print(f"{result['server']:>8} x{result['workers']:<2} {result['scenario']:<18} "
+          f"{result['throughput']:>9.1f} req/s  p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  "
+          f"p99 {result['p99_ms']} ms  rss {result['peak_rss_mb']} MB  errors {result['errors']}", flush=True)
+
+
+# Comparing runs
+
+# metric -> True when bigger is better
+COMPARED = {'throughput': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'peak_rss_mb': False}
+
+def compare(baseline, candidate, threshold, min_ms):
+    """Rows of (key, metric, before, after, change, regressed) for scenarios present in both runs."""
+    key = lambda result: (result['server'], result['workers'], result['scenario'])
+    before = {key(result): result for result in baseline['results']}
+    rows = []
+    for result in candidate['results']:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            a, b = old.get(metric), result.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            worse = -change if higher_is_better else change
+            # Sub-millisecond latency moves are noise, whatever their ratio
+            noise = metric.endswith('_ms') and abs(b - a) < min_ms
+            rows.append((key(result), metric, a, b, change, worse > threshold and not noise))
+    return rows
+
+def compare_command(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    rows = compare(baseline, candidate, args.threshold, args.min_ms)
+    if not rows:
+        raise SystemExit('The two runs have no scenario in common')
+
+    print(f"baseline  {baseline['meta'].get('commit')} {baseline['meta'].get('created_at')}")
+    print(f"candidate {candidate['meta'].get('commit')} {candidate['meta'].get('created_at')}")
+    for (server, workers, scenario), metric, a, b, change, regressed in rows:
+        print(f"{server:>8} x{workers:<2} {scenario:<18} {metric:<12} {a:>10} -> {b:<10} "
+              f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(1 for row in rows if row[-1])
+    print(f'{regressions} regression(s) beyond {args.threshold:.0%}')
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run scenarios and report them')
+    run_parser.add_argument('--server', nargs='+', choices=['werkzeug', 'gunicorn'], default=['werkzeug'])
+    run_parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    run_parser.add_argument('--threads', type=int, default=1, help='threads per gunicorn worker')
+    run_parser.add_argument('--database-url', help='an empty Postgres (or other) database; default: a new SQLite file')
+    run_parser.add_argument('--scenarios', default='all', help='comma-separated scenario names, or all')
+    run_parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients')
+    run_parser.add_argument('--duration', type=float, default=10.0, help='measured seconds per scenario')
+    run_parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before each scenario')
+    run_parser.add_argument('--users', type=int, default=20)
+    run_parser.add_argument('--upload-sizes', default='16k,1m,8m', help='one upload scenario per size')
+    run_parser.add_argument('--download-size', default='4m', help='size of the file the download scenarios fetch')
+    run_parser.add_argument('--hash-workers', type=int, default=2, help='PASSWORD_HASH_WORKERS of the server')
+    run_parser.add_argument('--hash-method', help='password hash of the bench users (default: PASSWORD_HASH_METHOD)')
+    run_parser.add_argument('--seed', type=int, default=1, help='seed for the clients\' random choices')
+    run_parser.add_argument('--keep', action='store_true', help='keep the work directory (database, uploads, server log)')
+    run_parser.add_argument('--json', help='also write the results to this file')
+
+    compare_parser = commands.add_parser('compare', help='flag regressions between two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.15, help='relative change counted as a regression')
+    compare_parser.add_argument('--min-ms', type=float, default=1.0, help='latency changes smaller than this are ignored')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        sys.exit(compare_command(args))
+
+    if args.json:
+        args.json = os.path.abspath(args.json)  # seeding changes the working directory
+    result = run(args)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    if result['failures']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Login burst benchmark.
+
+Serves create_app() from a threaded Werkzeug server on a throwaway SQLite
+database, then runs a burst of concurrent logins while a probe requests an
+unrelated endpoint at a steady rate. Reports login throughput and the probe's
+latency percentiles, so hashing inline (--hash-workers 0) can be compared with
+the process pool:
+
+    python bench/login_burst.py --hash-workers 0
+    python bench/login_burst.py --hash-workers 2 --json results/login_pool.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+import io
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def request(url, body=None, headers=None):
+    """(status, seconds, response body) for one request; connection errors count as status 0."""
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json', **(headers or {})})
+    start = time.perf_counter()
+    content = b''
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            content = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start, content
+
+
+def build_app(hash_workers, users):
+    work = tempfile.mkdtemp(prefix='bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(work, 'bench.db')
+    os.environ['PASSWORD_HASH_WORKERS'] = str(hash_workers)
+    os.chdir(BACKEND)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from server.app import create_app
+        app = create_app()
+    app.config['UPLOAD_FOLDER'] = os.path.join(work, 'uploads')
+
+    from flask_migrate import upgrade
+    from werkzeug.security import generate_password_hash
+    from server.extensions import db
+    from server.models import User
+    with app.app_context():
+        upgrade(directory='server/migrations')
+        password_hash = generate_password_hash('bench-password', app.config['PASSWORD_HASH_METHOD'])
+        db.session.add_all([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash=password_hash, is_approved=True)
+            for i in range(users)
+        ])
+        db.session.commit()
+    return app
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def probe(url, headers, interval, stop, latencies):
+    while not stop.is_set():
+        status, seconds, _ = request(url, headers=headers)
+        if status == 200:
+            latencies.append(seconds)
+        time.sleep(interval)
+
+
+def run(args):
+    app = build_app(args.hash_workers, args.users)
+    server, base = serve(app)
+
+    # Silence per-request logging from the dev server
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    # Also starts the hashing pool, so process spawn time is not part of the burst
+    status, _, content = request(f'{base}/api/login', {'username': 'bench0', 'password': 'bench-password'})
+    if status != 200:
+        raise SystemExit(f'Warm-up login failed with {status}')
+    token = json.loads(content)['access_token']
+    auth = {'Authorization': f'Bearer {token}'}
+    probe_url = f'{base}{args.probe_path}'
+
+    def measure_probe(seconds):
+        latencies, stop = [], threading.Event()
+        thread = threading.Thread(target=probe, args=(probe_url, auth, args.probe_interval, stop, latencies))
+        thread.start()
+        time.sleep(seconds)
+        stop.set()
+        thread.join()
+        return latencies
+
+    idle = measure_probe(args.idle_seconds)
+
+    statuses = []
+    statuses_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def login_loop(i):
+        body = {'username': f'bench{i % args.users}', 'password': 'bench-password'}
+        while time.perf_counter() < deadline:
+            status, seconds, _ = request(f'{base}/api/login', body)
+            with statuses_lock:
+                statuses.append((status, seconds))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        started = time.perf_counter()
+        futures = [pool.submit(login_loop, i) for i in range(args.concurrency)]
+        burst = measure_probe(args.duration)
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+
+    server.shutdown()
+
+    ok = [seconds for status, seconds in statuses if status == 200]
+    result = {
+        'hash_workers': args.hash_workers,
+        'concurrency': args.concurrency,
+        'duration': round(elapsed, 2),
+        'logins_ok': len(ok),
+        'logins_rejected': sum(1 for status, _ in statuses if status == 503),
+        'logins_failed': sum(1 for status, _ in statuses if status not in (200, 503)),
+        'login_throughput': round(len(ok) / elapsed, 2),
+        'login_p50_ms': round(percentile(ok, 50) * 1000, 1) if ok else None,
+        'login_p99_ms': round(percentile(ok, 99) * 1000, 1) if ok else None,
+        'probe_path': args.probe_path,
+        'probe_idle_p50_ms': round(percentile(idle, 50) * 1000, 1) if idle else None,
+        'probe_idle_p99_ms': round(percentile(idle, 99) * 1000, 1) if idle else None,
+        'probe_burst_p50_ms': round(percentile(burst, 50) * 1000, 1) if burst else None,
+        'probe_burst_p99_ms': round(percentile(burst, 99) * 1000, 1) if burst else None,
+        'probe_samples': len(burst),
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--hash-workers', type=int, default=2, help='PASSWORD_HASH_WORKERS (0 hashes inline)')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent login clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of login burst')
+    parser.add_argument('--idle-seconds', type=float, default=3.0, help='seconds of probing before the burst')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--probe-path', default='/api/repositories')
+    parser.add_argument('--probe-interval', type=float, default=0.02, help='seconds between probe requests')
+    parser.add_argument('--json', help='also write the result to this file')
+    args = parser.parse_args()
+
+    result = run(args)
+    for key, value in result.items():
+        print(f'{key:>20}: {value}')
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
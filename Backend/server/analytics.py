@@ -0,0 +1,139 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from server.extensions import db
+from server.models import DownloadLog, LinkAccessLog, ShareLink
+from server.retention import read_archive
+
+INTERVALS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+# Window used when the client does not pass start
+DEFAULT_WINDOWS = {
+    'minute': timedelta(hours=1),
+    'hour': timedelta(days=2),
+    'day': timedelta(days=30),
+}
+
+SQLITE_BUCKET_FORMATS = {
+    'minute': '%Y-%m-%d %H:%M:00',
+    'hour': '%Y-%m-%d %H:00:00',
+    'day': '%Y-%m-%d 00:00:00',
+}
+
+# metric -> (log model, timestamp column, {scope: column the scope id is matched against})
+METRICS = {
+    'downloads': (DownloadLog, DownloadLog.downloaded_at, {
+        'repository': DownloadLog.repository_id,
+        'file': DownloadLog.file_id,
+        'share_link': DownloadLog.share_link_id,
+    }),
+    'views': (LinkAccessLog, LinkAccessLog.accessed_at, {
+        'share_link': LinkAccessLog.share_link_id,
+        'repository': LinkAccessLog.share_link_id,  # through the repository's share links
+    }),
+}
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def truncate(moment, interval):
+    if interval == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+def parse_time(value):
+    """ISO 8601 timestamp as naive UTC, like the stored columns."""
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise AnalyticsError(f"Invalid timestamp '{value}'")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def bucket_column(column, interval):
+    """SQL expression truncating column to the start of its bucket."""
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime(SQLITE_BUCKET_FORMATS[interval], column)
+    return func.date_trunc(interval, column)
+
+def window(interval, start=None, end=None, max_buckets=1000):
+    """Resolve the [start, end) window, aligned to whole buckets and capped at max_buckets."""
+    if interval not in INTERVALS:
+        raise AnalyticsError(f"interval must be one of: {', '.join(INTERVALS)}")
+    end = parse_time(end) if end else datetime.utcnow()
+    start = parse_time(start) if start else end - DEFAULT_WINDOWS[interval]
+    start = truncate(start, interval)
+    if end <= start:
+        raise AnalyticsError('end must be after start')
+    buckets = -(-(end - start) // INTERVALS[interval])
+    if buckets > max_buckets:
+        raise AnalyticsError(f'The window spans {buckets} {interval}s; at most {max_buckets} are returned')
+    return start, end
+
+def series_query(metric, scope, scope_id, interval, start, end):
+    """(bucket, count) rows for one entity, grouped in SQL over an indexed range of the log."""
+    if metric not in METRICS:
+        raise AnalyticsError(f"metric must be one of: {', '.join(METRICS)}")
+    model, timestamp, scopes = METRICS[metric]
+    if scope not in scopes:
+        raise AnalyticsError(f"{metric} can be scoped to: {', '.join(scopes)}")
+
+    if metric == 'views' and scope == 'repository':
+        match = scopes[scope].in_(db.select(ShareLink.id).where(ShareLink.repository_id == scope_id))
+    else:
+        match = scopes[scope] == scope_id
+
+    bucket = bucket_column(timestamp, interval).label('bucket')
+    return (
+        db.session.query(bucket, func.count().label('count'))
+        .select_from(model)
+        .filter(match, timestamp >= start, timestamp < end)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+
+def archived_counts(metric, scope, scope_id, interval, start, end):
+    """Bucketed counts from the archived log segments that overlap the window."""
+    model, timestamp, scopes = METRICS[metric]
+    key = scopes[scope].key
+    if metric == 'views' and scope == 'repository':
+        wanted = set(db.session.scalars(db.select(ShareLink.id).where(ShareLink.repository_id == scope_id)))
+    else:
+        wanted = {scope_id}
+
+    counts = Counter()
+    for row in read_archive(model.__tablename__, start, end):
+        moment = row[timestamp.key]
+        if row[key] in wanted and moment is not None and start <= moment < end:
+            counts[truncate(moment, interval)] += 1
+    return counts
+
+def series(metric, scope, scope_id, interval, start, end):
+    """Every bucket in the window with its count, zeros included.
+
+    Rows still in the database are bucketed in SQL; rows already moved to
+    archive segments are added from the segments of the days in the window.
+    """
+    query = series_query(metric, scope, scope_id, interval, start, end)
+    counts = archived_counts(metric, scope, scope_id, interval, start, end)
+    for bucket, count in query:
+        if isinstance(bucket, str):
+            bucket = datetime.fromisoformat(bucket)
+        counts[bucket] += count
+
+    points = []
+    step = INTERVALS[interval]
+    moment = start
+    while moment < end:
+        points.append({'bucket': moment.isoformat(), 'count': counts.get(moment, 0)})
+        moment += step
+    return points
@@ -1,7 +1,20 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import os
+import hmac
+import logging
 from server.extensions import db, jwt, migrate  # ✅ Remove 'server.'
+from server.writebehind import log_writer, view_counter
+from server.logs import app_logging
+from server.pagination import PaginationError
+from server import cache, authz, metrics  # authz registers the token revocation check
+from server.thumbnails import thumbnail_worker
+from server.passwords import password_hasher, HashingBusy
+from server.rollups import download_rollups, rebuild_download_rollups_command
+from server.retention import retention_worker, archive_logs_command
+from server.tombstones import repository_purger, purge_deleted_repositories_command
+from server.uploads import upload_sweeper, expire_uploads_command
+from server.profiler import sql_profiler
 
 def create_app():
     app = Flask(__name__)
@@ -17,10 +30,85 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', '05585a1f70015b1773f1c60670d8093cccc22599e47c73133a09795e4f61d1cf')
-    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
+    app.config['MAX_UPLOAD_SIZE'] = 1024 * 1024 * 1024  # total size for chunked uploads
+    app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # suggested chunk size for clients
+    app.config['UPLOAD_BATCH_MAX_FILES'] = 500  # parts per batch request, still within MAX_CONTENT_LENGTH
+    app.config['UPLOAD_BATCH_WORKERS'] = 4  # threads copying batch parts to disk, per process
+    app.config['UPLOAD_SESSION_TTL'] = int(os.environ.get('UPLOAD_SESSION_TTL', '86400'))  # idle seconds before a chunked upload expires
+    app.config['UPLOAD_SWEEP_INTERVAL'] = 3600.0  # seconds
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi', 'pdf', 'doc', 'docx'}
     
+    # Download / share-view logs are buffered and written in bulk off the request path
+    app.config['LOG_WRITE_BEHIND'] = os.environ.get('LOG_WRITE_BEHIND', '1') != '0'
+    app.config['LOG_BATCH_SIZE'] = 500
+    app.config['LOG_FLUSH_INTERVAL'] = 1.0  # seconds
+    app.config['LOG_QUEUE_SIZE'] = 50000
+    app.config['VIEW_COUNT_FLUSH_INTERVAL'] = 5.0  # seconds
+    
+    # List endpoints are paged with opaque keyset cursors once the client sends limit or cursor
+    app.config['DEFAULT_PAGE_SIZE'] = 100  # cursor without limit, and search results
+    app.config['MAX_PAGE_SIZE'] = 500
+    
+    # Serialized shared views per process; share links themselves are checked against the database on every request
+    app.config['SHARE_PAYLOAD_CACHE_SIZE'] = 2000
+    app.config['SHARE_PAYLOAD_CACHE_TTL'] = 30  # seconds
+    
+    # Role and approval of signed-in users; approval and role changes reach other workers within the TTL
+    app.config['USER_CACHE_SIZE'] = 10000
+    app.config['USER_CACHE_TTL'] = 30  # seconds
+    
+    # Admin download statistics are read from rollups caught up in the background
+    app.config['ROLLUP_INTERVAL'] = 60.0  # seconds
+    app.config['ROLLUP_BATCH_SIZE'] = 5000
+    app.config['ROLLUP_SETTLE_SECONDS'] = 30  # newer log rows wait for the next run
+    app.config['ROLLUP_GAP_SECONDS'] = 3600  # how long a skipped log id is watched for a late commit
+    
+    app.config['ANALYTICS_MAX_BUCKETS'] = 1000  # points per time series response
+    
+    # Opt-in: log rows older than LOG_RETENTION_DAYS move to gzip-CSV segments under LOG_ARCHIVE_FOLDER (0 keeps them)
+    app.config['LOG_RETENTION_DAYS'] = int(os.environ.get('LOG_RETENTION_DAYS', '0'))
+    app.config['LOG_ARCHIVE_FOLDER'] = os.path.abspath(
+        os.environ.get('LOG_ARCHIVE_FOLDER', os.path.join(app.instance_path, 'log_archive')))
+    app.config['LOG_ARCHIVE_INTERVAL'] = 3600.0  # seconds
+    app.config['LOG_ARCHIVE_BATCH_SIZE'] = 5000
+    
+    # Deleted repositories are hidden at once and purged in the background
+    app.config['PURGE_INTERVAL'] = 300.0  # seconds; a deletion wakes the purger sooner
+    app.config['PURGE_BATCH_SIZE'] = 1000  # rows per transaction
+    
+    # Password hashes are computed on a process pool; excess logins get 503 instead of queueing
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'  # as stored; older hashes are upgraded at login
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))  # per process, 0 hashes inline
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 64  # queued or running hashes per process
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10.0  # seconds a request waits for its hash
+    
+    # Thumbnails (bounding box per size) rendered by a background pool
+    app.config['THUMBNAIL_SIZES'] = {'small': (200, 200), 'preview': (1024, 1024)}
+    app.config['THUMBNAIL_WORKERS'] = 2
+    app.config['THUMBNAIL_QUEUE_SIZE'] = 1000
+    app.config['THUMBNAIL_MAX_AGE'] = 86400  # seconds
+    app.config['THUMBNAIL_RETRY_AFTER'] = 3600  # seconds before a failed rendition is rendered again on request
+    
+    # Application logs: JSON lines written by a background thread; records below a logger's level cost nothing
+    app.config['APP_LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['APP_LOG_LEVELS'] = {'werkzeug': 'WARNING', 'alembic': 'INFO'}  # per logger
+    app.config['APP_LOG_SAMPLING'] = {'server.access': float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '1.0'))}  # below WARNING
+    app.config['APP_LOG_QUEUE_SIZE'] = 10000  # records waiting to be written; more are dropped
+    
+    # Prometheus metrics at /metrics, added up over all worker processes through files in METRICS_DIR
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    app.config['METRICS_FLUSH_INTERVAL'] = 5.0  # seconds other workers' numbers may lag behind
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # bearer token required to scrape, if set
+    
+    # SQL statements slower than this are logged (0 disables); SQL_PROFILE=1 adds per-request X-SQL-* headers
+    app.config['SLOW_QUERY_SECONDS'] = float(os.environ.get('SLOW_QUERY_SECONDS', '0.5'))
+    app.config['SLOW_QUERY_LOG_PARAMETERS'] = False  # bound values may hold tokens or password hashes
+    app.config['SQL_PROFILE'] = os.environ.get('SQL_PROFILE', '0') == '1'  # development only
+    app.config['SQL_PROFILE_REPEAT_THRESHOLD'] = 5  # same statement this often in one request: possible N+1
+    app.config['SQL_PROFILE_SLOWEST'] = 5  # statements kept per profile
+    
     # CORS - Allow your frontend URL
     frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
     CORS(app, resources={
@@ -34,18 +122,38 @@ def create_app():
                 "https://chuna-intranet.vercel.app"
             ],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Content-Range", "Range",
+                              "If-None-Match", "If-Modified-Since", "If-Range", "X-Request-ID"],
+            "expose_headers": ["Content-Disposition", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified",
+                               "X-Next-Cursor", "Link", "X-Request-ID"],
             "supports_credentials": True
         }
     })
     
     # Initialize extensions
+    app_logging.init_app(app)
     db.init_app(app)
     jwt.init_app(app)
 
     
 
     migrate.init_app(app, db)
+    log_writer.init_app(app)
+    view_counter.init_app(app)
+    cache.init_app(app)
+    thumbnail_worker.init_app(app)
+    password_hasher.init_app(app)
+    download_rollups.init_app(app)
+    retention_worker.init_app(app)
+    repository_purger.init_app(app)
+    upload_sweeper.init_app(app)
+    metrics.init_app(app)
+    sql_profiler.init_app(app)
+    
+    app.cli.add_command(rebuild_download_rollups_command)
+    app.cli.add_command(archive_logs_command)
+    app.cli.add_command(purge_deleted_repositories_command)
+    app.cli.add_command(expire_uploads_command)
     
     # Create upload folder
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -65,7 +173,23 @@ def create_app():
     
     @app.route('/health')
     def health():
-        return jsonify({'status': 'healthy'})
+        return jsonify({'status': 'healthy', 'password_hashing': password_hasher.stats(), 'logging': app_logging.stats()})
+    
+    # Prometheus scrape endpoint
+    @app.route('/metrics')
+    def prometheus_metrics():
+        token = app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+    
+    @app.errorhandler(PaginationError)
+    def pagination_error(e):
+        return jsonify({'error': str(e)}), 400
+    
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        return jsonify({'error': 'Too many password checks in progress, please retry shortly'}), 503, {'Retry-After': '1'}
     
     # Register API blueprints - ✅ Remove 'server.' prefix
     from server.routes.auth import auth_bp
@@ -73,19 +197,20 @@ def create_app():
     from server.routes.files import files_bp
     from server.routes.share import share_bp
     from server.routes.admin_routes import admin_bp
+    from server.routes.search import search_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(repositories_bp, url_prefix='/api/repositories')
     app.register_blueprint(files_bp, url_prefix='/api/files')
     app.register_blueprint(share_bp, url_prefix='/api/share')
     app.register_blueprint(admin_bp)
+    app.register_blueprint(search_bp, url_prefix='/api/search')
     
     # Log registered routes
-    print("=" * 50)
-    print("Registered Routes:")
-    for rule in app.url_map.iter_rules():
-        print(f"  {rule.endpoint}: {rule.rule} [{', '.join(rule.methods - {'HEAD', 'OPTIONS'})}]")
-    print("=" * 50)
+    log = logging.getLogger(__name__)
+    if log.isEnabledFor(logging.DEBUG):
+        for rule in app.url_map.iter_rules():
+            log.debug('Route %s: %s [%s]', rule.endpoint, rule.rule, ', '.join(rule.methods - {'HEAD', 'OPTIONS'}))
     
     return app
 
@@ -0,0 +1,101 @@
+import os
+import zipfile
+from collections import namedtuple
+from flask import Response, request
+from werkzeug.utils import secure_filename
+from server import storage
+from server.models import DownloadLog
+from server.writebehind import log_writer
+from server.storage import COPY_BUFFER_SIZE
+
+# Already-compressed formats are stored as-is; deflating them costs CPU for no gain
+STORED_TYPES = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi', 'docx', 'zip'}
+
+# One file of the archive, resolved before streaming starts
+ArchiveEntry = namedtuple('ArchiveEntry', ['file_id', 'name', 'path', 'compress_type', 'date_time'])
+
+
+class _ChunkSink:
+    """Write-only file object that collects what zipfile writes until it is drained.
+
+    It has no tell() or seek(), so zipfile writes data descriptors after each
+    member instead of seeking back to patch headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _unique_name(name, used):
+    base, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        candidate = f'{base} ({n}){ext}'
+        n += 1
+    used.add(candidate)
+    return candidate
+
+def archive_entries(files):
+    """Build the entries for files, skipping any whose content is missing on disk."""
+    entries = []
+    used = set()
+    for f in files:
+        path = storage.absolute_path(f.file_path)
+        if not os.path.exists(path):
+            continue
+        name = _unique_name(secure_filename(f.original_filename) or f.filename, used)
+        compress_type = zipfile.ZIP_STORED if (f.file_type or '').lower() in STORED_TYPES else zipfile.ZIP_DEFLATED
+        date_time = f.created_at.timetuple()[:6] if f.created_at else (1980, 1, 1, 0, 0, 0)
+        entries.append(ArchiveEntry(f.id, name, path, compress_type, date_time))
+    return entries
+
+def generate_zip(entries):
+    """Yield the ZIP archive of entries chunk by chunk, holding one buffer at a time."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode='w', allowZip64=True) as zf:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry.name, date_time=entry.date_time)
+            info.compress_type = entry.compress_type
+            with open(entry.path, 'rb') as src, zf.open(info, mode='w', force_zip64=True) as dest:
+                for block in iter(lambda: src.read(COPY_BUFFER_SIZE), b''):
+                    dest.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            # Data descriptor for the member just closed
+            yield sink.drain()
+    # Central directory, written when the ZipFile closes
+    yield sink.drain()
+
+def log_export(entries, repository_id, share_link_id=None):
+    """Record the export as one batch of download rows, one per file in the archive."""
+    log_writer.add_many(DownloadLog, [{
+        'file_id': entry.file_id,
+        'share_link_id': share_link_id,
+        'repository_id': repository_id,
+        'ip_address': request.remote_addr
+    } for entry in entries])
+
+def zip_response(entries, download_name):
+    """Stream entries as a ZIP download.
+
+    The archive is built on the fly, so its length is unknown up front and
+    Range requests are not honoured (Accept-Ranges: none).
+    """
+    response = Response(generate_zip(entries), mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(download_name) or "archive"}.zip"'
+    response.headers['Accept-Ranges'] = 'none'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,28 @@
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from server.extensions import jwt
+from server.cache import resolve_user
+
+# The role travels in the access token, so admin checks for regular users
+# never read the user row. Claims are only trusted to refuse: anything granted
+# is confirmed against a UserSnapshot that is at most USER_CACHE_TTL seconds old.
+# Tokens are only issued to approved users, so approval is not a claim.
+
+def token_claims(user):
+    return {'role': user.role}
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_payload):
+    # Deleted or unapproved users lose access within the cache TTL, not at token expiry
+    user = resolve_user(jwt_payload['sub'])
+    return user is None or not user.is_approved
+
+def current_user():
+    """UserSnapshot of the signed-in user."""
+    return resolve_user(get_jwt_identity())
+
+def is_super_admin():
+    # A token issued to a regular user is refused without a lookup
+    if get_jwt().get('role', 'super_admin') != 'super_admin':
+        return False
+    user = current_user()
+    return user is not None and user.role == 'super_admin'
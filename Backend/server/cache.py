@@ -0,0 +1,135 @@
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import update
+from server.extensions import db
+from server.models import Repository, User
+from server import queries
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    Each process has its own copy; explicit invalidation only reaches the
+    process that performs it, the TTL bounds how stale other workers can be.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize, ttl):
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose value matches predicate."""
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+# Immutable view of the fields needed to authorize a share-link request
+ShareLinkSnapshot = namedtuple('ShareLinkSnapshot', ['id', 'repository_id', 'permission', 'is_active', 'expires_at',
+                                                     'content_version'])
+
+def resolve_share_link(token):
+    """Return the ShareLinkSnapshot for token, or None if no such link exists or its repository is deleted.
+
+    Read from the database on every request in a single statement, so a link
+    revoked or expired on one worker is refused by all of them at once.
+    """
+    row = db.session.execute(queries.share_link_by_token(token)).first()
+    return ShareLinkSnapshot(*row) if row is not None else None
+
+# Immutable view of the fields needed to authorize a signed-in user
+UserSnapshot = namedtuple('UserSnapshot', ['id', 'role', 'is_approved'])
+
+user_cache = TTLCache()
+
+def resolve_user(user_id):
+    """Return the UserSnapshot for user_id, or None if no such user exists."""
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user.id, user.role, bool(user.is_approved))
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
+def invalidate_user(user_id):
+    user_cache.invalidate(user_id)
+
+# Serialized shared-repository responses, valid while the repository's content_version is unchanged
+# (resolve_share_link reads it with the link)
+CachedPayload = namedtuple('CachedPayload', ['repository_id', 'generation', 'body', 'etag'])
+
+payload_cache = TTLCache()
+
+def bump_repository(repo_id):
+    """Mark a repository's shared payload as changed (a file was added or it was deleted).
+
+    The version lives on the row so every worker sees it; call this before
+    committing the change it belongs to.
+    """
+    db.session.execute(
+        update(Repository).where(Repository.id == repo_id)
+        .values(content_version=Repository.content_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    payload_cache.invalidate_where(lambda payload: payload.repository_id == repo_id)
+
+def init_app(app):
+    payload_cache.configure(app.config['SHARE_PAYLOAD_CACHE_SIZE'], app.config['SHARE_PAYLOAD_CACHE_TTL'])
+    user_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
@@ -0,0 +1,167 @@
+import os
+import sys
+import atexit
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+
+# Application logging. Records are put on a bounded in-memory queue by the
+# request thread and formatted as JSON lines and written by a background
+# thread, so a slow stdout never shows up in request latency. Use lazy
+# %-style arguments: a record below its logger's level is never built.
+
+access_log = logging.getLogger('server.access')
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request id and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random fraction of a logger's records below WARNING."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class RequestQueueHandler(QueueHandler):
+    """Enqueues records without formatting them; drops (and counts) records when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Request details are only available on the request thread
+        if has_request_context() and 'request_id' in g:
+            record.request_id = g.request_id
+        if record.exc_info:
+            # Tracebacks hold frames that may change once the request moves on
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AppLogging:
+    """Installs the queue handler on the root logger and runs its writer thread in every process."""
+
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+        self._lock = threading.Lock()
+        self._sampled = []
+        os.register_at_fork(after_in_child=self._restart)
+        atexit.register(self._stop)  # write out what is still queued
+
+    def init_app(self, app):
+        config = app.config
+        with self._lock:
+            self._stop()
+            log_queue = queue.Queue(maxsize=config['APP_LOG_QUEUE_SIZE'])
+            output = logging.StreamHandler(sys.stdout)
+            output.setFormatter(JsonFormatter())
+            self.handler = RequestQueueHandler(log_queue)
+            self.listener = QueueListener(log_queue, output, respect_handler_level=False)
+
+            root = logging.getLogger()
+            for handler in [h for h in root.handlers if isinstance(h, RequestQueueHandler)]:
+                root.removeHandler(handler)
+            root.addHandler(self.handler)
+            root.setLevel(config['APP_LOG_LEVEL'])
+            for name, level in config['APP_LOG_LEVELS'].items():
+                logging.getLogger(name).setLevel(level)
+
+            for logger, sampler in self._sampled:
+                logger.removeFilter(sampler)
+            self._sampled = []
+            for name, rate in config['APP_LOG_SAMPLING'].items():
+                if rate < 1.0:
+                    logger = logging.getLogger(name)
+                    sampler = SamplingFilter(rate)
+                    logger.addFilter(sampler)
+                    self._sampled.append((logger, sampler))
+
+            self.listener.start()
+
+        app.before_request(start_request)
+        app.after_request(log_request)
+
+    def _stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def _restart(self):
+        # The writer thread does not survive fork, and the queue's locks may have been
+        # held by it at that moment: give the child a fresh queue and thread
+        self._lock = threading.Lock()
+        if self.listener is not None and self.listener._thread is not None:
+            log_queue = queue.Queue(maxsize=self.handler.queue.maxsize)
+            self.handler.queue = self.listener.queue = log_queue
+            self.listener._thread = None
+            self.listener.start()
+
+    def stats(self):
+        return {
+            'queued': self.handler.queue.qsize() if self.handler else 0,
+            'dropped': self.handler.dropped if self.handler else 0,
+        }
+
+
+def start_request():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+def log_request(response):
+    if 'request_id' not in g:
+        return response
+    response.headers['X-Request-ID'] = g.request_id
+    if access_log.isEnabledFor(logging.INFO):
+        access_log.info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+            'bytes': response.content_length,
+            'remote_addr': request.remote_addr,
+        })
+    return response
+
+
+app_logging = AppLogging()
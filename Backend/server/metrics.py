@@ -0,0 +1,437 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+from flask import g, request
+from sqlalchemy import event
+from server.extensions import db
+from server.writebehind import BackgroundFlusher, log_writer
+from server.cache import payload_cache, user_cache
+from server.passwords import password_hasher
+from server.logs import app_logging
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: each process reports only its own numbers
+    fcntl = None
+
+# Prometheus metrics. Every process counts in memory and writes its samples to
+# its own file under METRICS_DIR; /metrics adds up the files of all gunicorn
+# workers. Files of exited workers are folded into merged.json, so counters
+# keep growing across worker restarts while gauges only count live processes.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+MERGED_FILE = 'merged.json'
+LOCK_FILE = '.lock'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        registry.metrics[name] = self
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.registry.add(self.name, labels, amount)
+
+    def set_total(self, *labels, value):
+        """For totals another component already keeps per process."""
+        self.registry.set(self.name, labels, value)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        self.registry.add(self.name, labels, amount)
+
+    def dec(self, *labels, amount=1):
+        self.registry.add(self.name, labels, -amount)
+
+    def set(self, *labels, value):
+        self.registry.set(self.name, labels, value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        self.registry.observe(self.name, labels, bisect.bisect_left(self.buckets, value), len(self.buckets), value)
+
+
+class MetricsRegistry:
+    """Metric values of this process, and the file store that adds up all processes."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []  # called before every snapshot to copy in stats kept elsewhere
+        self.directory = None
+        self._values = {}
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex
+        self._written_pid = None
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked worker starts from zero; the parent's numbers stay in the parent's file
+        self._values = {}
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex
+        self._written_pid = None
+
+    def add(self, name, labels, amount):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self._values[(name, labels)] = value
+
+    def observe(self, name, labels, index, size, value):
+        key = (name, labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus the overflow bucket, then the sum
+                counts = self._values[key] = [0] * (size + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        for collect in self.collectors:
+            collect()
+        with self._lock:
+            return [[name, list(labels), value[:] if isinstance(value, list) else value]
+                    for (name, labels), value in self._values.items()]
+
+    # File store
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _locked(self):
+        handle = open(self._path(LOCK_FILE), 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, name, content):
+        temp = self._path(f'{name}.{os.getpid()}.tmp')
+        with open(temp, 'w') as f:
+            json.dump(content, f)
+        os.replace(temp, self._path(name))
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _fold(self, names):
+        """Add the counters and histograms of exited processes' files to merged.json."""
+        merged = self._read(self._path(MERGED_FILE)) or {'samples': []}
+        totals = self._accumulate({}, merged['samples'], gauges=False)
+        for name in names:
+            content = self._read(self._path(name))
+            if content is not None:
+                self._accumulate(totals, content['samples'], gauges=False)
+        self._write_json(MERGED_FILE, {'samples': [[n, list(l), v] for (n, l), v in totals.items()]})
+        for name in names:
+            os.remove(self._path(name))
+
+    def write(self):
+        """Write this process's samples to its file in the store."""
+        if self.directory is None or fcntl is None:
+            return
+        samples = self.snapshot()
+        name = f'{os.getpid()}.json'
+        if self._written_pid != os.getpid():
+            # A file left by an earlier process with the same pid is folded in, not overwritten
+            os.makedirs(self.directory, exist_ok=True)
+            with self._locked():
+                content = self._read(self._path(name))
+                if content is not None and content.get('token') != self._token:
+                    self._fold([name])
+            self._written_pid = os.getpid()
+        self._write_json(name, {'pid': os.getpid(), 'token': self._token, 'samples': samples})
+
+    def collect(self):
+        """Samples of every process: live files, merged.json, and this process as it is now."""
+        own = self.snapshot()
+        if self.directory is None or fcntl is None or not os.path.isdir(self.directory):
+            return self._accumulate({}, own, gauges=True)
+
+        with self._locked():
+            live, exited = [], []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or name == MERGED_FILE:
+                    continue
+                pid = int(name[:-5]) if name[:-5].isdigit() else None
+                if pid == os.getpid():
+                    continue
+                (live if pid is not None and self._alive(pid) else exited).append(name)
+            if exited:
+                self._fold(exited)
+
+            merged = self._read(self._path(MERGED_FILE))
+            totals = self._accumulate({}, merged['samples'] if merged else [], gauges=False)
+            for name in live:
+                content = self._read(self._path(name))
+                if content is not None:
+                    self._accumulate(totals, content['samples'], gauges=True)
+        return self._accumulate(totals, own, gauges=True)
+
+    def _accumulate(self, totals, samples, gauges):
+        for name, labels, value in samples:
+            metric = self.metrics.get(name)
+            if metric is None or len(labels) != len(metric.labels) or (metric.kind == 'gauge' and not gauges):
+                continue  # from another version of the code, or a gauge of an exited process
+            key = (name, tuple(labels))
+            if metric.kind == 'histogram':
+                if len(value) != len(metric.buckets) + 2:
+                    continue  # written with other buckets
+                current = totals.get(key)
+                totals[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        by_metric = {}
+        for (name, labels), value in sorted(self.collect().items()):
+            by_metric.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for labels, value in by_metric.get(metric.name, []):
+                pairs = list(zip(metric.labels, labels))
+                if metric.kind != 'histogram':
+                    lines.append(f'{metric.name}{_labels(pairs)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value):
+                    cumulative += count
+                    lines.append(f'{metric.name}_bucket{_labels(pairs + [("le", _number(bound))])} {cumulative}')
+                lines.append(f'{metric.name}_sum{_labels(pairs)} {_number(value[-1])}')
+                lines.append(f'{metric.name}_count{_labels(pairs)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+# HTTP
+requests_total = Counter(registry, 'http_requests_total', 'Requests handled.',
+                         ('blueprint', 'endpoint', 'method', 'status'))
+request_duration = Histogram(registry, 'http_request_duration_seconds',
+                             'Time until the response was returned to the server (streamed bodies not included).',
+                             ('blueprint', 'endpoint'))
+requests_in_flight = Gauge(registry, 'http_requests_in_flight', 'Requests being handled.', ('blueprint', 'endpoint'))
+request_bytes = Counter(registry, 'http_request_bytes_total', 'Request body bytes received (uploads).',
+                        ('blueprint', 'endpoint'))
+response_bytes = Counter(registry, 'http_response_bytes_total', 'Response body bytes sent (downloads).',
+                         ('blueprint', 'endpoint'))
+
+# Database
+db_queries = Counter(registry, 'db_queries_total', 'SQL statements executed.', ('operation',))
+db_query_seconds = Counter(registry, 'db_query_seconds_total', 'Time spent executing SQL statements.', ('operation',))
+pool_wait = Histogram(registry, 'db_pool_checkout_wait_seconds',
+                      'Time to get a connection from the pool, including opening a new one.', buckets=WAIT_BUCKETS)
+pool_connections = Counter(registry, 'db_pool_connections_opened_total', 'New database connections opened.')
+pool_checked_out = Gauge(registry, 'db_pool_checked_out', 'Connections currently checked out of the pool.')
+
+# Caches; hit ratio = rate(hits) / (rate(hits) + rate(misses))
+cache_hits = Counter(registry, 'cache_hits_total', 'Cache lookups answered from the cache.', ('cache',))
+cache_misses = Counter(registry, 'cache_misses_total', 'Cache lookups that went to the database.', ('cache',))
+cache_evictions = Counter(registry, 'cache_evictions_total', 'Entries evicted to stay within the size limit.', ('cache',))
+cache_entries = Gauge(registry, 'cache_entries', 'Entries currently cached.', ('cache',))
+
+# Background work
+password_hashes = Counter(registry, 'password_hashes_total', 'Password hash jobs by outcome.', ('outcome',))
+password_hashes_in_flight = Gauge(registry, 'password_hashes_in_flight', 'Password hash jobs queued or running.')
+log_rows = Counter(registry, 'access_log_rows_total', 'Download and view log rows by outcome.', ('outcome',))
+log_rows_pending = Gauge(registry, 'access_log_rows_pending', 'Log rows waiting to be written.')
+log_records_dropped = Counter(registry, 'app_log_records_dropped_total', 'Application log records dropped on a full queue.')
+
+CACHES = {'share_payload': payload_cache, 'user': user_cache}
+
+
+def _collect_stats():
+    for name, cache in CACHES.items():
+        stats = cache.stats()
+        cache_hits.set_total(name, value=stats['hits'])
+        cache_misses.set_total(name, value=stats['misses'])
+        cache_evictions.set_total(name, value=stats['evictions'])
+        cache_entries.set(name, value=stats['size'])
+
+    stats = password_hasher.stats()
+    for outcome in ('completed', 'rejected', 'timed_out'):
+        password_hashes.set_total(outcome, value=stats[outcome])
+    password_hashes_in_flight.set(value=stats['in_flight'])
+
+    stats = log_writer.stats()
+    for outcome in ('written', 'dropped', 'failed'):
+        log_rows.set_total(outcome, value=stats[outcome])
+    log_rows_pending.set(value=stats['pending'])
+    log_records_dropped.set_total(value=app_logging.stats()['dropped'])
+
+registry.collectors.append(_collect_stats)
+
+
+def _request_labels():
+    return request.blueprint or 'app', request.endpoint or 'unmatched'
+
+def start_request():
+    g.metrics_labels = _request_labels()
+    g.metrics_started = time.perf_counter()
+    requests_in_flight.inc(*g.metrics_labels)
+
+def record_response(response):
+    if 'metrics_labels' not in g:
+        return response
+    labels = g.metrics_labels
+    requests_total.inc(*labels, request.method, response.status_code)
+    request_duration.observe(*labels, value=time.perf_counter() - g.metrics_started)
+    if request.content_length:
+        request_bytes.inc(*labels, amount=request.content_length)
+
+    if response.content_length is not None:
+        if request.method != 'HEAD':
+            response_bytes.inc(*labels, amount=response.content_length)
+    elif response.is_streamed:
+        # Streamed archives: count the bytes as they are sent
+        response.response = _count_sent(response.response, labels)
+    return response
+
+def end_request(exc):
+    if 'metrics_labels' in g:
+        requests_in_flight.dec(*g.metrics_labels)
+
+def _count_sent(body, labels):
+    sent = 0
+    try:
+        for chunk in body:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        response_bytes.inc(*labels, amount=sent)
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def _operation(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'other'
+
+def _instrument_pool(pool):
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pool_wait.observe(value=time.perf_counter() - started)
+
+    # Engine.raw_connection() calls pool.connect(); the pool has no event before the wait
+    pool.connect = timed_connect
+
+def instrument_engine(engine):
+    _instrument_pool(engine.pool)
+
+    @event.listens_for(engine, 'engine_disposed')
+    def engine_disposed(engine):
+        _instrument_pool(engine.pool)  # dispose() replaced the pool
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = _operation(statement)
+        db_queries.inc(operation)
+        db_query_seconds.inc(operation, amount=time.perf_counter() - context.metrics_started)
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        pool_connections.inc()
+
+
+_engines = []
+
+def _collect_pools():
+    pool_checked_out.set(value=sum(engine.pool.checkedout() for engine in _engines
+                                   if hasattr(engine.pool, 'checkedout')))
+
+registry.collectors.append(_collect_pools)
+
+
+class MetricsWriter(BackgroundFlusher):
+    """Writes this process's samples to the store every METRICS_FLUSH_INTERVAL seconds and at exit."""
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.before_request(self.ensure_started)
+
+    def configure(self, config):
+        self.interval = config['METRICS_FLUSH_INTERVAL']
+        registry.directory = config['METRICS_DIR']
+
+    def flush(self):
+        registry.write()
+
+
+metrics_writer = MetricsWriter()
+
+def init_app(app):
+    metrics_writer.init_app(app)
+    app.before_request(start_request)
+    app.after_request(record_response)
+    app.teardown_request(end_request)
+    with app.app_context():
+        _engines[:] = db.engines.values()
+    for engine in _engines:
+        instrument_engine(engine)
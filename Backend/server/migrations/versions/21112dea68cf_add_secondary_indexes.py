@@ -0,0 +1,68 @@
+"""Add secondary indexes for hot queries
+
+Revision ID: 21112dea68cf
+Revises: 22b2d5ca2dd3
+Create Date: 2026-01-26 09:12:44.901377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '21112dea68cf'
+down_revision = '22b2d5ca2dd3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('repository', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_repository_owner_id'), ['owner_id'], unique=False)
+
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_repository_id'), ['repository_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_file_blob_id'), ['blob_id'], unique=False)
+
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_session_repository_id'), ['repository_id'], unique=False)
+
+    with op.batch_alter_table('share_link', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_share_link_repository_id'), ['repository_id'], unique=False)
+
+    with op.batch_alter_table('meeting', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_meeting_repository_id'), ['repository_id'], unique=False)
+
+    with op.batch_alter_table('download_log', schema=None) as batch_op:
+        batch_op.create_index('ix_download_log_repository_id_downloaded_at', ['repository_id', 'downloaded_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_download_log_file_id'), ['file_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_download_log_share_link_id'), ['share_link_id'], unique=False)
+
+    # Viewer lists read the newest accesses of one link first
+    op.create_index('ix_link_access_log_share_link_id_accessed_at', 'link_access_log',
+                    ['share_link_id', sa.text('accessed_at DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_link_access_log_share_link_id_accessed_at', table_name='link_access_log')
+
+    with op.batch_alter_table('download_log', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_download_log_share_link_id'))
+        batch_op.drop_index(batch_op.f('ix_download_log_file_id'))
+        batch_op.drop_index('ix_download_log_repository_id_downloaded_at')
+
+    with op.batch_alter_table('meeting', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_meeting_repository_id'))
+
+    with op.batch_alter_table('share_link', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_share_link_repository_id'))
+
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_session_repository_id'))
+
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_file_blob_id'))
+        batch_op.drop_index(batch_op.f('ix_file_repository_id'))
+
+    with op.batch_alter_table('repository', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_repository_owner_id'))
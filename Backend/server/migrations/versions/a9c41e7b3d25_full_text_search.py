@@ -0,0 +1,131 @@
+"""Full-text search index
+
+Revision ID: a9c41e7b3d25
+Revises: f12736df40b9
+Create Date: 2026-02-12 10:04:51.219337
+
+One search document per file, repository and meeting, keyed by
+object_id * 4 + kind code (file 1, repository 2, meeting 3) and kept current
+by triggers on the source tables. SQLite uses an FTS5 table; Postgres a
+table with a generated tsvector column under a GIN index. Other databases
+get no index and search the source tables with LIKE (server/search.py).
+
+On SQLite, a batch migration that recreates file, repository or meeting
+drops their triggers; such a migration must recreate them.
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c41e7b3d25'
+down_revision = 'f12736df40b9'
+branch_labels = None
+depends_on = None
+
+# kind, code, source table and its (repository_id, title, body) expressions; {p} is NEW. inside triggers
+SOURCES = [
+    ('file', 1, 'file', "{p}repository_id, {p}original_filename, coalesce({p}tags, '')"),
+    ('repository', 2, 'repository', "{p}id, {p}name, coalesce({p}description, '')"),
+    ('meeting', 3, 'meeting', "{p}repository_id, {p}title, ''"),
+]
+
+
+def _values(kind, code, expressions, p=''):
+    return f"{p}id * 4 + {code}, '{kind}', {p}id, " + expressions.format(p=p)
+
+
+def _upgrade_sqlite():
+    op.execute(
+        "CREATE VIRTUAL TABLE search_index USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, repository_id UNINDEXED, title, body, "
+        "tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+    columns = 'rowid, kind, object_id, repository_id, title, body'
+    for kind, code, table, expressions in SOURCES:
+        op.execute(
+            f"INSERT INTO search_index ({columns}) "
+            f"SELECT {_values(kind, code, expressions)} FROM {table}"
+        )
+        op.execute(
+            f"CREATE TRIGGER search_{table}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO search_index ({columns}) VALUES ({_values(kind, code, expressions, 'new.')}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER search_{table}_update AFTER UPDATE ON {table} BEGIN "
+            f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code}; "
+            f"INSERT INTO search_index ({columns}) VALUES ({_values(kind, code, expressions, 'new.')}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER search_{table}_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code}; END"
+        )
+
+
+def _upgrade_postgresql():
+    op.execute(
+        "CREATE TABLE search_document ("
+        "id BIGINT PRIMARY KEY, "
+        "kind VARCHAR(20) NOT NULL, "
+        "object_id INTEGER NOT NULL, "
+        "repository_id INTEGER NOT NULL, "
+        "title TEXT NOT NULL DEFAULT '', "
+        "body TEXT NOT NULL DEFAULT '', "
+        "document TSVECTOR GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', regexp_replace(title, '[._/-]+', ' ', 'g')), 'A') || "
+        "setweight(to_tsvector('english', regexp_replace(body, '[._/-]+', ' ', 'g')), 'B')"
+        ") STORED)"
+    )
+    op.execute("CREATE INDEX ix_search_document_document ON search_document USING GIN (document)")
+    op.execute("CREATE INDEX ix_search_document_repository_id ON search_document (repository_id)")
+
+    columns = 'id, kind, object_id, repository_id, title, body'
+    for kind, code, table, expressions in SOURCES:
+        op.execute(
+            f"INSERT INTO search_document ({columns}) "
+            f"SELECT {_values(kind, code, expressions)} FROM \"{table}\""
+        )
+        op.execute(
+            f"CREATE FUNCTION search_{table}_sync() RETURNS trigger AS $$\n"
+            f"BEGIN\n"
+            f"  IF TG_OP IN ('UPDATE', 'DELETE') THEN\n"
+            f"    DELETE FROM search_document WHERE id = OLD.id * 4 + {code};\n"
+            f"  END IF;\n"
+            f"  IF TG_OP IN ('INSERT', 'UPDATE') THEN\n"
+            f"    INSERT INTO search_document ({columns}) VALUES ({_values(kind, code, expressions, 'NEW.')});\n"
+            f"  END IF;\n"
+            f"  RETURN NULL;\n"
+            f"END\n"
+            f"$$ LANGUAGE plpgsql"
+        )
+        op.execute(
+            f"CREATE TRIGGER search_{table}_sync AFTER INSERT OR UPDATE OR DELETE ON \"{table}\" "
+            f"FOR EACH ROW EXECUTE PROCEDURE search_{table}_sync()"
+        )
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        _upgrade_sqlite()
+    elif dialect == 'postgresql':
+        _upgrade_postgresql()
+    else:
+        logging.getLogger('alembic.runtime.migration').warning(
+            'No full-text index on %s; search falls back to LIKE over the source tables', dialect)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    for _, _, table, _ in SOURCES:
+        if dialect == 'sqlite':
+            for event in ('insert', 'update', 'delete'):
+                op.execute(f"DROP TRIGGER IF EXISTS search_{table}_{event}")
+        else:
+            op.execute(f"DROP TRIGGER IF EXISTS search_{table}_sync ON \"{table}\"")
+            op.execute(f"DROP FUNCTION IF EXISTS search_{table}_sync()")
+    op.execute("DROP TABLE IF EXISTS search_index" if dialect == 'sqlite' else "DROP TABLE IF EXISTS search_document")
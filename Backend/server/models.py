@@ -8,7 +8,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), default='user')  # 'user' or 'super_admin'
     is_approved = db.Column(db.Boolean, default=False)  # NEW: approval status
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
         return {
@@ -24,12 +24,16 @@ class Repository(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Foreign Key
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)  # Foreign Key
     repo_type = db.Column(db.String(50), default='general')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # tombstone: hidden from queries, purged in the background
+    deleted_by = db.Column(db.Integer, nullable=True)  # id of the admin who deleted it
+    purged_at = db.Column(db.DateTime, nullable=True)  # every dependent row and file is gone
+    content_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped when its files change
     owner = db.relationship('User', backref='repositories') 
     
-    def to_dict(self, include_files=False, include_meetings=False):
+    def to_dict(self, include_files=False, include_meetings=False, file_count=None):
         data = {
             'id': self.id,
             'name': self.name,
@@ -41,14 +45,24 @@ class Repository(db.Model):
         
         if include_files:
             data['files'] = [f.to_dict() for f in self.files]
+        elif file_count is not None:
+            data['file_count'] = file_count
         else:
-            data['file_count'] = len(self.files)
+            data['file_count'] = File.query.filter_by(repository_id=self.id).count()
             
         if include_meetings:
             data['meetings'] = [m.to_dict() for m in self.meetings]
             
         return data
     
+class Blob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # File rows using this blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class File(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -56,12 +70,15 @@ class File(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(50))
     file_size = db.Column(db.Integer)
-    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False)  # Foreign Key
+    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False, index=True)  # Foreign Key
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Foreign Key
     tags = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sha256 = db.Column(db.String(64))  # content hash
+    blob_id = db.Column(db.Integer, db.ForeignKey('blob.id'), nullable=True, index=True)  # NULL for files stored before the blob store
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     repository = db.relationship('Repository', backref='files')  # Relationship: File -> Repository
     uploader = db.relationship('User')  # Relationship: File -> User
+    blob = db.relationship('Blob')
     
     def to_dict(self, include_uploader=False):
         data = {
@@ -78,16 +95,75 @@ class File(db.Model):
             
         return data
 
+class Thumbnail(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('file_id', 'size', name='uq_thumbnail_file_id_size'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False)
+    size = db.Column(db.String(20), nullable=False)  # a key of THUMBNAIL_SIZES
+    status = db.Column(db.String(20), nullable=False)  # 'ready', 'failed' or 'unsupported'
+    path = db.Column(db.String(500))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # last render attempt
+    file = db.relationship('File')
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)  # normalized: lower case, single spaces
+
+class FileTag(db.Model):
+    __table_args__ = (
+        # Tag -> files lookups, scoped to a repository and in file order for paging
+        db.Index('ix_file_tag_tag_id_repository_id_file_id', 'tag_id', 'repository_id', 'file_id'),
+    )
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False)  # copied from the file
+
+class RepositoryTagCount(db.Model):
+    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    file_count = db.Column(db.Integer, default=0, nullable=False)
+    tag = db.relationship('Tag')
+
+class UploadSession(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False, index=True)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    file_type = db.Column(db.String(50))
+    tags = db.Column(db.String(500))
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_size = db.Column(db.BigInteger, default=0, nullable=False)  # contiguous bytes written so far
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'repository_id': self.repository_id,
+            'filename': self.original_filename,
+            'total_size': self.total_size,
+            'offset': self.received_size,
+            'complete': self.received_size >= self.total_size,
+            'created_at': self.created_at.isoformat()
+        }
+
 class ShareLink(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(100), unique=True, nullable=False)
-    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False)
+    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False, index=True)
     permission = db.Column(db.String(20), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     expires_at = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)  # NEW: can be revoked
     view_count = db.Column(db.Integer, default=0)  # NEW: track views
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     repository = db.relationship('Repository')
     creator = db.relationship('User')
     
@@ -104,7 +180,7 @@ class ShareLink(db.Model):
         }
 class Meeting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False)  # Foreign Key
+    repository_id = db.Column(db.Integer, db.ForeignKey('repository.id'), nullable=False, index=True)  # Foreign Key
     title = db.Column(db.String(200), nullable=False)
     platform = db.Column(db.String(50))  # zoom, google_meet
     meeting_url = db.Column(db.String(500))
@@ -125,6 +201,11 @@ class Meeting(db.Model):
         }
     
 class DownloadLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_download_log_repository_id_downloaded_at', 'repository_id', 'downloaded_at'),
+        db.Index('ix_download_log_file_id_downloaded_at', 'file_id', 'downloaded_at'),
+        db.Index('ix_download_log_share_link_id_downloaded_at', 'share_link_id', 'downloaded_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     file_id = db.Column(db.Integer, db.ForeignKey('file.id'), nullable=False)
     share_link_id = db.Column(db.Integer, db.ForeignKey('share_link.id'), nullable=True)
@@ -140,9 +221,46 @@ class DownloadLog(db.Model):
             'id': self.id,
             'downloaded_at': self.downloaded_at,
             'ip_address': self.ip_address,
-            
+
         }
 
+# Download counts derived from DownloadLog by server.rollups; never written by routes
+class DownloadRollup(db.Model):
+    scope = db.Column(db.String(20), primary_key=True)  # 'repository', 'file' or 'share_link'
+    scope_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)  # 'hour' or 'day'
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the hour/day, UTC
+    repository_id = db.Column(db.Integer, nullable=False, index=True)
+    downloads = db.Column(db.Integer, default=0, nullable=False)
+
+class DownloadTotal(db.Model):
+    scope = db.Column(db.String(20), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)
+    repository_id = db.Column(db.Integer, nullable=False, index=True)
+    downloads = db.Column(db.Integer, default=0, nullable=False)
+    last_downloaded_at = db.Column(db.DateTime)
+
+# A compressed file of log rows moved out of the database by server.retention
+class LogSegment(db.Model):
+    __table_args__ = (
+        db.Index('ix_log_segment_table_name_day', 'table_name', 'day'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)  # 'download_log' or 'link_access_log'
+    day = db.Column(db.Date, nullable=False)  # UTC day of every row in the segment
+    path = db.Column(db.String(500), nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# A stored file whose database rows are gone and that is yet to be removed from disk
+class PendingUnlink(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)  # set for blobs: skipped if the content is stored again
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class AppSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(100), unique=True, nullable=False)
@@ -160,6 +278,9 @@ class AppSettings(db.Model):
         }
     
 class LinkAccessLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_link_access_log_share_link_id_accessed_at', 'share_link_id', db.text('accessed_at DESC')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     share_link_id = db.Column(db.Integer, db.ForeignKey('share_link.id'), nullable=False)
     email = db.Column(db.String(120))  # Optional email
@@ -0,0 +1,150 @@
+import json
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import current_app, request, jsonify
+from sqlalchemy import tuple_
+
+# One page of rows plus the opaque cursor for the next page (None on the last page)
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+def encode_cursor(sort, value, row_id):
+    payload = json.dumps([sort, _encode_value(value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort, _decode_value(value), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise PaginationError('Invalid cursor')
+
+def _check_value(column, value):
+    """Refuse a cursor value that is not of the sort column's type, rather than failing in the query."""
+    if value is None:
+        return
+    expected = column.type.python_type
+    # bool is an int to Python, never to a cursor
+    if isinstance(value, bool) or not isinstance(value, expected):
+        raise PaginationError('Invalid cursor')
+
+def page_size(paged_by_default=False):
+    """The requested page size, or None for the complete list.
+
+    Lists that existed before pagination stay complete unless the client sends
+    limit or cursor; clients that page get DEFAULT_PAGE_SIZE rows per page.
+    """
+    if not paged_by_default and 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    default = current_app.config['DEFAULT_PAGE_SIZE']
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+def requested_fields():
+    """Keys kept in each serialized item from ?fields= (comma-separated), or None for all of them.
+
+    The selection is applied to the serialized items: it makes responses
+    smaller, the rows are still loaded in full.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(',') if field.strip()}
+
+def keyset_query(query, sort_columns, sort, id_column, cursor=None):
+    """Order query by sort and, given a cursor, start after the row it points at.
+
+    Returns the query and the sort column; this is the statement paginate()
+    runs, before the page limit is applied.
+    """
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in sort_columns:
+        raise PaginationError(f"Cannot sort by '{name}'; use one of: {', '.join(sorted(sort_columns))}")
+    column = sort_columns[name]
+
+    if cursor:
+        cursor_sort, value, row_id = decode_cursor(cursor)
+        if cursor_sort != sort:
+            raise PaginationError('Cursor was issued for a different sort order')
+        _check_value(column, value)
+        if column is id_column:
+            position = id_column < row_id if descending else id_column > row_id
+        elif descending:
+            position = tuple_(column, id_column) < tuple_(value, row_id)
+        else:
+            position = tuple_(column, id_column) > tuple_(value, row_id)
+        query = query.filter(position)
+
+    if descending:
+        query = query.order_by(None).order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(None).order_by(column.asc(), id_column.asc())
+    return query, column
+
+def paginate(query, sort_columns, default_sort, id_column, entity=lambda row: row, paged_by_default=False):
+    """Apply keyset pagination to query from the limit/cursor/sort request args.
+
+    sort_columns maps the names accepted in ?sort= (prefix '-' for descending)
+    to indexed columns; id_column breaks ties so the order is total. entity
+    picks the mapped object out of each row when the query returns tuples.
+    Without limit or cursor every row is returned, unless paged_by_default.
+    """
+    sort = request.args.get('sort', default_sort)
+    limit = page_size(paged_by_default)
+    query, column = keyset_query(query, sort_columns, sort, id_column, request.args.get('cursor'))
+
+    if limit is None:
+        return Page(query.all(), None)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = entity(rows[-1])
+        next_cursor = encode_cursor(sort, getattr(last, column.key), getattr(last, id_column.key))
+
+    return Page(rows, next_cursor)
+
+def project(item, fields):
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+def serialize_page(page, serialize):
+    fields = requested_fields()
+    return [project(serialize(row), fields) for row in page.items]
+
+def next_page_url(cursor):
+    args = request.args.to_dict()
+    args['cursor'] = cursor
+    return f"{request.base_url}?{urlencode(args)}"
+
+def list_response(page, serialize):
+    """JSON array of the page, with the next cursor in X-Next-Cursor and a Link header."""
+    response = jsonify(serialize_page(page, serialize))
+    if page.next_cursor:
+        response.headers['X-Next-Cursor'] = page.next_cursor
+        response.headers['Link'] = f'<{next_page_url(page.next_cursor)}>; rel="next"'
+    return response
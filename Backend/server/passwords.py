@@ -0,0 +1,128 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when a hash cannot be computed promptly; routes answer 503 with Retry-After."""
+
+
+class PasswordHasher:
+    """Runs the deliberately slow password KDFs on a small process pool.
+
+    Request threads only wait on a future, so a burst of logins cannot take
+    every worker thread (or the GIL) away from other endpoints. At most
+    PASSWORD_HASH_MAX_PENDING hashes are queued or running per process; beyond
+    that, and for jobs that wait longer than PASSWORD_HASH_TIMEOUT, HashingBusy
+    is raised instead of queueing without bound. PASSWORD_HASH_WORKERS = 0
+    hashes on the calling thread.
+
+    Pool processes are spawned, which re-imports the main module: scripts that
+    log users in must keep their work under `if __name__ == '__main__'`.
+    """
+
+    def __init__(self):
+        self.method = 'scrypt:32768:8:1'
+        self.workers = 2
+        self.max_pending = 64
+        self.timeout = 10.0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+
+    def _pool(self):
+        if self._pid != os.getpid():
+            # A forked gunicorn worker gets its own pool, not the parent's
+            self._executor = None
+            self.in_flight = 0
+            self._pid = os.getpid()
+        if self._executor is None:
+            # Spawned, not forked: the children inherit no sockets, threads or DB connections
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            executor = self._pool()
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusy()
+            self.in_flight += 1
+
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            with self._lock:
+                self.in_flight -= 1
+                self._discard(executor)
+            raise HashingBusy()
+        # The slot is freed when the job is done, not when this request stops
+        # waiting: a job that has started cannot be cancelled and keeps a worker busy
+        future.add_done_callback(self._done)
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Drops the job if it has not started yet
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise HashingBusy()
+        except BrokenProcessPool:
+            with self._lock:
+                self._discard(executor)
+            raise HashingBusy()
+
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _discard(self, executor):
+        # A child died; start a fresh pool on the next call
+        if self._executor is executor:
+            self._executor = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with other parameters than PASSWORD_HASH_METHOD."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,167 @@
+import re
+import time
+import heapq
+import logging
+import itertools
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g
+from sqlalchemy import event
+from server.extensions import db
+
+# SQL profiling on engine events. Statements slower than SLOW_QUERY_SECONDS
+# are always logged; with SQL_PROFILE on (development) every request is
+# profiled and the totals are sent back in response headers. Tests can
+# profile a block with profile_queries(), see the query_budget fixture in
+# tests/conftest.py.
+
+sql_log = logging.getLogger('server.sql')
+
+# Profiles that statements on this thread / context are being recorded into
+_active_profiles = ContextVar('sql_profiles', default=())
+
+# A parenthesized list of bind placeholders, e.g. an expanded IN (?, ?, ?)
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """The statement with whitespace collapsed and IN lists of any length made the same."""
+    return _PLACEHOLDER_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+def _clip(text, limit):
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+class QueryProfile:
+    """Statement count, total time, slowest statements and statement shapes of one block of work."""
+
+    def __init__(self, keep=5):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self._slowest = []  # min-heap of (seconds, sequence, statement, parameters)
+        self._sequence = itertools.count()
+
+    def record(self, statement, parameters, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        entry = (seconds, next(self._sequence), statement, parameters)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self):
+        return [{'ms': round(seconds * 1000, 2), 'sql': _clip(_WHITESPACE.sub(' ', statement).strip(), 2000),
+                 'parameters': _clip(repr(parameters), 500)}
+                for seconds, _, statement, parameters in sorted(self._slowest, reverse=True)]
+
+    def repeated(self, threshold):
+        """Shapes executed at least threshold times, most frequent first: the N+1 pattern."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def report(self, repeat_threshold):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.seconds * 1000, 2),
+            'slowest': self.slowest(),
+            'repeated': [{'count': count, 'sql': _clip(shape, 2000)} for shape, count in self.repeated(repeat_threshold)],
+        }
+
+
+@contextmanager
+def profile_queries(keep=5):
+    """Record every statement executed inside the block, including by requests it makes."""
+    profile = QueryProfile(keep)
+    token = _active_profiles.set(_active_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active_profiles.reset(token)
+
+
+class SQLProfiler:
+    """Times statements on the app's engines for the slow-query log and active profiles."""
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_seconds = 0.5
+        self.log_parameters = False
+        self.repeat_threshold = 5
+        self.keep = 5
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config['SQL_PROFILE']
+        self.slow_seconds = config['SLOW_QUERY_SECONDS']
+        self.log_parameters = config['SLOW_QUERY_LOG_PARAMETERS']
+        self.repeat_threshold = config['SQL_PROFILE_REPEAT_THRESHOLD']
+        self.keep = config['SQL_PROFILE_SLOWEST']
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            self.instrument_engine(engine)
+
+        if self.enabled:
+            app.before_request(self.start_request)
+            app.after_request(self.report_request)
+            app.teardown_request(self.end_request)
+
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context.profile_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - context.profile_started
+            for profile in _active_profiles.get():
+                profile.record(statement, parameters, seconds)
+            if self.slow_seconds and seconds >= self.slow_seconds:
+                self.log_slow(statement, parameters, seconds)
+
+    def log_slow(self, statement, parameters, seconds):
+        extra = {'duration_ms': round(seconds * 1000, 2), 'sql': _clip(_WHITESPACE.sub(' ', statement).strip(), 2000)}
+        if self.log_parameters:
+            extra['parameters'] = _clip(repr(parameters), 500)
+        sql_log.warning('Slow query: %.1f ms', seconds * 1000, extra=extra)
+
+    def start_request(self):
+        profile = QueryProfile(self.keep)
+        g.sql_profile = profile
+        g.sql_profile_token = _active_profiles.set(_active_profiles.get() + (profile,))
+
+    def report_request(self, response):
+        if 'sql_profile' not in g:
+            return response
+        profile = g.sql_profile
+        repeated = profile.repeated(self.repeat_threshold)
+        db_ms = round(profile.seconds * 1000, 2)
+        response.headers['X-SQL-Queries'] = str(profile.count)
+        response.headers['X-SQL-Time'] = f'{db_ms}ms'
+        response.headers['X-SQL-Repeated'] = str(len(repeated))
+        response.headers['Server-Timing'] = f'db;dur={db_ms};desc="{profile.count} queries"'
+        slowest = profile.slowest()
+        if slowest:
+            # Header values are latin-1 on one line
+            sql = slowest[0]['sql'].encode('latin-1', 'replace').decode('latin-1')
+            response.headers['X-SQL-Slowest'] = f"{slowest[0]['ms']}ms {_clip(sql, 200)}"
+
+        if repeated:
+            sql_log.warning('Repeated statements (possible N+1): %s', ', '.join(f'{count}x' for _, count in repeated),
+                            extra=profile.report(self.repeat_threshold))
+        elif sql_log.isEnabledFor(logging.DEBUG):
+            sql_log.debug('%d queries in %.1f ms', profile.count, db_ms, extra=profile.report(self.repeat_threshold))
+        return response
+
+    def end_request(self, exc):
+        if 'sql_profile_token' in g:
+            _active_profiles.reset(g.pop('sql_profile_token'))
+
+
+sql_profiler = SQLProfiler()
@@ -0,0 +1,70 @@
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from server.models import Repository, File, ShareLink, DownloadTotal
+from server.extensions import db
+from server.tags import filter_by_tags
+
+# Data access for the list and detail endpoints. Each helper issues a fixed
+# number of statements no matter how many repositories, files or links exist.
+
+def file_count_column():
+    """Correlated COUNT(file.id) for the repository in the outer query."""
+    return (
+        db.select(db.func.count(File.id))
+        .where(File.repository_id == Repository.id)
+        .correlate(Repository)
+        .scalar_subquery()
+        .label('file_count')
+    )
+
+def repositories_with_file_counts(owner_id=None, include_owner=False):
+    """Return (repository, file_count) pairs in a single statement."""
+    query = db.session.query(Repository, file_count_column())
+    if owner_id is not None:
+        query = query.filter(Repository.owner_id == owner_id)
+    if include_owner:
+        query = query.options(joinedload(Repository.owner))
+    return query
+
+def repository_detail_query(repo_id):
+    return Repository.query.options(selectinload(Repository.meetings)).filter_by(id=repo_id)
+
+def repository_detail(repo_id):
+    """Load a repository with its meetings eagerly; files are paged separately."""
+    return repository_detail_query(repo_id).first_or_404()
+
+def repository_files(repo_id, include_uploader=False, tags=None):
+    query = File.query.filter_by(repository_id=repo_id)
+    if tags:
+        query = filter_by_tags(query, repo_id, tags)
+    if include_uploader:
+        query = query.options(joinedload(File.uploader))
+    return query
+
+def share_links_with_relations():
+    # Inner join, so links of deleted repositories are left out with them
+    return ShareLink.query.join(ShareLink.repository).options(
+        contains_eager(ShareLink.repository),
+        joinedload(ShareLink.creator)
+    )
+
+def share_link_by_token(token):
+    """The link fields needed to authorize a request with its repository's content_version, in one statement."""
+    return (
+        db.select(ShareLink.id, ShareLink.repository_id, ShareLink.permission, ShareLink.is_active,
+                  ShareLink.expires_at, Repository.content_version)
+        .join(Repository, Repository.id == ShareLink.repository_id)
+        .where(ShareLink.token == token)
+    )
+
+def repository_download_totals():
+    """(id, name, downloads) of every repository with downloads, from the rollups."""
+    return db.session.query(Repository.id, Repository.name, DownloadTotal.downloads).join(
+        DownloadTotal, db.and_(DownloadTotal.scope == 'repository', DownloadTotal.scope_id == Repository.id)
+    )
+
+def visible_file_query(file_id):
+    return File.query.join(File.repository).filter(File.id == file_id)
+
+def visible_file(file_id):
+    """The file, or None if it or its repository does not exist (deleted repositories included)."""
+    return visible_file_query(file_id).first()
@@ -0,0 +1,179 @@
+import os
+import mimetypes
+import secrets
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import current_app, request, Response
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import (parse_if_range_header, is_byte_range_valid, is_resource_modified,
+                           http_date, quote_etag)
+from werkzeug.utils import send_file as werkzeug_send_file
+from server.storage import COPY_BUFFER_SIZE
+
+# More ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+
+def parse_byte_ranges(header):
+    """The ranges of a bytes Range header as (start, stop) pairs, stop exclusive.
+
+    stop is None for an open range and for a suffix range, whose start is
+    negative. Unlike parse_range_header, overlapping or unordered ranges are
+    kept (they are merged before sending). A malformed header gives [].
+    """
+    if not header or not header.startswith('bytes='):
+        return []
+    ranges = []
+    for item in header[len('bytes='):].split(','):
+        first, dash, last = (part.strip() for part in item.partition('-'))
+        if not dash:
+            return []
+        if not first:
+            if not last.isdigit():
+                return []
+            ranges.append((-int(last), None))
+        elif first.isdigit() and (not last or last.isdigit()):
+            start, stop = int(first), int(last) + 1 if last else None
+            if stop is not None and stop <= start:
+                return []
+            ranges.append((start, stop))
+        else:
+            return []
+    return ranges
+
+def _satisfiable_ranges(ranges, size):
+    satisfiable = []
+    for start, end in ranges:
+        if end is None:
+            end = size
+            if start < 0:
+                start = max(size + start, 0)
+        end = min(end, size)
+        if is_byte_range_valid(start, end, size):
+            satisfiable.append((start, end))
+    return satisfiable
+
+def _if_range_matches(etag, last_modified):
+    header = request.headers.get('If-Range')
+    if not header:
+        return True
+    if_range = parse_if_range_header(header)
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return int(last_modified) == int(if_range.date.timestamp())
+    return False
+
+def _not_satisfiable(size):
+    response = Response(status=416)
+    response.headers['Content-Range'] = f'bytes */{size}'
+    return response
+
+def _coalesce(ranges):
+    """Sort ranges and merge those that overlap or touch, so no byte is sent twice."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _attachment(headers, download_name):
+    # As send_file sets it: non-ASCII names get an ASCII fallback and an RFC 5987 filename*
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        headers.set('Content-Disposition', 'attachment', filename=simple,
+                    **{'filename*': "UTF-8''" + quote(download_name, safe="!#$&+^`|~")})
+    else:
+        headers.set('Content-Disposition', 'attachment', filename=download_name)
+
+def _multipart_response(path, ranges, size, mimetype, download_name, etag, last_modified):
+    boundary = secrets.token_hex(16)
+    part_headers = [
+        (f'--{boundary}\r\nContent-Type: {mimetype}\r\n'
+         f'Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n').encode()
+        for start, end in ranges
+    ]
+    closing = f'--{boundary}--\r\n'.encode()
+    content_length = sum(len(h) + (end - start) + 2 for h, (start, end) in zip(part_headers, ranges)) + len(closing)
+
+    def generate():
+        with open(path, 'rb') as f:
+            for header, (start, end) in zip(part_headers, ranges):
+                yield header
+                f.seek(start)
+                remaining = end - start
+                while remaining:
+                    block = f.read(min(COPY_BUFFER_SIZE, remaining))
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    yield block
+                yield b'\r\n'
+        yield closing
+
+    response = Response(generate(), status=206, mimetype=f'multipart/byteranges; boundary={boundary}', direct_passthrough=True)
+    response.headers['Content-Length'] = str(content_length)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['ETag'] = quote_etag(etag)
+    response.headers['Last-Modified'] = http_date(last_modified)
+    _attachment(response.headers, download_name)
+    return response
+
+def _send_file(path, download_name, etag, last_modified, environ):
+    """Flask's send_file, answering the request described by environ."""
+    return werkzeug_send_file(
+        path, environ, as_attachment=True, download_name=download_name, etag=etag, last_modified=last_modified,
+        conditional=True, max_age=current_app.get_send_file_max_age, use_x_sendfile=current_app.config['USE_X_SENDFILE'],
+        response_class=current_app.response_class, _root_path=current_app.root_path
+    )
+
+def _without_range(environ):
+    return {key: value for key, value in environ.items() if key != 'HTTP_RANGE'}
+
+def send_file_ranged(path, download_name, etag):
+    """send_file with a strong ETag, conditional GET and single or multi-range support.
+
+    Werkzeug handles If-None-Match, If-Modified-Since, If-Range and a single
+    byte range; requests for several ranges are answered with multipart/byteranges
+    once the conditional headers have been checked.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = stat.st_mtime
+    environ = request.environ
+
+    byte_ranges = parse_byte_ranges(request.headers.get('Range'))
+    requested = len(byte_ranges)
+
+    # Conditional headers are evaluated before Range (RFC 9110 13.2.2); Werkzeug
+    # would serve a range first, so a Range on an unmodified file is dropped here
+    if requested and not is_resource_modified(environ, etag=etag,
+                                              last_modified=datetime.fromtimestamp(last_modified, timezone.utc)):
+        environ = _without_range(environ)
+
+    # Werkzeug only serves a single range, so several ranges are handled here
+    elif requested > 1:
+        if requested <= MAX_RANGES and _if_range_matches(etag, last_modified):
+            ranges = _coalesce(_satisfiable_ranges(byte_ranges, size))
+            if not ranges:
+                return _not_satisfiable(size)
+            if len(ranges) > 1:
+                mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+                return _multipart_response(path, ranges, size, mimetype, download_name, etag, last_modified)
+            # Merged into one: an ordinary single-range response
+            start, end = ranges[0]
+            environ = {**environ, 'HTTP_RANGE': f'bytes={start}-{end - 1}'}
+        else:
+            # Too many ranges or a stale If-Range: the whole file, as if no Range was sent
+            environ = _without_range(environ)
+
+    try:
+        response = _send_file(path, download_name, etag, last_modified, environ)
+    except RequestedRangeNotSatisfiable:
+        return _not_satisfiable(size)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,216 @@
+import os
+import csv
+import gzip
+import io
+from collections import defaultdict
+from datetime import datetime, timedelta, date
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DateTime, Integer
+from server.extensions import db
+from server.models import DownloadLog, LinkAccessLog, LogSegment
+from server.writebehind import BackgroundFlusher
+from server.rollups import counted_through
+
+# Log tables that are archived, with the column holding each row's time
+ARCHIVED_LOGS = {
+    'download_log': (DownloadLog, 'downloaded_at'),
+    'link_access_log': (LinkAccessLog, 'accessed_at'),
+}
+
+def archive_folder():
+    return current_app.config['LOG_ARCHIVE_FOLDER']
+
+def segment_path(table_name, day, first_id, last_id):
+    return os.path.join(archive_folder(), table_name, day.isoformat(), f'{first_id}-{last_id}.csv.gz')
+
+def _write_segment(path, columns, rows):
+    """Write rows as gzip-compressed CSV, visible under path only once complete."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as compressed:
+            text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(['' if value is None else value.isoformat() if isinstance(value, datetime) else value
+                                 for value in row])
+            text.flush()
+            text.detach()
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+class _AlreadyArchived(Exception):
+    pass
+
+def _remove(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def _archivable_limit(conn, table_name):
+    """Highest id that may be archived.
+
+    The newest row always stays, since SQLite hands the highest id out again
+    once its row is gone; download rows must be counted into the rollups first.
+    """
+    table = ARCHIVED_LOGS[table_name][0].__table__
+    limit = (conn.execute(db.select(db.func.max(table.c.id))).scalar() or 0) - 1
+    if table_name == 'download_log':
+        limit = min(limit, counted_through(conn))
+    return limit
+
+def archive_batch(table_name, batch_size, limit=None):
+    """The select of the next batch to archive: the oldest rows by id, none above limit."""
+    table = ARCHIVED_LOGS[table_name][0].__table__
+    query = db.select(*table.columns).order_by(table.c.id).limit(batch_size)
+    if limit is not None:
+        query = query.where(table.c.id <= limit)
+    return query
+
+def archive_table(table_name, older_than, batch_size=5000, max_batches=None):
+    """Move rows older than the cutoff into segment files; returns the number of rows moved.
+
+    Rows are taken oldest id first and the batch stops at the first row that
+    is too recent, so every run reads only what it archives. Each batch writes
+    one segment per day, records it in log_segment and deletes the rows in the
+    same transaction; a batch that another process archived first is undone.
+    """
+    model, time_column = ARCHIVED_LOGS[table_name]
+    table = model.__table__
+    columns = [column.name for column in table.columns]
+    segments = LogSegment.__table__
+    moved = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        written = []
+        try:
+            with db.engine.begin() as conn:
+                query = archive_batch(table_name, batch_size, _archivable_limit(conn, table_name))
+                rows = conn.execute(query).fetchall()
+
+                ready = []
+                for row in rows:
+                    moment = getattr(row, time_column)
+                    if moment is not None and moment >= older_than:
+                        break
+                    ready.append(row)
+                if not ready:
+                    return moved
+
+                by_day = defaultdict(list)
+                for row in ready:
+                    moment = getattr(row, time_column)
+                    by_day[moment.date() if moment else date(1970, 1, 1)].append(row)
+
+                for day, day_rows in sorted(by_day.items()):
+                    first_id, last_id = day_rows[0].id, day_rows[-1].id
+                    path = segment_path(table_name, day, first_id, last_id)
+                    _write_segment(path, columns, day_rows)
+                    written.append(path)
+                    conn.execute(segments.insert().values(
+                        table_name=table_name, day=day, path=path, first_id=first_id,
+                        last_id=last_id, row_count=len(day_rows), created_at=datetime.utcnow()
+                    ))
+
+                ids = [row.id for row in ready]
+                deleted = 0
+                for start in range(0, len(ids), 500):
+                    deleted += conn.execute(table.delete().where(table.c.id.in_(ids[start:start + 500]))).rowcount
+                if deleted != len(ids):
+                    raise _AlreadyArchived()
+        except _AlreadyArchived:
+            _remove(written)
+            continue
+        except Exception:
+            _remove(written)
+            raise
+
+        moved += len(ready)
+        if len(ready) < len(rows) or len(rows) < batch_size:
+            return moved
+    return moved
+
+def archive_logs(retention_days, batch_size=5000, max_batches=None):
+    """Archive every log table; returns {table name: rows moved}."""
+    older_than = datetime.utcnow() - timedelta(days=retention_days)
+    return {name: archive_table(name, older_than, batch_size, max_batches) for name in ARCHIVED_LOGS}
+
+def _converter(column):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column.type, Integer):
+        return int
+    return str
+
+def segments_query(table_name, start=None, end=None):
+    """Segments of a log table whose day overlaps [start, end), oldest first."""
+    query = LogSegment.query.filter_by(table_name=table_name)
+    if start is not None:
+        query = query.filter(LogSegment.day >= start.date())
+    if end is not None:
+        query = query.filter(LogSegment.day <= end.date())
+    return query.order_by(LogSegment.day, LogSegment.first_id)
+
+def read_archive(table_name, start=None, end=None):
+    """Yield archived rows of a log table as dicts, oldest segment first.
+
+    Only segments whose day overlaps [start, end) are opened; rows are not
+    filtered further, so callers check the timestamp themselves. Empty values
+    are read back as None.
+    """
+    model, _ = ARCHIVED_LOGS[table_name]
+    converters = {column.name: _converter(column) for column in model.__table__.columns}
+
+    for segment in segments_query(table_name, start, end):
+        with gzip.open(segment.path, 'rt', encoding='utf-8', newline='') as f:
+            for record in csv.DictReader(f):
+                yield {key: (converters[key](value) if value != '' else None) for key, value in record.items()}
+
+
+class RetentionWorker(BackgroundFlusher):
+    """Archives old log rows every LOG_ARCHIVE_INTERVAL seconds, a bounded amount per run."""
+
+    def __init__(self):
+        super().__init__()
+        self.retention_days = None
+        self.batch_size = 5000
+        self.max_batches = 20
+
+    def init_app(self, app):
+        super().init_app(app)
+        if self.retention_days:
+            app.before_request(self.ensure_started)
+
+    def configure(self, config):
+        self.retention_days = config['LOG_RETENTION_DAYS']
+        self.interval = config['LOG_ARCHIVE_INTERVAL']
+        self.batch_size = config['LOG_ARCHIVE_BATCH_SIZE']
+
+    def flush(self):
+        archive_logs(self.retention_days, self.batch_size, self.max_batches)
+
+    def shutdown(self):
+        # Stop without a final run; archiving is resumable from the tables themselves
+        if self._pid == os.getpid():
+            self._stopping.set()
+            self._wakeup.set()
+
+
+retention_worker = RetentionWorker()
+
+@click.command('archive-logs')
+@click.option('--days', type=int, default=None, help='Archive rows older than this many days (default: LOG_RETENTION_DAYS).')
+@with_appcontext
+def archive_logs_command(days):
+    """Move old DownloadLog / LinkAccessLog rows into compressed segment files."""
+    days = days if days is not None else current_app.config['LOG_RETENTION_DAYS']
+    if not days:
+        raise click.UsageError('Log retention is disabled; pass --days')
+    for table_name, moved in archive_logs(days, current_app.config['LOG_ARCHIVE_BATCH_SIZE']).items():
+        click.echo(f'{table_name}: archived {moved} rows')
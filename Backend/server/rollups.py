@@ -0,0 +1,245 @@
+import os
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from server.extensions import db
+from server.models import DownloadLog, DownloadRollup, DownloadTotal, AppSettings
+from server.writebehind import BackgroundFlusher
+
+# AppSettings key holding the id of the last DownloadLog row counted into the rollups
+POSITION_KEY = 'download_rollup_position'
+# AppSettings key holding the ids at or below the position that were missing when it
+# moved past them, as JSON [[id, unix time first missed], ...]. Ids are assigned at
+# insert, so a row can commit after one with a higher id; it is counted when it shows up
+GAPS_KEY = 'download_rollup_gaps'
+
+PERIODS = {
+    'hour': lambda moment: moment.replace(minute=0, second=0, microsecond=0),
+    'day': lambda moment: moment.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+def _scopes(row):
+    yield 'repository', row.repository_id
+    yield 'file', row.file_id
+    if row.share_link_id is not None:
+        yield 'share_link', row.share_link_id
+
+def _upsert(conn, model, rows, increment):
+    """INSERT rows, adding the increment columns onto any row that already exists."""
+    if not rows:
+        return
+    dialect = postgresql if conn.dialect.name == 'postgresql' else sqlite
+    table = model.__table__
+    statement = dialect.insert(table)
+    updates = {name: table.c[name] + statement.excluded[name] for name in increment}
+    if 'last_downloaded_at' in table.c:
+        updates['last_downloaded_at'] = db.func.max(table.c.last_downloaded_at, statement.excluded.last_downloaded_at) \
+            if conn.dialect.name == 'sqlite' else \
+            db.func.greatest(table.c.last_downloaded_at, statement.excluded.last_downloaded_at)
+    conn.execute(
+        statement.on_conflict_do_update(index_elements=[c.name for c in table.primary_key], set_=updates),
+        rows
+    )
+
+def apply_downloads(conn, logs):
+    """Count DownloadLog rows into the hourly and daily rollups and the all-time totals."""
+    buckets = Counter()
+    totals = Counter()
+    last_seen = {}
+    for row in logs:
+        for scope, scope_id in _scopes(row):
+            for period, truncate in PERIODS.items():
+                buckets[(scope, scope_id, period, truncate(row.downloaded_at), row.repository_id)] += 1
+            key = (scope, scope_id, row.repository_id)
+            totals[key] += 1
+            last_seen[key] = max(last_seen.get(key, row.downloaded_at), row.downloaded_at)
+
+    # Sorted so concurrent writers touch rows in the same order
+    _upsert(conn, DownloadRollup, [
+        {'scope': scope, 'scope_id': scope_id, 'period': period, 'bucket': bucket,
+         'repository_id': repository_id, 'downloads': count}
+        for (scope, scope_id, period, bucket, repository_id), count in sorted(buckets.items())
+    ], ['downloads'])
+    _upsert(conn, DownloadTotal, [
+        {'scope': scope, 'scope_id': scope_id, 'repository_id': repository_id,
+         'downloads': count, 'last_downloaded_at': last_seen[(scope, scope_id, repository_id)]}
+        for (scope, scope_id, repository_id), count in sorted(totals.items())
+    ], ['downloads'])
+
+def _setting(conn, key, initial):
+    """The value of an AppSettings row, created with initial if missing."""
+    settings = AppSettings.__table__
+    value = conn.execute(db.select(settings.c.value).where(settings.c.key == key)).scalar()
+    if value is None:
+        try:
+            with conn.begin_nested():
+                conn.execute(settings.insert().values(key=key, value=initial, updated_at=datetime.utcnow()))
+        except IntegrityError:
+            pass
+        return initial
+    return value
+
+def _position(conn):
+    return _setting(conn, POSITION_KEY, '0')
+
+def _gaps(conn):
+    return _setting(conn, GAPS_KEY, '[]')
+
+def _swap_setting(conn, key, old, new):
+    """Set a setting only if it still holds old; returns whether it did."""
+    settings = AppSettings.__table__
+    return bool(conn.execute(
+        settings.update().where(settings.c.key == key, settings.c.value == old)
+        .values(value=new, updated_at=datetime.utcnow())
+    ).rowcount)
+
+def counted_through(conn):
+    """Highest id below which every DownloadLog row that will ever be counted has been."""
+    position = int(_position(conn))
+    gaps = json.loads(_gaps(conn))
+    return min([position] + [gap_id - 1 for gap_id, _ in gaps])
+
+def pending_downloads(position, batch_size):
+    """The select of the next DownloadLog rows to count: ids above position, lowest first."""
+    logs = DownloadLog.__table__
+    return (db.select(logs.c.id, logs.c.repository_id, logs.c.file_id, logs.c.share_link_id, logs.c.downloaded_at)
+            .where(logs.c.id > position).order_by(logs.c.id).limit(batch_size))
+
+def gap_downloads(ids):
+    """The select of DownloadLog rows that have committed since their ids were found missing."""
+    logs = DownloadLog.__table__
+    return (db.select(logs.c.id, logs.c.repository_id, logs.c.file_id, logs.c.share_link_id, logs.c.downloaded_at)
+            .where(logs.c.id.in_(ids)).order_by(logs.c.id))
+
+def catch_up(batch_size=5000, settle_seconds=30, max_batches=None, gap_seconds=3600):
+    """Count DownloadLog rows added since the last run; returns how many were counted.
+
+    Each batch commits its counts together with the new position and gaps,
+    which only change if no other process changed them first, so workers
+    running this concurrently never count a row twice. Rows younger than
+    settle_seconds are left for the next run. Ids skipped by the position are
+    kept as gaps and counted if their row commits within gap_seconds; after
+    that they are taken for rolled-back inserts and forgotten.
+    """
+    counted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        now = time.time()
+        with db.engine.connect() as conn:
+            with conn.begin() as trans:
+                position = _position(conn)
+                stored_gaps = _gaps(conn)
+                gaps = dict(json.loads(stored_gaps))
+                late = conn.execute(gap_downloads(list(gaps))).fetchall() if gaps else []
+                rows = conn.execute(pending_downloads(int(position), batch_size)).fetchall()
+
+                ready = []
+                for row in rows:
+                    if row.downloaded_at is not None and row.downloaded_at >= cutoff:
+                        break
+                    ready.append(row)
+
+                for row in late:
+                    del gaps[row.id]
+                new_position = ready[-1].id if ready else int(position)
+                seen = {row.id for row in ready}
+                # Only the batch_size ids below the position are watched: inserts in flight are
+                # a few flushes at most, a longer run of missing ids is rows deleted or rolled back
+                for gap_id in range(max(int(position), new_position - batch_size) + 1, new_position):
+                    if gap_id not in seen:
+                        gaps[gap_id] = now
+                gaps = {gap_id: missed for gap_id, missed in sorted(gaps.items())[-batch_size:]
+                        if missed > now - gap_seconds}
+                new_gaps = json.dumps(sorted(gaps.items()), separators=(',', ':'))
+
+                if not late and not ready and new_gaps == stored_gaps:
+                    trans.rollback()
+                    return counted
+
+                apply_downloads(conn, [row for row in late + ready if row.downloaded_at is not None])
+                if not (_swap_setting(conn, POSITION_KEY, position, str(new_position))
+                        and _swap_setting(conn, GAPS_KEY, stored_gaps, new_gaps)):
+                    # Another process counted this range first
+                    trans.rollback()
+                    continue
+        counted += len(late) + len(ready)
+        if len(ready) < len(rows) or len(rows) < batch_size:
+            return counted
+    return counted
+
+def rebuild(batch_size=5000):
+    """Regenerate every rollup from the archived and raw logs; returns the number of rows counted."""
+    from server.retention import read_archive
+
+    archived = 0
+    with db.engine.begin() as conn:
+        conn.execute(DownloadRollup.__table__.delete())
+        conn.execute(DownloadTotal.__table__.delete())
+        settings = AppSettings.__table__
+        conn.execute(settings.delete().where(settings.c.key.in_([POSITION_KEY, GAPS_KEY])))
+
+        batch = []
+        for record in read_archive('download_log'):
+            if record['downloaded_at'] is not None:
+                batch.append(SimpleNamespace(**record))
+            if len(batch) >= batch_size:
+                apply_downloads(conn, batch)
+                archived += len(batch)
+                batch = []
+        apply_downloads(conn, batch)
+        archived += len(batch)
+    return archived + catch_up(batch_size=batch_size, settle_seconds=0)
+
+def forget_repository(repository_id):
+    """Delete the rollups of a repository whose logs are being deleted; the caller commits."""
+    DownloadRollup.query.filter_by(repository_id=repository_id).delete(synchronize_session=False)
+    DownloadTotal.query.filter_by(repository_id=repository_id).delete(synchronize_session=False)
+
+
+class RollupUpdater(BackgroundFlusher):
+    """Keeps the download rollups current by catching up every ROLLUP_INTERVAL seconds."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_size = 5000
+        self.settle_seconds = 30
+        self.gap_seconds = 3600
+        self.max_batches = 20
+
+    def init_app(self, app):
+        super().init_app(app)
+        # The thread is started by the first request each worker serves, not by CLI commands
+        app.before_request(self.ensure_started)
+
+    def configure(self, config):
+        self.interval = config['ROLLUP_INTERVAL']
+        self.batch_size = config['ROLLUP_BATCH_SIZE']
+        self.settle_seconds = config['ROLLUP_SETTLE_SECONDS']
+        self.gap_seconds = config['ROLLUP_GAP_SECONDS']
+
+    def flush(self):
+        catch_up(self.batch_size, self.settle_seconds, self.max_batches, self.gap_seconds)
+
+    def shutdown(self):
+        # Nothing is buffered in memory; the next process resumes from the stored position
+        if self._pid == os.getpid():
+            self._stopping.set()
+            self._wakeup.set()
+
+
+download_rollups = RollupUpdater()
+
+@click.command('rebuild-download-rollups')
+@with_appcontext
+def rebuild_download_rollups_command():
+    """Recompute the download rollups from the complete download history."""
+    counted = rebuild()
+    click.echo(f'Counted {counted} downloads')
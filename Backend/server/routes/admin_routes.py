@@ -1,17 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from server.models import db, User, Repository, ShareLink, DownloadLog, AppSettings
+from server.models import db, User, Repository, ShareLink, AppSettings, LinkAccessLog
+from server import storage, queries, tags, analytics, tombstones
+from server.pagination import paginate, list_response
+from server.routes.repositories import REPOSITORY_SORT_COLUMNS
+from server.thumbnails import thumbnail_worker
+from server.passwords import password_hasher
+from server.authz import is_super_admin
+from server.writebehind import log_writer, view_counter
+from server.cache import payload_cache, bump_repository, invalidate_user
 import os
 import uuid
-import shutil
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
-# Helper function to check if user is super admin
-def is_super_admin():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    return user and user.role == 'super_admin'
+USER_SORT_COLUMNS = {'id': User.id, 'username': User.username, 'created_at': User.created_at}
+SHARE_LINK_SORT_COLUMNS = {'id': ShareLink.id, 'created_at': ShareLink.created_at}
+VIEWER_SORT_COLUMNS = {'accessed_at': LinkAccessLog.accessed_at}
 
 # Get all users (super admin only)
 @admin_bp.route('/users', methods=['GET'])
@@ -20,15 +25,15 @@ def get_all_users():
     if not is_super_admin():
         return jsonify({'error': 'Super admin access required'}), 403
     
-    users = User.query.all()
-    return jsonify([{
+    page = paginate(User.query, USER_SORT_COLUMNS, 'id', User.id)
+    return list_response(page, lambda user: {
         'id': user.id,
         'username': user.username,
         'email': user.email,
         'role': user.role,
         'is_approved': user.is_approved,
         'created_at': user.created_at.isoformat()
-    } for user in users])
+    })
 
 # Approve/reject user
 @admin_bp.route('/users/<int:user_id>/approve', methods=['POST'])
@@ -42,6 +47,7 @@ def approve_user(user_id):
     
     user.is_approved = data.get('approved', True)
     db.session.commit()
+    invalidate_user(user.id)
     
     return jsonify({'message': 'User status updated', 'is_approved': user.is_approved})
 
@@ -67,11 +73,10 @@ def create_user():
         return jsonify({'error': 'Email already exists'}), 400
     
     # Create user
-    from werkzeug.security import generate_password_hash
     user = User(
         username=data['username'],
         email=data['email'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_hasher.hash(data['password']),
         role=data.get('role', 'user'),  # Can set role
         is_approved=True  # Auto-approve admin-created users
     )
@@ -96,16 +101,19 @@ def get_all_repositories():
     if not is_super_admin():
         return jsonify({'error': 'Super admin access required'}), 403
     
-    repos = Repository.query.all()
-    return jsonify([{
-        'id': repo.id,
-        'name': repo.name,
-        'description': repo.description,
-        'owner': repo.owner.username,
-        'owner_id': repo.owner_id,
-        'files_count': len(repo.files),
-        'created_at': repo.created_at.isoformat()
-    } for repo in repos])
+    page = paginate(
+        queries.repositories_with_file_counts(include_owner=True), REPOSITORY_SORT_COLUMNS,
+        'id', Repository.id, entity=lambda row: row[0]
+    )
+    return list_response(page, lambda row: {
+        'id': row[0].id,
+        'name': row[0].name,
+        'description': row[0].description,
+        'owner': row[0].owner.username,
+        'owner_id': row[0].owner_id,
+        'files_count': row[1],
+        'created_at': row[0].created_at.isoformat()
+    })
 
 # Create repository (super admin)
 @admin_bp.route('/repositories/create', methods=['POST'])
@@ -142,7 +150,6 @@ def upload_file_admin(repo_id):
         return jsonify({'error': 'Super admin access required'}), 403
     
     from werkzeug.utils import secure_filename
-    from flask import current_app
     
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -154,33 +161,32 @@ def upload_file_admin(repo_id):
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
-    # Generate unique filename
     original_filename = secure_filename(file.filename)
     file_ext = original_filename.rsplit('.', 1)[1].lower()
-    unique_filename = f"{uuid.uuid4()}.{file_ext}"
-    
-    # Create repository folder
-    repo_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(repo_id))
-    os.makedirs(repo_folder, exist_ok=True)
     
-    file_path = os.path.join(repo_folder, unique_filename)
-    file.save(file_path)
+    # Hash while copying, then keep one copy per distinct content
+    blob = storage.store_staged(storage.stage_stream(file.stream))
     
     # Save to database
-    from models import File
+    from server.models import File
     file_obj = File(
-        filename=unique_filename,
+        filename=os.path.basename(blob.path),
         original_filename=original_filename,
-        file_path=file_path,
+        file_path=blob.path,
         file_type=file_ext,
-        file_size=os.path.getsize(file_path),
+        file_size=blob.size,
         repository_id=repo_id,
         uploaded_by=admin_id,
-        tags=request.form.get('tags', '')
+        tags=request.form.get('tags', ''),
+        sha256=blob.sha256,
+        blob_id=blob.id
     )
     
     db.session.add(file_obj)
+    tags.tag_files([file_obj])
+    bump_repository(repo_id)
     db.session.commit()
+    thumbnail_worker.schedule(file_obj)
     
     return jsonify({
         'id': file_obj.id,
@@ -188,65 +194,34 @@ def upload_file_admin(repo_id):
         'file_type': file_obj.file_type
     }), 201
 
-# Delete repository (super admin)
+# Delete repository (super admin): hidden at once, rows and files are purged in the background
 @admin_bp.route('/repositories/<int:repo_id>', methods=['DELETE'])
 @jwt_required()
 def delete_repository_admin(repo_id):
     if not is_super_admin():
         return jsonify({'error': 'Super admin access required'}), 403
     
-    try:
-        repo = Repository.query.get_or_404(repo_id)
-        
-        # Import models
-        from server.models import File, ShareLink, Meeting, DownloadLog, LinkAccessLog
-        
-        # Delete in correct order (most dependent first)
-        
-        # 1. Delete LinkAccessLog entries
-        LinkAccessLog.query.filter(
-            LinkAccessLog.share_link_id.in_(
-                db.session.query(ShareLink.id).filter_by(repository_id=repo_id)
-            )
-        ).delete(synchronize_session=False)
-        
-        # 2. Delete DownloadLog entries
-        DownloadLog.query.filter_by(repository_id=repo_id).delete(synchronize_session=False)
-        
-        # 3. Delete ShareLink entries
-        ShareLink.query.filter_by(repository_id=repo_id).delete(synchronize_session=False)
-        
-        # 4. Delete Meeting entries
-        Meeting.query.filter_by(repository_id=repo_id).delete(synchronize_session=False)
-        
-        # 5. Delete File entries
-        File.query.filter_by(repository_id=repo_id).delete(synchronize_session=False)
-        
-        # Commit these deletions first
-        db.session.commit()
-        
-        # Delete physical files from disk
-        from flask import current_app
-        repo_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(repo_id))
-        if os.path.exists(repo_folder):
-            try:
-                shutil.rmtree(repo_folder)
-                print(f"Deleted folder: {repo_folder}")
-            except Exception as e:
-                print(f"Warning: Could not delete folder {repo_folder}: {e}")
-        
-        # Finally delete the repository itself
-        db.session.delete(repo)
-        db.session.commit()
-        
-        return jsonify({'message': 'Repository deleted successfully'}), 200
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error deleting repository: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': f'Failed to delete repository: {str(e)}'}), 500
+    repo = Repository.query.get_or_404(repo_id)
+    bump_repository(repo_id)
+    tombstones.delete_repository(repo, get_jwt_identity())
+    
+    return jsonify({
+        'message': 'Repository deleted successfully',
+        'status_url': url_for('admin.get_repository_deletion', repo_id=repo_id)
+    }), 202
+
+# Progress of a repository deletion
+@admin_bp.route('/repositories/<int:repo_id>/deletion', methods=['GET'])
+@jwt_required()
+def get_repository_deletion(repo_id):
+    if not is_super_admin():
+        return jsonify({'error': 'Super admin access required'}), 403
+    
+    repo = tombstones.get_tombstone(repo_id)
+    if repo is None or repo.deleted_at is None:
+        return jsonify({'error': 'Repository has not been deleted'}), 404
+    
+    return jsonify(tombstones.purge_status(repo))
 
 # Get all share links
 @admin_bp.route('/share-links', methods=['GET'])
@@ -255,8 +230,8 @@ def get_all_share_links():
     if not is_super_admin():
         return jsonify({'error': 'Super admin access required'}), 403
     
-    links = ShareLink.query.all()
-    return jsonify([{
+    page = paginate(queries.share_links_with_relations(), SHARE_LINK_SORT_COLUMNS, 'id', ShareLink.id)
+    return list_response(page, lambda link: {
         'id': link.id,
         'token': link.token,
         'repository_name': link.repository.name,
@@ -264,10 +239,10 @@ def get_all_share_links():
         'permission': link.permission,
         'created_by': link.creator.username,
         'is_active': link.is_active,
-        'view_count': link.view_count,
+        'view_count': (link.view_count or 0) + view_counter.pending(link.id),
         'expires_at': link.expires_at.isoformat() if link.expires_at else None,
         'created_at': link.created_at.isoformat()
-    } for link in links])
+    })
 
 # Revoke share link
 @admin_bp.route('/share-links/<int:link_id>/revoke', methods=['POST'])
@@ -301,15 +276,15 @@ def get_link_viewers(link_id):
     if not is_super_admin():
         return jsonify({'error': 'Super admin access required'}), 403
     
-    from server.models import LinkAccessLog
-    viewers = LinkAccessLog.query.filter_by(share_link_id=link_id).order_by(LinkAccessLog.accessed_at.desc()).all()
+    page = paginate(LinkAccessLog.query.filter_by(share_link_id=link_id), VIEWER_SORT_COLUMNS,
+                    '-accessed_at', LinkAccessLog.id)
     
-    return jsonify([{
+    return list_response(page, lambda viewer: {
         'id': viewer.id,
         'email': viewer.email,
         'ip_address': viewer.ip_address,
         'accessed_at': viewer.accessed_at.isoformat()
-    } for viewer in viewers])
+    })
 
 # Get download statistics
 @admin_bp.route('/downloads', methods=['GET'])
@@ -318,14 +293,8 @@ def get_download_stats():
     if not is_super_admin():
         return jsonify({'error': 'Super admin access required'}), 403
     
-    # Get downloads grouped by repository
-    downloads = db.session.query(
-        Repository.id,
-        Repository.name,
-        db.func.count(DownloadLog.id).label('download_count')
-    ).join(
-        DownloadLog, Repository.id == DownloadLog.repository_id
-    ).group_by(Repository.id).all()
+    # Per-repository totals from the rollups; the raw log is never scanned here
+    downloads = queries.repository_download_totals().all()
     
     return jsonify([{
         'repository_id': repo_id,
@@ -333,6 +302,38 @@ def get_download_stats():
         'download_count': count
     } for repo_id, repo_name, count in downloads])
 
+# Downloads or share-link views over time for one repository, file or share link
+@admin_bp.route('/analytics', methods=['GET'])
+@jwt_required()
+def get_analytics():
+    if not is_super_admin():
+        return jsonify({'error': 'Super admin access required'}), 403
+    
+    metric = request.args.get('metric', 'downloads')
+    scope = request.args.get('scope', 'repository')
+    scope_id = request.args.get('id', type=int)
+    interval = request.args.get('interval', 'hour')
+    if scope_id is None:
+        return jsonify({'error': 'id is required'}), 400
+    
+    try:
+        start, end = analytics.window(interval, request.args.get('start'), request.args.get('end'),
+                                      current_app.config['ANALYTICS_MAX_BUCKETS'])
+        points = analytics.series(metric, scope, scope_id, interval, start, end)
+    except analytics.AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'metric': metric,
+        'scope': scope,
+        'id': scope_id,
+        'interval': interval,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'total': sum(point['count'] for point in points),
+        'points': points
+    })
+
 # Upload logo
 @admin_bp.route('/settings/logo', methods=['POST'])
 @jwt_required()
@@ -369,4 +370,18 @@ def upload_logo():
         'message': 'Logo uploaded successfully',
         'filename': filename,
         'url': f'/static/logos/{filename}'
-    })
\ No newline at end of file
+    })
+
+# Internal counters for background subsystems
+@admin_bp.route('/system', methods=['GET'])
+@jwt_required()
+def get_system_stats():
+    if not is_super_admin():
+        return jsonify({'error': 'Super admin access required'}), 403
+    
+    return jsonify({
+        'log_writer': log_writer.stats(),
+        'view_counter': view_counter.stats(),
+        'share_payload_cache': payload_cache.stats(),
+        'thumbnails_pending': thumbnail_worker.pending()
+    })
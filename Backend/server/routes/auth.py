@@ -1,10 +1,13 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
 from server.models import User
 from server.extensions import db
+from server.passwords import password_hasher, HashingBusy
+from server.authz import token_claims
 
 auth_bp = Blueprint('auth', __name__)
+log = logging.getLogger(__name__)
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -19,7 +22,7 @@ def register():
     user = User(
         username=data['username'],
         email=data['email'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_hasher.hash(data['password']),
         is_approved=False
     )
     
@@ -35,29 +38,33 @@ def register():
 @auth_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
-    print(f"🔍 Login attempt - Username: {data.get('username')}")
     
     user = User.query.filter_by(username=data['username']).first()
-    print(f"🔍 User found: {user is not None}")
     
     if not user:
-        print("❌ User not found")
+        log.info('Login failed: unknown user', extra={'username': data.get('username')})
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    password_valid = check_password_hash(user.password_hash, data['password'])
-    print(f"🔍 Password valid: {password_valid}")
+    password_valid = password_hasher.check(user.password_hash, data['password'])
     
     if not password_valid:
-        print("❌ Invalid password")
+        log.info('Login failed: wrong password', extra={'user_id': user.id})
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    print(f"🔍 User approved: {user.is_approved}")
+    # Upgrade hashes made with older parameters while the plain password is at hand
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = password_hasher.hash(data['password'])
+            db.session.commit()
+        except HashingBusy:
+            pass  # the next login tries again
     
     if not user.is_approved:
+        log.info('Login refused: pending approval', extra={'user_id': user.id})
         return jsonify({'error': 'Your account is pending approval'}), 403
     
-    print("✅ Creating access token")
-    access_token = create_access_token(identity=user.id)
+    log.debug('Login succeeded', extra={'user_id': user.id})
+    access_token = create_access_token(identity=user.id, additional_claims=token_claims(user))
     
     return jsonify({
         'access_token': access_token,
@@ -1,17 +1,47 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file, abort
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 import os
+import re
+import logging
 import uuid
-from server.models import Repository, File, DownloadLog, ShareLink
+import hashlib
+from server.models import Repository, File, DownloadLog, UploadSession, Thumbnail
 from server.extensions import db
+from server import storage, tags, queries
+from server.storage import COPY_BUFFER_SIZE
+from server.ranges import send_file_ranged
+from server.writebehind import log_writer
+from server.cache import resolve_share_link, bump_repository
+from server.thumbnails import thumbnail_worker, retry_due, supports as thumbnail_supported
+from server.uploads import running_hashes
 
 files_bp = Blueprint('files', __name__)
+log = logging.getLogger(__name__)
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
 
 def allowed_file(filename):
     allowed_extensions = current_app.config['ALLOWED_EXTENSIONS']
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def parse_content_range(header):
+    """Parse 'bytes start-end/total' into a (start, end, total) tuple, or None."""
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    start, end, total = (int(v) for v in match.groups())
+    if start > end or end >= total:
+        return None
+    return start, end, total
+
+def _discard_upload(upload):
+    running_hashes.drop(upload.id)
+    if os.path.exists(upload.file_path):
+        os.remove(upload.file_path)
+    db.session.delete(upload)
+    db.session.commit()
+
 @files_bp.route('/repositories/<int:repo_id>/upload', methods=['POST'])
 @jwt_required()
 def upload_file(repo_id):
@@ -29,100 +59,395 @@ def upload_file(repo_id):
     if not allowed_file(file.filename):
         return jsonify({'error': 'File type not allowed'}), 400
     
-    # Generate unique filename
     original_filename = secure_filename(file.filename)
     file_ext = original_filename.rsplit('.', 1)[1].lower()
-    unique_filename = f"{uuid.uuid4()}.{file_ext}"
     
-    # Create repository folder if it doesn't exist
-    repo_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(repo_id))
-    os.makedirs(repo_folder, exist_ok=True)
-    
-    file_path = os.path.join(repo_folder, unique_filename)
-    file.save(file_path)
-    
-    # Get file size
-    file_size = os.path.getsize(file_path)
+    # Hash while copying, then keep one copy per distinct content
+    blob = storage.store_staged(storage.stage_stream(file.stream))
     
     # Save to database
     file_obj = File(
-        filename=unique_filename,
+        filename=os.path.basename(blob.path),
         original_filename=original_filename,
-        file_path=file_path,
+        file_path=blob.path,
         file_type=file_ext,
-        file_size=file_size,
+        file_size=blob.size,
         repository_id=repo_id,
         uploaded_by=user_id,
-        tags=request.form.get('tags', '')
+        tags=request.form.get('tags', ''),
+        sha256=blob.sha256,
+        blob_id=blob.id
     )
     
     db.session.add(file_obj)
+    tags.tag_files([file_obj])
+    bump_repository(repo_id)
     db.session.commit()
+    thumbnail_worker.schedule(file_obj)
+    
+    return jsonify(file_obj.to_dict(include_uploader=True)), 201
+
+# Upload many files in one request: parts are written to disk in parallel and
+# recorded in a single transaction; the result lists the outcome of every part
+@files_bp.route('/repositories/<int:repo_id>/upload/batch', methods=['POST'])
+@jwt_required()
+def upload_files_batch(repo_id):
+    user_id = get_jwt_identity()
+    repo = Repository.query.get_or_404(repo_id)
+
+    parts = request.files.getlist('files') or request.files.getlist('file')
+    if not parts:
+        return jsonify({'error': 'No files provided'}), 400
+
+    max_files = current_app.config['UPLOAD_BATCH_MAX_FILES']
+    if len(parts) > max_files:
+        return jsonify({'error': f'At most {max_files} files per batch'}), 400
+
+    results = [None] * len(parts)
+    accepted = []
+    for index, part in enumerate(parts):
+        if part.filename == '':
+            results[index] = {'index': index, 'filename': '', 'error': 'No file selected'}
+        elif not allowed_file(secure_filename(part.filename)):
+            # Checked after sanitizing so one odd name cannot fail the whole batch
+            results[index] = {'index': index, 'filename': part.filename, 'error': 'File type not allowed'}
+        else:
+            accepted.append((index, part, secure_filename(part.filename)))
+
+    staged = storage.stage_many([part.stream for _, part, _ in accepted])
+
+    tag_text = request.form.get('tags', '')
+    created = []
+    for (index, part, original_filename), outcome in zip(accepted, staged):
+        if isinstance(outcome, OSError):
+            results[index] = {'index': index, 'filename': original_filename, 'error': 'Could not store file'}
+            continue
+
+        blob = storage.store_staged(outcome)
+        file_obj = File(
+            filename=os.path.basename(blob.path),
+            original_filename=original_filename,
+            file_path=blob.path,
+            file_type=original_filename.rsplit('.', 1)[1].lower(),
+            file_size=blob.size,
+            repository_id=repo_id,
+            uploaded_by=user_id,
+            tags=tag_text,
+            sha256=blob.sha256,
+            blob_id=blob.id
+        )
+        db.session.add(file_obj)
+        created.append((index, file_obj))
+
+    tags.tag_files([file_obj for _, file_obj in created])
     
+    # Serialize before committing so the rows are not reloaded one by one afterwards
+    jobs = []
+    for index, file_obj in created:
+        results[index] = {'index': index, 'filename': file_obj.original_filename, 'file': file_obj.to_dict()}
+        jobs.append((file_obj.id, file_obj.file_type))
+    if created:
+        bump_repository(repo_id)
+    db.session.commit()
+
+    for file_id, file_type in jobs:
+        thumbnail_worker.submit(file_id, file_type)
+
+    failed = len(parts) - len(created)
+    status = 201 if not failed else (207 if created else 400)
+    return jsonify({'uploaded': len(created), 'failed': failed, 'results': results}), status
+
+# Start a resumable upload: the client then PUTs byte ranges and finalizes
+@files_bp.route('/repositories/<int:repo_id>/uploads', methods=['POST'])
+@jwt_required()
+def create_upload_session(repo_id):
+    user_id = get_jwt_identity()
+    repo = Repository.query.get_or_404(repo_id)
+    data = request.get_json() or {}
+
+    filename = data.get('filename') or ''
+    if filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+
+    total_size = data.get('size')
+    if not isinstance(total_size, int) or total_size <= 0:
+        return jsonify({'error': 'A positive file size is required'}), 400
+
+    if total_size > current_app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'error': 'File is too large'}), 413
+
+    original_filename = secure_filename(filename)
+    file_ext = original_filename.rsplit('.', 1)[1].lower()
+
+    # Content we already store needs no upload at all
+    checksum = (data.get('sha256') or '').lower()
+    blob = storage.find_blob(checksum, size=total_size) if checksum else None
+    # Unless its last reference was released meanwhile; then the content is uploaded again
+    if storage.acquire_blob(blob):
+        file_obj = File(
+            filename=os.path.basename(blob.path),
+            original_filename=original_filename,
+            file_path=blob.path,
+            file_type=file_ext,
+            file_size=blob.size,
+            repository_id=repo.id,
+            uploaded_by=user_id,
+            tags=data.get('tags', ''),
+            sha256=blob.sha256,
+            blob_id=blob.id
+        )
+        db.session.add(file_obj)
+        tags.tag_files([file_obj])
+        bump_repository(repo.id)
+        db.session.commit()
+        thumbnail_worker.schedule(file_obj)
+        return jsonify({'complete': True, 'file': file_obj.to_dict(include_uploader=True)}), 201
+
+    file_path = storage.staging_path(file_ext)
+    unique_filename = os.path.basename(file_path)
+
+    # Reserve the full size up front so every chunk is written at its final offset
+    with open(file_path, 'wb') as f:
+        f.truncate(total_size)
+
+    upload = UploadSession(
+        id=str(uuid.uuid4()),
+        repository_id=repo.id,
+        uploaded_by=user_id,
+        filename=unique_filename,
+        original_filename=original_filename,
+        file_path=file_path,
+        file_type=file_ext,
+        tags=data.get('tags', ''),
+        total_size=total_size,
+        received_size=0
+    )
+
+    db.session.add(upload)
+    db.session.commit()
+
+    running_hashes.put(upload.id, 0, hashlib.sha256())
+
+    response = upload.to_dict()
+    response['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(response), 201
+
+# Current offset of an upload, used by clients to resume after a dropped connection
+@files_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(upload_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+
+    if upload.uploaded_by != get_jwt_identity():
+        return jsonify({'error': 'Access denied'}), 403
+
+    return jsonify(upload.to_dict())
+
+# Write one chunk; the body is the raw bytes described by Content-Range
+@files_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+
+    if upload.uploaded_by != get_jwt_identity():
+        return jsonify({'error': 'Access denied'}), 403
+
+    byte_range = parse_content_range(request.headers.get('Content-Range'))
+    if byte_range is None:
+        return jsonify({'error': 'A valid Content-Range header is required'}), 400
+
+    start, end, total = byte_range
+    if total != upload.total_size:
+        return jsonify({'error': 'Content-Range total does not match the upload size'}), 400
+
+    # Chunks are accepted in order only, so the client resumes from the offset we report
+    if start != upload.received_size:
+        return jsonify({'error': 'Unexpected chunk offset', 'offset': upload.received_size}), 409
+
+    hasher = running_hashes.take(upload.id)
+    if hasher and hasher[0] != start:
+        hasher = None
+    sha = hasher[1] if hasher else None
+
+    # Read straight from the socket into the file: nothing is spooled or buffered whole
+    expected = end - start + 1
+    written = 0
+    with open(upload.file_path, 'r+b') as f:
+        f.seek(start)
+        while written < expected:
+            block = request.stream.read(min(COPY_BUFFER_SIZE, expected - written))
+            if not block:
+                break
+            f.write(block)
+            if sha:
+                sha.update(block)
+            written += len(block)
+
+    # Record progress even for a short chunk so the client can resume from there
+    updated = UploadSession.query.filter_by(id=upload.id, received_size=start).update(
+        {'received_size': start + written}, synchronize_session=False
+    )
+    db.session.commit()
+
+    if not updated:
+        return jsonify({'error': 'Concurrent write to this upload'}), 409
+
+    if sha:
+        running_hashes.put(upload.id, start + written, sha)
+
+    db.session.refresh(upload)
+    status = 200 if written == expected else 400
+    return jsonify(upload.to_dict()), status
+
+# Finish an upload and create the File record
+@files_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+
+    if upload.uploaded_by != get_jwt_identity():
+        return jsonify({'error': 'Access denied'}), 403
+
+    if upload.received_size < upload.total_size:
+        return jsonify({'error': 'Upload is incomplete', 'offset': upload.received_size}), 409
+
+    # The repository may have been deleted while the upload was in progress
+    if db.session.get(Repository, upload.repository_id) is None:
+        return jsonify({'error': 'Repository not found'}), 404
+
+    hasher = running_hashes.take(upload.id)
+
+    # Chunks that landed on another worker leave no running hash here: read the file once instead
+    if hasher and hasher[0] == upload.total_size:
+        checksum = hasher[1].hexdigest()
+    else:
+        checksum = storage.hash_file(upload.file_path)
+
+    data = request.get_json(silent=True) or {}
+    expected_checksum = data.get('sha256')
+    if expected_checksum and expected_checksum.lower() != checksum:
+        _discard_upload(upload)
+        return jsonify({'error': 'Checksum mismatch, upload discarded'}), 400
+
+    blob = storage.store_staged(storage.StagedFile(upload.file_path, checksum, upload.total_size))
+
+    file_obj = File(
+        filename=os.path.basename(blob.path),
+        original_filename=upload.original_filename,
+        file_path=blob.path,
+        file_type=upload.file_type,
+        file_size=blob.size,
+        repository_id=upload.repository_id,
+        uploaded_by=upload.uploaded_by,
+        tags=upload.tags,
+        sha256=blob.sha256,
+        blob_id=blob.id
+    )
+
+    db.session.add(file_obj)
+    tags.tag_files([file_obj])
+    db.session.delete(upload)
+    bump_repository(file_obj.repository_id)
+    db.session.commit()
+    thumbnail_worker.schedule(file_obj)
+
     return jsonify(file_obj.to_dict(include_uploader=True)), 201
 
+# Abandon an upload and free its disk space
+@files_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_upload(upload_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+
+    if upload.uploaded_by != get_jwt_identity():
+        return jsonify({'error': 'Access denied'}), 403
+
+    _discard_upload(upload)
+    return jsonify({'message': 'Upload cancelled'})
+
 @files_bp.route('/<int:file_id>/download', methods=['GET'])
 def download_file(file_id):
-    print(f"\n{'='*60}")
-    print(f"DOWNLOAD REQUEST RECEIVED")
-    print(f"File ID: {file_id}")
-    print(f"Request path: {request.path}")
-    print(f"Request args: {request.args}")
-    print(f"{'='*60}\n")
-    
     try:
-        file_obj = File.query.get(file_id)
+        file_obj = queries.visible_file(file_id)
         
         if not file_obj:
-            print(f"❌ ERROR: File with ID {file_id} not found in database")
+            log.info('Download of unknown file', extra={'file_id': file_id})
             return jsonify({'error': f'File with ID {file_id} not found'}), 404
         
-        print(f"✅ Found file in database:")
-        print(f"   - Original filename: {file_obj.original_filename}")
-        print(f"   - Stored filename: {file_obj.filename}")
-        print(f"   - File path: {file_obj.file_path}")
-        print(f"   - Repository ID: {file_obj.repository_id}")
-        
         # Check if file exists on disk
         if not os.path.exists(file_obj.file_path):
-            print(f"❌ ERROR: File not found on disk at: {file_obj.file_path}")
+            log.warning('File missing on disk', extra={'file_id': file_id, 'path': file_obj.file_path})
             return jsonify({'error': 'File not found on server'}), 404
         
-        print(f"✅ File exists on disk")
-        
-        # Log the download
+        # Resolve the share link, if any
         share_token = request.args.get('share_token')
         share_link = None
         
         if share_token:
-            share_link = ShareLink.query.filter_by(token=share_token).first()
-            print(f"   - Share token found: {share_token}")
+            share_link = resolve_share_link(share_token)
         
-        download_log = DownloadLog(
-            file_id=file_id,
-            share_link_id=share_link.id if share_link else None,
-            repository_id=file_obj.repository_id,
-            ip_address=request.remote_addr
-        )
-        db.session.add(download_log)
-        db.session.commit()
+        file_path = storage.absolute_path(file_obj.file_path)
         
-        print(f"✅ Download log created")
-        print(f"   - Sending file from: {os.path.dirname(file_obj.file_path)}")
-        print(f"   - Filename: {file_obj.filename}")
+        # Strong validator: the content hash, or id+mtime+size for files stored before hashing
+        etag = file_obj.sha256
+        if not etag:
+            stat = os.stat(file_path)
+            etag = f"{file_obj.id}-{int(stat.st_mtime)}-{stat.st_size}"
         
-        directory = os.path.join(current_app.root_path, os.path.dirname(file_obj.file_path))
-
-        return send_from_directory(
-            directory,
-            file_obj.filename,
-            as_attachment=True,
-            download_name=file_obj.original_filename
-)
+        response = send_file_ranged(file_path, file_obj.original_filename, etag)
+        
+        # Only a full GET is a download; range probes, 304s and HEADs are not logged
+        if request.method == 'GET' and response.status_code == 200:
+            log_writer.add(
+                DownloadLog,
+                file_id=file_id,
+                share_link_id=share_link.id if share_link else None,
+                repository_id=file_obj.repository_id,
+                ip_address=request.remote_addr
+            )
+        
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Download', extra={
+                'file_id': file_id, 'repository_id': file_obj.repository_id, 'path': file_path,
+                'share_link_id': share_link.id if share_link else None, 'status': response.status_code
+            })
+        return response
     except Exception as e:
-        print(f"\n❌ EXCEPTION in download_file:")
-        print(f"   Error type: {type(e).__name__}")
-        print(f"   Error message: {str(e)}")
-        import traceback
-        print(f"   Traceback:\n{traceback.format_exc()}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        log.exception('Download of file %s failed', file_id)
+        return jsonify({'error': str(e)}), 500
+
+# Small JPEG rendition of a file; rendered in the background on first request if missing
+@files_bp.route('/<int:file_id>/thumbnail', methods=['GET'])
+def get_thumbnail(file_id):
+    size = request.args.get('size', 'small')
+    if size not in current_app.config['THUMBNAIL_SIZES']:
+        return jsonify({'error': f"Unknown thumbnail size '{size}'"}), 400
+    
+    file_obj = queries.visible_file(file_id)
+    if file_obj is None:
+        abort(404)
+    if not thumbnail_supported(file_obj.file_type):
+        return jsonify({'error': 'No thumbnail available for this file type'}), 404
+    
+    thumb = Thumbnail.query.filter_by(file_id=file_id, size=size).first()
+    if thumb and thumb.status == 'ready':
+        path = storage.absolute_path(thumb.path)
+        if os.path.exists(path):
+            response = send_file(
+                path,
+                mimetype='image/jpeg',
+                etag=f"{file_obj.sha256 or file_obj.id}-{size}",
+                max_age=current_app.config['THUMBNAIL_MAX_AGE'],
+                conditional=True
+            )
+            response.cache_control.public = True
+            return response
+    elif thumb and thumb.status == 'failed' and not retry_due(thumb):
+        return jsonify({'error': 'Thumbnail could not be generated'}), 404
+    
+    # Missing, deleted from disk or failed long enough ago: regenerate, the client retries shortly
+    thumbnail_worker.schedule(file_obj)
+    return jsonify({'status': 'pending'}), 202, {'Retry-After': '2'}
@@ -1,9 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 import secrets
-from server.models import Repository, ShareLink, Meeting, User
+from server.models import Repository, ShareLink, Meeting, File
 from server.extensions import db
+from server import queries
+from server.authz import current_user
+from server.tags import parse_tags, repository_facets
+from server.archive import archive_entries, log_export, zip_response
+from server.thumbnails import supports as thumbnail_supported
+from server.pagination import paginate, list_response, serialize_page
+
+REPOSITORY_SORT_COLUMNS = {'id': Repository.id, 'created_at': Repository.created_at}
+FILE_SORT_COLUMNS = {'id': File.id, 'created_at': File.created_at}
+
+def requested_tags():
+    """Tags from ?tag= (repeatable, or comma-separated) that listed files must all carry."""
+    return [name for value in request.args.getlist('tag') for name in parse_tags(value)]
 
 repositories_bp = Blueprint('repositories', __name__)
 
@@ -11,16 +24,19 @@ repositories_bp = Blueprint('repositories', __name__)
 @jwt_required()
 def get_repositories():
     user_id = get_jwt_identity()
-    repos = Repository.query.filter_by(owner_id=user_id).all()
+    page = paginate(
+        queries.repositories_with_file_counts(owner_id=user_id), REPOSITORY_SORT_COLUMNS,
+        'id', Repository.id, entity=lambda row: row[0]
+    )
     
-    return jsonify([{
-        'id': repo.id,
-        'name': repo.name,
-        'description': repo.description,
-        'type': repo.repo_type,
-        'files': len(repo.files),
-        'created_at': repo.created_at.isoformat()
-    } for repo in repos])
+    return list_response(page, lambda row: {
+        'id': row[0].id,
+        'name': row[0].name,
+        'description': row[0].description,
+        'type': row[0].repo_type,
+        'files': row[1],
+        'created_at': row[0].created_at.isoformat()
+    })
 
 @repositories_bp.route('', methods=['POST'])
 @jwt_required()
@@ -50,26 +66,32 @@ def create_repository():
 @jwt_required()
 def get_repository(repo_id):
     user_id = get_jwt_identity()
-    repo = Repository.query.get_or_404(repo_id)
-    user = User.query.get(user_id)
+    repo = queries.repository_detail(repo_id)
+    user = current_user()
 
     # Check if user has access
     if repo.owner_id != user_id and user.role != 'super_admin':
         return jsonify({'error': 'Access denied'}), 403
     
+    files = paginate(queries.repository_files(repo.id, include_uploader=True, tags=requested_tags()),
+                     FILE_SORT_COLUMNS, 'id', File.id)
+    
     return jsonify({
         'id': repo.id,
         'name': repo.name,
         'description': repo.description,
         'type': repo.repo_type,
-        'files': [{
+        'files': serialize_page(files, lambda f: {
             'id': f.id,
             'filename': f.original_filename,
             'file_type': f.file_type,
             'file_size': f.file_size,
+            'tags': f.tags,
+            'thumbnail_url': url_for('files.get_thumbnail', file_id=f.id) if thumbnail_supported(f.file_type) else None,
             'uploaded_by': f.uploader.username,
             'created_at': f.created_at.isoformat()
-        } for f in repo.files],
+        }),
+        'next_files_cursor': files.next_cursor,
         'meetings': [{
             'id': m.id,
             'title': m.title,
@@ -80,6 +102,34 @@ def get_repository(repo_id):
         'created_at': repo.created_at.isoformat()
     })
 
+# Tag facets: how many files carry each tag in this repository
+@repositories_bp.route('/<int:repo_id>/tags', methods=['GET'])
+@jwt_required()
+def get_repository_tags(repo_id):
+    user_id = get_jwt_identity()
+    repo = Repository.query.get_or_404(repo_id)
+    user = current_user()
+    
+    if repo.owner_id != user_id and user.role != 'super_admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify([{'tag': name, 'count': count} for name, count in repository_facets(repo.id)])
+
+# Download the whole repository as a ZIP streamed on the fly
+@repositories_bp.route('/<int:repo_id>/archive', methods=['GET'])
+@jwt_required()
+def download_repository_archive(repo_id):
+    user_id = get_jwt_identity()
+    repo = Repository.query.get_or_404(repo_id)
+    user = current_user()
+    
+    if repo.owner_id != user_id and user.role != 'super_admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    entries = archive_entries(queries.repository_files(repo.id).order_by(File.id))
+    log_export(entries, repo.id)
+    return zip_response(entries, repo.name)
+
 @repositories_bp.route('/<int:repo_id>/share', methods=['POST'])
 @jwt_required()
 def create_share_link(repo_id):
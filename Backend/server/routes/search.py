@@ -0,0 +1,33 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from server.authz import current_user
+from server.search import SEARCH_KINDS, search_terms, search_query
+from server.pagination import paginate, list_response
+
+search_bp = Blueprint('search', __name__)
+
+# Ranked full-text search over file names and tags, repositories and meetings
+@search_bp.route('', methods=['GET'])
+@jwt_required()
+def search():
+    user = current_user()
+    
+    terms = search_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({'error': 'A search query is required'}), 400
+    
+    kind = request.args.get('type')
+    if kind and kind not in SEARCH_KINDS:
+        return jsonify({'error': f"type must be one of: {', '.join(SEARCH_KINDS)}"}), 400
+    
+    query, results = search_query(terms, user, kind=kind, repository_id=request.args.get('repository_id', type=int))
+    page = paginate(query, {'rank': results.c.score}, '-rank', results.c.id, paged_by_default=True)
+    
+    return list_response(page, lambda row: {
+        'type': row.kind,
+        'id': row.object_id,
+        'title': row.title,
+        'repository_id': row.repository_id,
+        'repository_name': row.repository_name,
+        'score': row.score
+    })
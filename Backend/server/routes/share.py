@@ -1,22 +1,49 @@
-from flask import Blueprint, jsonify,  request
+from flask import Blueprint, jsonify,  request, abort, Response, current_app, url_for
 from datetime import datetime
-from server.models import ShareLink, LinkAccessLog
+import hashlib
+from server.models import Repository, LinkAccessLog, File
 from server.extensions import db
+from server import queries
+from server.archive import archive_entries, log_export, zip_response
+from server.cache import resolve_share_link, payload_cache, CachedPayload
+from server.thumbnails import supports as thumbnail_supported
+from server.pagination import paginate, serialize_page, requested_fields
+from server.routes.repositories import FILE_SORT_COLUMNS, requested_tags
+from server.writebehind import log_writer, view_counter
 
 
 share_bp = Blueprint('share', __name__)
 
-@share_bp.route('/<token>', methods=['GET', 'POST'])
-def access_shared_repository(token):
-    share_link = ShareLink.query.filter_by(token=token).first_or_404()
+# Every permission a link can grant includes downloading
+DOWNLOAD_PERMISSIONS = {'view', 'edit', 'admin'}
+
+def _usable_share_link(token):
+    """Resolve token to its snapshot, or return the error response for a dead link."""
+    share_link = resolve_share_link(token)
+    if share_link is None:
+        abort(404)
 
     # Check if link is active
     if not share_link.is_active:
-        return jsonify({'error': 'This share link has been revoked'}), 403
+        return None, (jsonify({'error': 'This share link has been revoked'}), 403)
     
     # Check if link has expired
     if share_link.expires_at and share_link.expires_at < datetime.utcnow():
-        return jsonify({'error': 'Share link has expired'}), 403
+        return None, (jsonify({'error': 'Share link has expired'}), 403)
+    
+    return share_link, None
+
+def _page_key():
+    """The request args the shared view depends on, normalized so their order and any others do not matter."""
+    fields = requested_fields()
+    return (request.args.get('limit'), request.args.get('cursor'), request.args.get('sort'),
+            tuple(sorted(fields)) if fields is not None else None, tuple(sorted(set(requested_tags()))))
+
+@share_bp.route('/<token>', methods=['GET', 'POST'])
+def access_shared_repository(token):
+    share_link, error = _usable_share_link(token)
+    if error:
+        return error
     
     # For POST request, capture email
     email = None
@@ -24,34 +51,71 @@ def access_shared_repository(token):
         data = request.get_json()
         email = data.get('email')
 
-    # Log the access
-    access_log = LinkAccessLog(
+    # Log the access (written in bulk in the background)
+    log_writer.add(
+        LinkAccessLog,
         share_link_id=share_link.id,
         email=email,
         ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent', '')
+        user_agent=request.headers.get('User-Agent', '')[:500]
     )
-    db.session.add(access_log)
-
-    
-     # Increment view count
-    share_link.view_count += 1
-    db.session.commit()
-    
-    repo = share_link.repository
-    
-    return jsonify({
-        'id': repo.id,
-        'name': repo.name,
-        'description': repo.description,
-        'permission': share_link.permission,
-        'requires_email': not email,
-        'files': [{
-            'id': f.id,
-            'filename': f.original_filename,
-            'file_type': f.file_type,
-            'file_size': f.file_size,
-            'created_at': f.created_at.isoformat()
-        } for f in repo.files],
-        'share_token': token
-    })
\ No newline at end of file
+
+
+    # Increment view count (merged into the row in the background)
+    view_counter.increment(share_link.id)
+    
+    # Same link, same email state and same page: reuse the serialized body
+    cache_key = (share_link.id, bool(email), _page_key())
+    generation = share_link.content_version
+    payload = payload_cache.get(cache_key)
+    
+    if payload is None or payload.generation != generation:
+        repo = db.session.get(Repository, share_link.repository_id)
+        if repo is None:
+            abort(404)
+        files = paginate(queries.repository_files(repo.id, tags=requested_tags()), FILE_SORT_COLUMNS, 'id', File.id)
+        
+        body = current_app.json.dumps({
+            'id': repo.id,
+            'name': repo.name,
+            'description': repo.description,
+            'permission': share_link.permission,
+            'requires_email': not email,
+            'files': serialize_page(files, lambda f: {
+                'id': f.id,
+                'filename': f.original_filename,
+                'file_type': f.file_type,
+                'file_size': f.file_size,
+                'thumbnail_url': (url_for('files.get_thumbnail', file_id=f.id)
+                                  if thumbnail_supported(f.file_type) else None),
+                'created_at': f.created_at.isoformat()
+            }),
+            'next_files_cursor': files.next_cursor,
+            'share_token': token
+        }).encode()
+        payload = CachedPayload(repo.id, generation, body, hashlib.sha256(body).hexdigest()[:32])
+        payload_cache.set(cache_key, payload)
+    
+    # The ETag is derived from the bytes, so it is valid across workers
+    response = Response(payload.body, mimetype='application/json')
+    response.set_etag(payload.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# The shared repository as a single streamed ZIP
+@share_bp.route('/<token>/archive', methods=['GET'])
+def download_shared_archive(token):
+    share_link, error = _usable_share_link(token)
+    if error:
+        return error
+    
+    if share_link.permission not in DOWNLOAD_PERMISSIONS:
+        return jsonify({'error': 'This share link does not allow downloads'}), 403
+    
+    repo = db.session.get(Repository, share_link.repository_id)
+    if repo is None:
+        abort(404)
+    
+    entries = archive_entries(queries.repository_files(repo.id).order_by(File.id))
+    log_export(entries, repo.id, share_link_id=share_link.id)
+    return zip_response(entries, repo.name)
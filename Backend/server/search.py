@@ -0,0 +1,82 @@
+import re
+from sqlalchemy import table, column, func, literal, literal_column, union_all, and_, or_
+from server.models import Repository, File, Meeting
+from server.extensions import db
+
+# The index itself is created and kept current by triggers (migration
+# a9c41e7b3d25): an FTS5 table on SQLite, a tsvector column under GIN on Postgres.
+# Other databases have no index; their search reads the source tables with LIKE.
+SEARCH_KINDS = ('file', 'repository', 'meeting')
+MAX_TERMS = 16
+
+sqlite_index = table(
+    'search_index',
+    column('rowid'), column('kind'), column('object_id'), column('repository_id'), column('title')
+)
+postgres_index = table(
+    'search_document',
+    column('id'), column('kind'), column('object_id'), column('repository_id'), column('title'), column('document')
+)
+
+def unindexed_documents():
+    """The search documents built from the source tables on the fly, as the triggers would index them."""
+    return union_all(
+        db.select((File.id * 4 + 1).label('id'), literal('file').label('kind'), File.id.label('object_id'),
+                  File.repository_id.label('repository_id'), File.original_filename.label('title'),
+                  func.coalesce(File.tags, '').label('body')),
+        db.select(Repository.id * 4 + 2, literal('repository'), Repository.id, Repository.id, Repository.name,
+                  func.coalesce(Repository.description, '')),
+        db.select(Meeting.id * 4 + 3, literal('meeting'), Meeting.id, Meeting.repository_id, Meeting.title, literal('')),
+    ).subquery('search_document')
+
+def search_terms(text):
+    """Split user input into plain word terms, dropping any query syntax."""
+    return re.findall(r'\w+', text or '')[:MAX_TERMS]
+
+def search_query(terms, user, kind=None, repository_id=None):
+    """Matching documents the user may see, as a query of (id, kind, object_id,
+    repository_id, title, repository_name, score) rows; higher scores rank first.
+
+    Every term must match, as a word prefix, in the title or body.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        index = sqlite_index
+        row_id = index.c.rowid
+        match = ' '.join(f'"{term}"*' for term in terms)
+        condition = literal_column('search_index').op('MATCH')(match)
+        # bm25 weights are per column: the unindexed ones, then title and body
+        score = -func.bm25(literal_column('search_index'), 0.0, 0.0, 0.0, 10.0, 1.0)
+    elif db.engine.dialect.name == 'postgresql':
+        index = postgres_index
+        row_id = index.c.id
+        tsquery = func.to_tsquery('english', ' & '.join(f'{term}:*' for term in terms))
+        condition = index.c.document.op('@@')(tsquery)
+        score = func.ts_rank(index.c.document, tsquery)
+    else:
+        # Substring matches, unranked: a scan of every source table
+        index = unindexed_documents()
+        row_id = index.c.id
+        condition = and_(*[or_(index.c.title.icontains(term, autoescape=True), index.c.body.icontains(term, autoescape=True))
+                            for term in terms])
+        score = literal(0.0)
+
+    statement = (
+        db.select(
+            row_id.label('id'), index.c.kind, index.c.object_id, index.c.repository_id, index.c.title,
+            Repository.name.label('repository_name'), score.label('score')
+        )
+        .select_from(index)
+        .join(Repository, Repository.id == index.c.repository_id)
+        .where(condition)
+    )
+
+    # Visibility is the same rule get_repository applies
+    if user.role != 'super_admin':
+        statement = statement.where(Repository.owner_id == user.id)
+    if kind:
+        statement = statement.where(index.c.kind == kind)
+    if repository_id:
+        statement = statement.where(index.c.repository_id == repository_id)
+
+    results = statement.subquery('results')
+    return db.session.query(results), results
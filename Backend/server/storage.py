@@ -0,0 +1,185 @@
+import os
+import glob
+import uuid
+import hashlib
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from server.models import Blob, PendingUnlink
+from server.extensions import db
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+# A file written to the staging area whose hash and size are known
+StagedFile = namedtuple('StagedFile', ['path', 'sha256', 'size'])
+
+def blob_path(sha256):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'blobs', sha256[:2], sha256)
+
+def staging_path(extension=''):
+    staging_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'staging')
+    os.makedirs(staging_folder, exist_ok=True)
+    name = uuid.uuid4().hex + (f'.{extension}' if extension else '')
+    return os.path.join(staging_folder, name)
+
+def absolute_path(path):
+    """Resolve a stored path the way downloads do (relative paths are under the app root)."""
+    return os.path.join(current_app.root_path, path)
+
+def rendition_path(path, name):
+    """Where a derived image (thumbnail, preview) of a stored file is kept."""
+    return f'{path}.{name}.jpg'
+
+def _with_renditions(path):
+    return [path] + glob.glob(glob.escape(path) + '.*.jpg')
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def stage_stream(stream, path=None):
+    """Copy a stream to the staging area, hashing it in the same pass."""
+    path = path or staging_path()
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(COPY_BUFFER_SIZE), b''):
+            f.write(block)
+            sha.update(block)
+            size += len(block)
+    return StagedFile(path, sha.hexdigest(), size)
+
+_stage_executor = None
+_stage_executor_pid = None
+_stage_executor_lock = threading.Lock()
+
+def _stage_pool():
+    global _stage_executor, _stage_executor_pid
+    with _stage_executor_lock:
+        if _stage_executor_pid != os.getpid():
+            _stage_executor = ThreadPoolExecutor(
+                max_workers=current_app.config['UPLOAD_BATCH_WORKERS'], thread_name_prefix='stage'
+            )
+            _stage_executor_pid = os.getpid()
+        return _stage_executor
+
+def stage_many(streams):
+    """Stage several streams concurrently on a shared, bounded pool of writer threads.
+
+    Returns one result per stream, in order: a StagedFile, or the OSError that
+    stopped it (its partial copy is removed).
+    """
+    paths = [staging_path() for _ in streams]
+    futures = [_stage_pool().submit(stage_stream, stream, path) for stream, path in zip(streams, paths)]
+
+    results = []
+    for future, path in zip(futures, paths):
+        try:
+            results.append(future.result())
+        except OSError as e:
+            if os.path.exists(path):
+                os.remove(path)
+            results.append(e)
+    return results
+
+def find_blob(sha256, size=None):
+    query = Blob.query.filter_by(sha256=sha256)
+    if size is not None:
+        query = query.filter_by(size=size)
+    return query.first()
+
+def acquire_blob(blob):
+    """Add a reference to an existing blob; the caller commits.
+
+    Returns None when there is no blob, or when its last reference was released
+    (and the row deleted) since it was read; its content must be stored again.
+    """
+    if blob is None:
+        return None
+    updated = Blob.query.filter_by(id=blob.id).update(
+        {'ref_count': Blob.ref_count + 1}, synchronize_session=False
+    )
+    return blob if updated == 1 else None
+
+def store_staged(staged):
+    """Move a staged file into the content-addressed store and take a reference to its blob.
+
+    A blob with the same hash is reused and the staged copy is dropped. The caller
+    commits the reference together with the File row that uses it.
+    """
+    path = blob_path(staged.sha256)
+    moved = False
+    while True:
+        blob = acquire_blob(find_blob(staged.sha256))
+        if blob:
+            if not moved:
+                os.remove(staged.path)
+            return blob
+
+        if not moved:
+            # Unlinks queued for this content by a purge are dropped first: a purge
+            # removing it right now is waited for, later ones leave the new file alone
+            PendingUnlink.query.filter_by(sha256=staged.sha256).delete(synchronize_session=False)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged.path, path)
+            moved = True
+
+        blob = Blob(sha256=staged.sha256, size=staged.size, path=path, ref_count=1)
+        try:
+            with db.session.begin_nested():
+                db.session.add(blob)
+            return blob
+        except IntegrityError:
+            # Another request stored the same content first; both wrote identical bytes
+            continue
+
+def release_files(files):
+    """Drop the blob references held by files that are about to be deleted.
+
+    Blobs left without references are removed from the database. Returns the
+    paths to unlink once the transaction has committed.
+    """
+    paths = []
+    counts = Counter()
+    for blob_id, file_path in files:
+        if blob_id is None:
+            # Stored before the blob store existed, owned by this row alone
+            paths.extend(_with_renditions(file_path))
+        else:
+            counts[blob_id] += 1
+
+    for blob_id, count in counts.items():
+        Blob.query.filter_by(id=blob_id).update(
+            {'ref_count': Blob.ref_count - count}, synchronize_session=False
+        )
+
+    if counts:
+        orphans = db.session.query(Blob.id, Blob.path).filter(
+            Blob.id.in_(list(counts)), Blob.ref_count <= 0
+        ).all()
+        for blob_id, path in orphans:
+            deleted = Blob.query.filter(Blob.id == blob_id, Blob.ref_count <= 0).delete(
+                synchronize_session=False
+            )
+            if deleted:
+                paths.extend(_with_renditions(path))
+
+    return paths
+
+def remove_paths(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            current_app.logger.warning('Could not remove %s: %s', path, e)
+
+def remove_stored(paths):
+    """Unlink stored files together with their renditions."""
+    remove_paths([rendition for path in paths for rendition in _with_renditions(path)])
@@ -0,0 +1,111 @@
+import re
+from collections import Counter
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from server.models import File, Tag, FileTag, RepositoryTagCount
+from server.extensions import db
+
+MAX_TAGS_PER_FILE = 20
+MAX_TAG_LENGTH = 50
+
+def parse_tags(text):
+    """Split a comma-separated tag string into normalized, distinct tag names."""
+    names = []
+    for raw in (text or '').split(','):
+        name = re.sub(r'\s+', ' ', raw).strip().lower()[:MAX_TAG_LENGTH].strip()
+        if name and name not in names:
+            names.append(name)
+    return names[:MAX_TAGS_PER_FILE]
+
+def format_tags(names):
+    return ', '.join(names)
+
+def _tag_ids(names):
+    """Map tag names to ids, creating the missing tags."""
+    ids = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)))
+    for name in names:
+        if name in ids:
+            continue
+        tag = Tag(name=name)
+        try:
+            with db.session.begin_nested():
+                db.session.add(tag)
+            ids[name] = tag.id
+        except IntegrityError:
+            # Created concurrently by another request
+            ids[name] = db.session.query(Tag.id).filter_by(name=name).scalar()
+    return ids
+
+def _add_counts(deltas):
+    """Apply {(repository_id, tag_id): delta} to the per-repository facet counts."""
+    for (repository_id, tag_id), delta in sorted(deltas.items()):
+        updated = RepositoryTagCount.query.filter_by(repository_id=repository_id, tag_id=tag_id).update(
+            {'file_count': RepositoryTagCount.file_count + delta}, synchronize_session=False
+        )
+        if updated:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.add(RepositoryTagCount(repository_id=repository_id, tag_id=tag_id, file_count=delta))
+        except IntegrityError:
+            RepositoryTagCount.query.filter_by(repository_id=repository_id, tag_id=tag_id).update(
+                {'file_count': RepositoryTagCount.file_count + delta}, synchronize_session=False
+            )
+
+def tag_files(files):
+    """Index the tags of newly added File rows; the caller commits.
+
+    Each file's free-form tags string is normalized in place, then linked to
+    Tag rows and counted in its repository's facets.
+    """
+    parsed = []
+    for file_obj in files:
+        names = parse_tags(file_obj.tags)
+        file_obj.tags = format_tags(names)
+        parsed.append((file_obj, names))
+
+    db.session.flush()
+    all_names = sorted({name for _, names in parsed for name in names})
+    if not all_names:
+        return
+
+    ids = _tag_ids(all_names)
+    links = []
+    deltas = Counter()
+    for file_obj, names in parsed:
+        for name in names:
+            links.append({'file_id': file_obj.id, 'tag_id': ids[name], 'repository_id': file_obj.repository_id})
+            deltas[(file_obj.repository_id, ids[name])] += 1
+
+    db.session.execute(db.insert(FileTag), links)
+    _add_counts(deltas)
+
+def untag_files(file_ids):
+    """Drop the tag links of files that are being deleted along with their repository."""
+    FileTag.query.filter(FileTag.file_id.in_(file_ids)).delete(synchronize_session=False)
+
+def untag_repository(repository_id):
+    """Drop the facet counts of a repository whose files have been purged."""
+    RepositoryTagCount.query.filter_by(repository_id=repository_id).delete(synchronize_session=False)
+
+def repository_facets_query(repository_id):
+    return (
+        db.session.query(Tag.name, RepositoryTagCount.file_count)
+        .join(Tag, Tag.id == RepositoryTagCount.tag_id)
+        .filter(RepositoryTagCount.repository_id == repository_id, RepositoryTagCount.file_count > 0)
+        .order_by(RepositoryTagCount.file_count.desc(), Tag.name)
+    )
+
+def repository_facets(repository_id):
+    """(tag name, file count) pairs for a repository, most used first."""
+    return repository_facets_query(repository_id).all()
+
+def filter_by_tags(query, repository_id, names):
+    """Restrict a File query to files carrying every tag in names."""
+    for name in names:
+        link = aliased(FileTag)
+        query = query.join(link, link.file_id == File.id).filter(
+            link.repository_id == repository_id,
+            link.tag_id == db.select(Tag.id).where(Tag.name == name).scalar_subquery()
+        )
+    return query
@@ -0,0 +1,186 @@
+import os
+import shutil
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from server.models import File, Thumbnail
+from server.extensions import db
+from server import storage
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it images get no thumbnails
+    Image = None
+
+IMAGE_TYPES = {'png', 'jpg', 'jpeg', 'gif'}
+VIDEO_TYPES = {'mp4', 'mov', 'avi'}
+DOCUMENT_TYPES = {'pdf'}
+
+RENDER_TIMEOUT = 60  # seconds for an external renderer
+
+
+def _image_size(path):
+    if Image is None:
+        return None, None
+    with Image.open(path) as img:
+        return img.size
+
+def _render_image(src, out, box):
+    with Image.open(src) as img:
+        img.draft('RGB', box)  # lets JPEG decode at a reduced scale
+        img.thumbnail(box)
+        img.convert('RGB').save(out, 'JPEG', quality=80, optimize=True)
+
+def _render_video(src, out, box):
+    # First frame after one second, scaled to fit the box
+    subprocess.run([
+        'ffmpeg', '-loglevel', 'error', '-y', '-ss', '1', '-i', src, '-frames:v', '1',
+        '-vf', f'scale={box[0]}:{box[1]}:force_original_aspect_ratio=decrease', '-f', 'image2', out
+    ], check=True, timeout=RENDER_TIMEOUT, stdin=subprocess.DEVNULL)
+
+def _render_pdf(src, out, box):
+    prefix = out[:-len('.jpg')]
+    subprocess.run([
+        'pdftoppm', '-jpeg', '-singlefile', '-f', '1', '-l', '1', '-scale-to', str(max(box)), src, prefix
+    ], check=True, timeout=RENDER_TIMEOUT, stdin=subprocess.DEVNULL)
+    os.replace(prefix + '.jpg', out)
+
+@lru_cache(maxsize=None)
+def _tool_available(name):
+    return shutil.which(name) is not None
+
+def renderer_for(file_type):
+    """The render function for a file type, or None if this host cannot render it."""
+    file_type = (file_type or '').lower()
+    if file_type in IMAGE_TYPES and Image is not None:
+        return _render_image
+    if file_type in VIDEO_TYPES and _tool_available('ffmpeg'):
+        return _render_video
+    if file_type in DOCUMENT_TYPES and _tool_available('pdftoppm'):
+        return _render_pdf
+    return None
+
+def supports(file_type):
+    return renderer_for(file_type) is not None
+
+def retry_due(thumb):
+    """Whether a failed rendition has waited THUMBNAIL_RETRY_AFTER seconds since its last attempt."""
+    attempted = thumb.updated_at or thumb.created_at
+    retry_after = timedelta(seconds=current_app.config['THUMBNAIL_RETRY_AFTER'])
+    return attempted is None or attempted <= datetime.utcnow() - retry_after
+
+def generate(file_obj, size, force=False):
+    """Create or refresh one rendition of a file. Safe to run repeatedly and concurrently."""
+    box = tuple(current_app.config['THUMBNAIL_SIZES'][size])
+    thumb = Thumbnail.query.filter_by(file_id=file_obj.id, size=size).first()
+    out_relative = storage.rendition_path(file_obj.file_path, size)
+    out = storage.absolute_path(out_relative)
+
+    if thumb and thumb.status == 'ready' and os.path.exists(out) and not force:
+        return thumb
+
+    render = renderer_for(file_obj.file_type)
+    status = 'unsupported'
+    width = height = None
+
+    if render:
+        # Files sharing a blob share renditions; only render when none exists yet
+        if force or not os.path.exists(out):
+            tmp = f'{out}.{os.getpid()}.{threading.get_ident()}.tmp.jpg'
+            try:
+                render(storage.absolute_path(file_obj.file_path), tmp, box)
+                os.replace(tmp, out)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                current_app.logger.warning('Thumbnail %s for file %s failed: %s', size, file_obj.id, e)
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        if os.path.exists(out):
+            status = 'ready'
+            width, height = _image_size(out)
+        else:
+            status = 'failed'
+
+    if thumb is None:
+        thumb = Thumbnail(file_id=file_obj.id, size=size)
+        db.session.add(thumb)
+    thumb.status = status
+    thumb.path = out_relative if status == 'ready' else None
+    thumb.width = width
+    thumb.height = height
+    thumb.updated_at = datetime.utcnow()
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker recorded the same rendition first
+        db.session.rollback()
+        thumb = Thumbnail.query.filter_by(file_id=file_obj.id, size=size).first()
+    return thumb
+
+
+class ThumbnailWorker:
+    """Renders thumbnails on a small thread pool, away from request handling.
+
+    Jobs are deduplicated per file and bounded by THUMBNAIL_QUEUE_SIZE; a file
+    that misses the queue is rendered when its thumbnail is first requested.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.max_workers = 2
+        self.queue_size = 1000
+        self._executor = None
+        self._pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config['THUMBNAIL_WORKERS']
+        self.queue_size = app.config['THUMBNAIL_QUEUE_SIZE']
+
+    def schedule(self, file_obj, force=False):
+        """Queue every rendition of file_obj; returns False if it was not queued."""
+        return self.submit(file_obj.id, file_obj.file_type, force=force)
+
+    def submit(self, file_id, file_type, force=False):
+        """Like schedule(), for callers that only hold the id and type of a file."""
+        if not supports(file_type):
+            return False
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='thumbnail')
+                self._pending = set()
+                self._pid = os.getpid()
+            if file_id in self._pending or len(self._pending) >= self.queue_size:
+                return False
+            self._pending.add(file_id)
+
+        self._executor.submit(self._run, file_id, force)
+        return True
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self, file_id, force):
+        with self.app.app_context():
+            try:
+                file_obj = db.session.get(File, file_id)
+                if file_obj is not None:
+                    for size in self.app.config['THUMBNAIL_SIZES']:
+                        generate(file_obj, size, force=force)
+            except Exception:
+                self.app.logger.exception('Thumbnail generation for file %s failed', file_id)
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._pending.discard(file_id)
+
+
+thumbnail_worker = ThumbnailWorker()
@@ -0,0 +1,255 @@
+import os
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session, with_loader_criteria
+from server.extensions import db
+from server.models import (Repository, File, Thumbnail, Meeting, ShareLink, UploadSession,
+                           DownloadLog, LinkAccessLog, Blob, PendingUnlink)
+from server import storage, tags, rollups
+from server.writebehind import BackgroundFlusher
+
+# A deleted repository keeps its row as a tombstone. Every ORM select leaves
+# tombstones out, including joins and relationship loads, unless it is run
+# with execution_options(include_deleted=True).
+
+def hide_deleted(statement):
+    """The select with tombstoned repositories left out, as the session runs it."""
+    return statement.options(
+        with_loader_criteria(Repository, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+    )
+
+@event.listens_for(Session, 'do_orm_execute')
+def _hide_deleted_repositories(state):
+    if (state.is_select and not state.is_column_load
+            and not state.execution_options.get('include_deleted', False)):
+        state.statement = hide_deleted(state.statement)
+
+
+class AlreadyPurged(Exception):
+    pass
+
+
+def delete_repository(repo, user_id):
+    """Turn a repository into a tombstone; its rows and files are purged in the background."""
+    repo.deleted_at = datetime.utcnow()
+    repo.deleted_by = user_id
+    db.session.commit()
+    repository_purger.wake()
+
+def get_tombstone(repo_id):
+    return db.session.execute(
+        select(Repository).where(Repository.id == repo_id).execution_options(include_deleted=True)
+    ).scalar_one_or_none()
+
+def _batch_ids(model, criterion, batch_size):
+    return select(model.id).where(criterion).order_by(model.id).limit(batch_size)
+
+def _share_link_ids(repo_id):
+    return select(ShareLink.id).where(ShareLink.repository_id == repo_id)
+
+def _file_batch(repo_id, batch_size):
+    return (select(File.id, File.blob_id, File.file_path, Blob.sha256)
+            .outerjoin(Blob, Blob.id == File.blob_id)
+            .where(File.repository_id == repo_id).order_by(File.id).limit(batch_size))
+
+def _upload_batch(repo_id, batch_size):
+    return (select(UploadSession.id, UploadSession.file_path)
+            .where(UploadSession.repository_id == repo_id).order_by(UploadSession.id).limit(batch_size))
+
+def _delete_batch(model):
+    """A purge step deleting the rows whose ids the batch select returns; the step returns how many went."""
+    def step(batch):
+        ids = db.session.scalars(batch).all()
+        if not ids:
+            return 0
+        deleted = db.session.execute(delete(model).where(model.id.in_(ids))).rowcount
+        if deleted != len(ids):
+            # Another process purged part of this batch first
+            raise AlreadyPurged()
+        return deleted
+    return step
+
+def _purge_files(batch):
+    """Delete a batch of files with their thumbnails and tag links, dropping blob references."""
+    files = db.session.execute(batch).all()
+    if not files:
+        return 0
+
+    ids = [row.id for row in files]
+    db.session.execute(delete(Thumbnail).where(Thumbnail.file_id.in_(ids)))
+    tags.untag_files(ids)
+    if db.session.execute(delete(File).where(File.id.in_(ids))).rowcount != len(ids):
+        raise AlreadyPurged()
+
+    # Blob rows left without references are deleted here; their files are queued in the
+    # same transaction and removed after commit (renditions are found again at that point)
+    hashes = {row.file_path: row.sha256 for row in files}
+    for path in storage.release_files([(row.blob_id, row.file_path) for row in files]):
+        if path in hashes:
+            db.session.add(PendingUnlink(path=path, sha256=hashes[path]))
+    return len(ids)
+
+def _purge_uploads(batch):
+    uploads = db.session.execute(batch).all()
+    if not uploads:
+        return 0
+    if db.session.execute(delete(UploadSession).where(UploadSession.id.in_([row.id for row in uploads]))).rowcount != len(uploads):
+        raise AlreadyPurged()
+    db.session.add_all([PendingUnlink(path=row.file_path) for row in uploads])
+    return len(uploads)
+
+# Purge steps in order, logs before the links and files they point at: each
+# builds the select of its next batch from (repo_id, batch_size) and processes it
+PURGE_STEPS = [
+    ('link_access_log', lambda repo_id, n: _batch_ids(
+        LinkAccessLog, LinkAccessLog.share_link_id.in_(_share_link_ids(repo_id)), n), _delete_batch(LinkAccessLog)),
+    ('download_log', lambda repo_id, n: _batch_ids(DownloadLog, DownloadLog.repository_id == repo_id, n),
+     _delete_batch(DownloadLog)),
+    ('file', _file_batch, _purge_files),
+    ('upload_session', _upload_batch, _purge_uploads),
+    ('meeting', lambda repo_id, n: _batch_ids(Meeting, Meeting.repository_id == repo_id, n), _delete_batch(Meeting)),
+    ('share_link', lambda repo_id, n: _batch_ids(ShareLink, ShareLink.repository_id == repo_id, n),
+     _delete_batch(ShareLink)),
+]
+
+def unlink_pending(batch_size=500):
+    """Remove files queued by committed purges. Content stored again since is left alone.
+
+    A batch's queue rows are deleted before the blob check and committed once
+    the files are gone. store_staged() deletes the rows of a hash before moving
+    new content in, so an upload and a purge of the same content wait for each
+    other instead of the purge removing a file an uncommitted upload just stored.
+    """
+    removed = 0
+    while True:
+        batch = select(PendingUnlink.id).order_by(PendingUnlink.id).limit(batch_size)
+        pending = db.session.execute(
+            delete(PendingUnlink).where(PendingUnlink.id.in_(batch)).returning(PendingUnlink.path, PendingUnlink.sha256)
+        ).all()
+        if not pending:
+            db.session.commit()
+            return removed
+        stored_again = set(db.session.scalars(
+            select(Blob.sha256).where(Blob.sha256.in_([p.sha256 for p in pending if p.sha256]))
+        ))
+        for p in pending:
+            if p.sha256 not in stored_again:
+                storage.remove_stored([p.path])
+                removed += 1
+        db.session.commit()
+
+def purge_repository(repo_id, batch_size=1000, max_batches=None):
+    """Purge one tombstoned repository a batch per transaction; returns True once it is gone.
+
+    Progress lives in the tables themselves: every batch deletes what it
+    has processed, so a purge interrupted at any point resumes where it stopped.
+    """
+    batches = 0
+    for _, batch, step in PURGE_STEPS:
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                return False
+            batches += 1
+            try:
+                purged = step(batch(repo_id, batch_size))
+                db.session.commit()
+            except AlreadyPurged:
+                db.session.rollback()
+                continue
+            except Exception:
+                db.session.rollback()
+                raise
+            unlink_pending()
+            if purged < batch_size:
+                break
+
+    tags.untag_repository(repo_id)
+    rollups.forget_repository(repo_id)
+    Repository.query.filter_by(id=repo_id).update({'purged_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+    # Clean up the legacy per-repository folder once it is empty
+    repo_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(repo_id))
+    if os.path.isdir(repo_folder) and not os.listdir(repo_folder):
+        os.rmdir(repo_folder)
+    return True
+
+def pending_purges_query():
+    return (select(Repository.id).where(Repository.deleted_at.isnot(None), Repository.purged_at.is_(None))
+            .order_by(Repository.deleted_at).execution_options(include_deleted=True))
+
+def pending_purges():
+    return db.session.scalars(pending_purges_query()).all()
+
+def purge_deleted(batch_size=1000, max_batches=None):
+    """Purge every tombstoned repository; returns the ids fully purged by this call."""
+    unlink_pending()
+    done = []
+    for repo_id in pending_purges():
+        if purge_repository(repo_id, batch_size, max_batches):
+            done.append(repo_id)
+    return done
+
+def purge_status(repo):
+    """Deletion progress of a tombstone: the dependent rows still to be purged."""
+    if repo.purged_at:
+        remaining = {name: 0 for name, _, _ in PURGE_STEPS}
+    else:
+        repo_id = repo.id
+        remaining = {
+            'link_access_log': db.session.scalar(select(func.count()).where(
+                LinkAccessLog.share_link_id.in_(_share_link_ids(repo_id)))),
+            **{name: db.session.scalar(select(func.count()).where(model.repository_id == repo_id))
+               for name, model in [('download_log', DownloadLog), ('file', File),
+                                   ('upload_session', UploadSession), ('meeting', Meeting),
+                                   ('share_link', ShareLink)]},
+        }
+    return {
+        'id': repo.id,
+        'name': repo.name,
+        'status': 'purged' if repo.purged_at else 'purging',
+        'deleted_at': repo.deleted_at.isoformat(),
+        'deleted_by': repo.deleted_by,
+        'purged_at': repo.purged_at.isoformat() if repo.purged_at else None,
+        'remaining': remaining,
+    }
+
+
+class RepositoryPurger(BackgroundFlusher):
+    """Purges deleted repositories every PURGE_INTERVAL seconds, or as soon as one is deleted."""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_size = 1000
+        self.max_batches = 50
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.before_request(self.ensure_started)
+
+    def configure(self, config):
+        self.interval = config['PURGE_INTERVAL']
+        self.batch_size = config['PURGE_BATCH_SIZE']
+
+    def flush(self):
+        # A bounded amount per run so one huge repository does not hold the thread for long
+        purge_deleted(self.batch_size, self.max_batches)
+
+    def shutdown(self):
+        # Nothing is buffered in memory; the next process resumes from the tables
+        if self._pid == os.getpid():
+            self._stopping.set()
+            self._wakeup.set()
+
+
+repository_purger = RepositoryPurger()
+
+@click.command('purge-deleted-repositories')
+@with_appcontext
+def purge_deleted_repositories_command():
+    """Purge the rows and files of every deleted repository now."""
+    done = purge_deleted(current_app.config['PURGE_BATCH_SIZE'])
+    click.echo(f'Purged {len(done)} repositories')
@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, select
+from server.extensions import db
+from server.models import UploadSession, PendingUnlink
+from server.tombstones import unlink_pending
+from server.writebehind import BackgroundFlusher
+
+# Chunked upload sessions nobody has written to for UPLOAD_SESSION_TTL
+# seconds are expired in the background, with their staging files and the
+# running hashes this process kept for them.
+
+
+class RunningHashes:
+    """SHA-256 of the bytes received so far, per upload session whose chunks arrive in order on this process."""
+
+    def __init__(self):
+        self._hashes = {}  # upload id -> (offset, sha, monotonic time last used)
+        self._lock = threading.Lock()
+
+    def put(self, upload_id, offset, sha):
+        with self._lock:
+            self._hashes[upload_id] = (offset, sha, time.monotonic())
+
+    def take(self, upload_id):
+        """Remove and return (offset, sha) for the upload, or None; put() it back to keep it."""
+        with self._lock:
+            entry = self._hashes.pop(upload_id, None)
+        return entry[:2] if entry else None
+
+    def drop(self, upload_id):
+        with self._lock:
+            self._hashes.pop(upload_id, None)
+
+    def prune(self, max_age):
+        """Drop hashes unused for max_age seconds, and those of sessions that no longer exist.
+
+        Sessions completed, cancelled or expired by another process leave
+        their hash here; returns how many were dropped.
+        """
+        cutoff = time.monotonic() - max_age
+        with self._lock:
+            stale = {upload_id for upload_id, (_, _, used) in self._hashes.items() if used < cutoff}
+            live = list(self._hashes.keys() - stale)
+        if live:
+            existing = set(db.session.scalars(select(UploadSession.id).where(UploadSession.id.in_(live))))
+            stale.update(upload_id for upload_id in live if upload_id not in existing)
+        with self._lock:
+            for upload_id in stale:
+                self._hashes.pop(upload_id, None)
+        return len(stale)
+
+
+running_hashes = RunningHashes()
+
+def idle_sessions(cutoff, batch_size):
+    """The select of the next batch of sessions last written before cutoff."""
+    return (select(UploadSession.id, UploadSession.file_path)
+            .where(UploadSession.updated_at < cutoff).order_by(UploadSession.id).limit(batch_size))
+
+def expire_uploads(max_age, batch_size=500):
+    """Delete upload sessions idle for max_age seconds and unlink their staging files.
+
+    Staging files older than that which no session refers to (left by an
+    upload interrupted before its row or File was committed) are removed too.
+    Returns the number of sessions expired.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    expired = 0
+    while True:
+        uploads = db.session.execute(idle_sessions(cutoff, batch_size)).all()
+        if not uploads:
+            break
+        # A chunk written since the select keeps its session
+        ids = db.session.scalars(
+            delete(UploadSession).where(UploadSession.id.in_([row.id for row in uploads]),
+                                        UploadSession.updated_at < cutoff)
+            .returning(UploadSession.id)
+        ).all()
+        paths = {row.id: row.file_path for row in uploads}
+        db.session.add_all([PendingUnlink(path=paths[upload_id]) for upload_id in ids])
+        db.session.commit()
+        for upload_id in ids:
+            running_hashes.drop(upload_id)
+        expired += len(ids)
+        if len(uploads) < batch_size:
+            break
+
+    _remove_orphaned_staging(cutoff.timestamp())
+    unlink_pending()
+    return expired
+
+def _remove_orphaned_staging(cutoff):
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'staging')
+    if not os.path.isdir(folder):
+        return
+    with os.scandir(folder) as entries:
+        old = [entry.path for entry in entries if entry.is_file() and entry.stat().st_mtime < cutoff]
+    if not old:
+        return
+    in_use = set(db.session.scalars(select(UploadSession.file_path).where(UploadSession.file_path.in_(old))))
+    db.session.add_all([PendingUnlink(path=path) for path in old if path not in in_use])
+    db.session.commit()
+
+
+class UploadSweeper(BackgroundFlusher):
+    """Expires idle upload sessions every UPLOAD_SWEEP_INTERVAL seconds."""
+
+    def __init__(self):
+        super().__init__()
+        self.interval = 3600.0
+        self.max_age = 86400
+
+    def init_app(self, app):
+        super().init_app(app)
+        # Every process runs one: the running hashes it prunes are its own
+        if self.max_age:
+            app.before_request(self.ensure_started)
+
+    def configure(self, config):
+        self.interval = config['UPLOAD_SWEEP_INTERVAL']
+        self.max_age = config['UPLOAD_SESSION_TTL']
+
+    def flush(self):
+        expire_uploads(self.max_age)
+        running_hashes.prune(self.max_age)
+
+    def shutdown(self):
+        # Nothing is buffered in memory; the next sweep picks up where this one stopped
+        if self._pid == os.getpid():
+            self._stopping.set()
+            self._wakeup.set()
+
+
+upload_sweeper = UploadSweeper()
+
+@click.command('expire-uploads')
+@click.option('--max-age', type=int, default=None,
+              help='Expire sessions idle for this many seconds (default: UPLOAD_SESSION_TTL).')
+@with_appcontext
+def expire_uploads_command(max_age):
+    """Delete abandoned chunked upload sessions and their staging files."""
+    max_age = max_age if max_age is not None else current_app.config['UPLOAD_SESSION_TTL']
+    click.echo(f'Expired {expire_uploads(max_age)} upload sessions')
@@ -0,0 +1,285 @@
+import os
+import queue
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import bindparam, func
+from sqlalchemy.exc import IntegrityError
+from server.extensions import db
+from server.models import ShareLink
+
+
+class BackgroundFlusher:
+    """Calls flush() from a daemon thread on an interval or when woken, and once more at exit.
+
+    The thread is started lazily in each process, so workers forked by gunicorn
+    get their own thread and their own buffered state.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.interval = 1.0
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        self.configure(app.config)
+        atexit.register(self.shutdown)
+
+    def configure(self, config):
+        pass
+
+    def reset(self):
+        """Drop state inherited from a parent process."""
+
+    def flush(self):
+        raise NotImplementedError
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            self._stopping = threading.Event()
+            self.reset()
+            self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush_now()
+
+    def flush_now(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('%s flush failed', type(self).__name__)
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout=10)
+        self.flush_now()
+
+
+class LogWriter(BackgroundFlusher):
+    """Buffers DownloadLog / LinkAccessLog rows and writes them in bulk.
+
+    Rows are flushed when a batch fills up or every LOG_FLUSH_INTERVAL seconds.
+    When the bounded queue is full new rows are dropped and counted rather than
+    slowing the request down.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.enabled = True
+        self.batch_size = 500
+        self._queue = queue.Queue()
+        self._counters_lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def configure(self, config):
+        self.enabled = config['LOG_WRITE_BEHIND']
+        self.batch_size = config['LOG_BATCH_SIZE']
+        self.interval = config['LOG_FLUSH_INTERVAL']
+        self._queue = queue.Queue(maxsize=config['LOG_QUEUE_SIZE'])
+
+    def reset(self):
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+
+    def add(self, model, **values):
+        self.add_many(model, [values])
+
+    def add_many(self, model, rows):
+        """Queue rows for model's table; timestamps are taken now, not at flush time."""
+        table = model.__table__
+        now = datetime.utcnow()
+        rows = [self._with_timestamp(table, row, now) for row in rows]
+
+        if not self.enabled:
+            self._insert(db.session.connection(), table, rows)
+            db.session.commit()
+            self._count('written', len(rows))
+            return
+
+        self.ensure_started()
+        for row in rows:
+            try:
+                self._queue.put_nowait((table, row))
+            except queue.Full:
+                self._count('dropped', 1)
+            else:
+                self._count('queued', 1)
+
+        if self._queue.qsize() >= self.batch_size:
+            self.wake()
+
+    def flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+
+            by_table = {}
+            for table, row in batch:
+                by_table.setdefault(table, []).append(row)
+
+            try:
+                with db.engine.begin() as conn:
+                    for table, rows in by_table.items():
+                        self._insert(conn, table, rows)
+            except IntegrityError:
+                # e.g. rows for a link deleted since they were queued: keep the rest
+                self._insert_one_by_one(by_table)
+            except Exception:
+                self._count('failed', len(batch))
+                raise
+            else:
+                self._count('written', len(batch))
+
+    def _insert_one_by_one(self, by_table):
+        for table, rows in by_table.items():
+            for row in rows:
+                try:
+                    with db.engine.begin() as conn:
+                        self._insert(conn, table, [row])
+                except IntegrityError:
+                    self._count('failed', 1)
+                else:
+                    self._count('written', 1)
+
+    def stats(self):
+        with self._counters_lock:
+            return {
+                'enabled': self.enabled,
+                'pending': self._queue.qsize(),
+                'queued': self.queued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed
+            }
+
+    def _count(self, name, amount):
+        with self._counters_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    @staticmethod
+    def _with_timestamp(table, row, now):
+        row = dict(row)
+        for column in ('downloaded_at', 'accessed_at'):
+            if column in table.c and row.get(column) is None:
+                row[column] = now
+        return row
+
+    @staticmethod
+    def _insert(conn, table, rows):
+        # Every row gets the same keys so they can share one statement
+        keys = sorted({key for row in rows for key in row})
+        rows = [{key: row.get(key) for key in keys} for row in rows]
+        if conn.dialect.name == 'postgresql':
+            # One multi-row INSERT ... VALUES (...), (...)
+            conn.execute(table.insert().values(rows))
+        else:
+            # executemany on SQLite and others
+            conn.execute(table.insert(), rows)
+
+
+class ViewCounter(BackgroundFlusher):
+    """Aggregates share-link views per process and merges them into ShareLink.view_count.
+
+    Each flush issues one UPDATE ... SET view_count = view_count + :delta per
+    link that was viewed, so concurrent workers never overwrite each other.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.enabled = True
+        self._deltas = Counter()
+        self._deltas_lock = threading.Lock()
+        self.merged = 0
+
+    def configure(self, config):
+        self.enabled = config['LOG_WRITE_BEHIND']
+        self.interval = config['VIEW_COUNT_FLUSH_INTERVAL']
+
+    def reset(self):
+        self._deltas = Counter()
+
+    def increment(self, share_link_id, amount=1):
+        if not self.enabled:
+            self._apply(db.session.connection(), [{'link_id': share_link_id, 'delta': amount}])
+            db.session.commit()
+            return
+
+        self.ensure_started()
+        with self._deltas_lock:
+            self._deltas[share_link_id] += amount
+
+    def pending(self, share_link_id):
+        """Views counted by this process that have not been merged yet."""
+        with self._deltas_lock:
+            return self._deltas.get(share_link_id, 0)
+
+    def flush(self):
+        with self._deltas_lock:
+            deltas, self._deltas = self._deltas, Counter()
+        if not deltas:
+            return
+
+        try:
+            with db.engine.begin() as conn:
+                # Sorted by id so concurrent workers lock rows in the same order
+                self._apply(conn, [{'link_id': link_id, 'delta': delta} for link_id, delta in sorted(deltas.items())])
+        except Exception:
+            # Keep the views for the next attempt
+            with self._deltas_lock:
+                self._deltas.update(deltas)
+            raise
+        self.merged += sum(deltas.values())
+
+    def stats(self):
+        with self._deltas_lock:
+            return {
+                'enabled': self.enabled,
+                'pending_links': len(self._deltas),
+                'pending_views': sum(self._deltas.values()),
+                'merged': self.merged
+            }
+
+    @staticmethod
+    def _apply(conn, params):
+        table = ShareLink.__table__
+        conn.execute(
+            table.update()
+            .where(table.c.id == bindparam('link_id'))
+            .values(view_count=func.coalesce(table.c.view_count, 0) + bindparam('delta')),
+            params
+        )
+
+
+log_writer = LogWriter()
+view_counter = ViewCounter()
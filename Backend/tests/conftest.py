@@ -0,0 +1,156 @@
+import io
+import os
+import logging.config
+import itertools
+from contextlib import contextmanager
+import pytest
+from server.profiler import profile_queries, sql_profiler
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'test-password'
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """One app per test session on a migrated SQLite database in a temporary folder."""
+    work = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('DATABASE_URL', 'sqlite:///' + str(work / 'test.db'))
+        env.setenv('UPLOAD_FOLDER', str(work / 'uploads'))
+        env.setenv('METRICS_DIR', str(work / 'metrics'))
+        env.setenv('PASSWORD_HASH_WORKERS', '0')
+        env.setenv('LOG_ARCHIVE_FOLDER', str(work / 'log_archive'))
+        from server.app import create_app
+        app = create_app()
+    app.config['TESTING'] = True
+
+    from flask_migrate import upgrade
+    with app.app_context(), pytest.MonkeyPatch.context() as env:
+        # Alembic's logging setup would replace the app's log handlers and disable its loggers
+        env.setattr(logging.config, 'fileConfig', lambda *args, **kwargs: None)
+        upgrade(directory=os.path.join(BACKEND, 'server', 'migrations'))
+    return app
+
+@pytest.fixture
+def query_budget():
+    """A context manager failing the test when a block runs more SQL statements than its budget.
+
+        def test_list_repositories(client, auth, query_budget):
+            with query_budget(4):
+                client.get('/api/repositories', headers=auth)
+
+    A statement shape repeated repeat_threshold times or more (the N+1
+    pattern) fails the test as well; pass repeat_threshold=None to allow it.
+    The statements run are listed in the failure message.
+    """
+    @contextmanager
+    def budget(max_queries, repeat_threshold=sql_profiler.repeat_threshold):
+        with profile_queries(keep=max_queries + 1) as profile:
+            yield profile
+
+        problems = []
+        if profile.count > max_queries:
+            problems.append(f'{profile.count} statements executed, budget is {max_queries}')
+        if repeat_threshold:
+            for shape, count in profile.repeated(repeat_threshold):
+                problems.append(f'{count}x {shape}')
+        if problems:
+            statements = '\n'.join(f"  {entry['ms']} ms  {entry['sql']}" for entry in profile.slowest())
+            pytest.fail('\n'.join(problems) + '\nSlowest statements:\n' + statements, pytrace=False)
+
+    return budget
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    """Every test starts with empty per-process caches, so statement counts do not depend on test order."""
+    from server.cache import payload_cache, user_cache
+    for cache in (payload_cache, user_cache):
+        cache.clear()
+
+
+@pytest.fixture
+def worker(app):
+    """Builds a private instance of a background worker class, configured from the app plus overrides.
+
+    Its thread, if a test starts one, is stopped afterwards without a final flush.
+    """
+    workers = []
+    def make(cls, **config):
+        instance = cls()
+        instance.app = app
+        instance.configure({**app.config, **config})
+        workers.append(instance)
+        return instance
+    yield make
+    for instance in workers:
+        if getattr(instance, '_thread', None) is not None:
+            instance._stopping.set()
+            instance._wakeup.set()
+
+
+_names = itertools.count()
+
+@pytest.fixture
+def make_user(app, client):
+    """Creates an approved user and returns the Authorization header of a fresh login."""
+    from werkzeug.security import generate_password_hash
+    from server.extensions import db
+    from server.models import User
+
+    def make(role='user'):
+        name = f'user{next(_names)}'
+        with app.app_context():
+            user = User(username=name, email=f'{name}@example.com', role=role, is_approved=True,
+                        password_hash=generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD']))
+            db.session.add(user)
+            db.session.commit()
+        response = client.post('/api/login', json={'username': name, 'password': PASSWORD})
+        assert response.status_code == 200, response.json
+        return {'Authorization': f"Bearer {response.json['access_token']}"}
+    return make
+
+@pytest.fixture
+def make_file(client):
+    """Uploads content into a repository, returning the new file's JSON."""
+    def make(auth, repo_id, content, filename='file.pdf', tags=''):
+        upload = client.post(f'/api/files/repositories/{repo_id}/upload', headers=auth, content_type='multipart/form-data',
+                             data={'file': (io.BytesIO(content), filename), 'tags': tags})
+        assert upload.status_code == 201, upload.json
+        return upload.json
+    return make
+
+@pytest.fixture
+def make_repository(client, make_file):
+    """Creates a repository through the API with files uploads, returning its id."""
+    def make(auth, files=0):
+        response = client.post('/api/repositories', json={'name': f'repository {next(_names)}'}, headers=auth)
+        assert response.status_code == 201, response.json
+        repo_id = response.json['id']
+        for i in range(files):
+            make_file(auth, repo_id, f'{repo_id}-{i}'.encode(), f'file{i}.pdf')
+        return repo_id
+    return make
+
+@pytest.fixture
+def make_share_link(client):
+    def make(auth, repo_id, permission='view'):
+        response = client.post(f'/api/repositories/{repo_id}/share', json={'permission': permission}, headers=auth)
+        assert response.status_code == 201, response.json
+        return response.json['token']
+    return make
+
+@pytest.fixture
+def share_link_id(app):
+    """The database id of a share link token."""
+    from sqlalchemy import select
+    from server.extensions import db
+    from server.models import ShareLink
+
+    def lookup(token):
+        with app.app_context():
+            return db.session.scalar(select(ShareLink.id).where(ShareLink.token == token))
+    return lookup
@@ -0,0 +1,151 @@
+"""EXPLAIN the statements the routes and background jobs run, failing on full table scans.
+
+Runs in the test suite on SQLite; to check another database, point
+DATABASE_URL at a migrated copy of it and run from Backend:
+
+    python -m tests.query_plans
+"""
+import re
+import sys
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.sql import Select
+from server.extensions import db
+from server import queries, tombstones, retention, rollups, uploads
+from server.pagination import keyset_query, encode_cursor
+from server.routes.repositories import REPOSITORY_SORT_COLUMNS, FILE_SORT_COLUMNS
+from server.routes.admin_routes import USER_SORT_COLUMNS, SHARE_LINK_SORT_COLUMNS, VIEWER_SORT_COLUMNS
+from server.search import search_query
+from server.analytics import series_query
+from server.tags import repository_facets_query
+from server.models import User, Repository, File, Blob, ShareLink, LinkAccessLog
+
+# Statements issued by each route, built with sample parameters by the same
+# code the route runs. allow_scan lists tables a statement reads in full on purpose.
+
+def _sample(column):
+    """A cursor value of the column's type."""
+    return {int: 1, str: 'user'}.get(column.type.python_type, datetime(2026, 1, 1))
+
+def _lists(name, build, sort_columns, id_column, allow_scan=()):
+    """Checks for a paginate() list in every sort order: the complete list, the first page and a cursor page.
+
+    allow_scan applies to the first two; a cursor page must seek to its position.
+    """
+    checks = []
+    for key, column in sort_columns.items():
+        for sort in (key, '-' + key):
+            cursor = encode_cursor(sort, _sample(column), 1)
+            checks += [
+                (f'{name}?sort={sort}',
+                 lambda sort=sort: keyset_query(build(), sort_columns, sort, id_column)[0].statement, allow_scan),
+                (f'{name}?sort={sort}&limit',
+                 lambda sort=sort: keyset_query(build(), sort_columns, sort, id_column)[0]
+                    .limit(current_app.config['DEFAULT_PAGE_SIZE'] + 1).statement, allow_scan),
+                (f'{name}?sort={sort}&cursor',
+                 lambda sort=sort, cursor=cursor: keyset_query(build(), sort_columns, sort, id_column, cursor)[0]
+                    .limit(current_app.config['DEFAULT_PAGE_SIZE'] + 1).statement, ()),
+            ]
+    return checks
+
+PLAN_CHECKS = [
+    *_lists('repositories.get_repositories', lambda: queries.repositories_with_file_counts(owner_id=1),
+            REPOSITORY_SORT_COLUMNS, Repository.id),
+    ('repositories.get_repository', lambda: queries.repository_detail_query(1).statement, ()),
+    *_lists('repositories.get_repository:files', lambda: queries.repository_files(1, include_uploader=True),
+            FILE_SORT_COLUMNS, File.id),
+    *_lists('repositories.get_repository:files?tag', lambda: queries.repository_files(
+        1, include_uploader=True, tags=['minutes', 'budget']), FILE_SORT_COLUMNS, File.id),
+    ('repositories.get_repository_tags', lambda: repository_facets_query(1).statement, ()),
+    ('share.access_shared_repository', lambda: queries.share_link_by_token('token'), ()),
+    *_lists('share.access_shared_repository:files', lambda: queries.repository_files(1, tags=['minutes']),
+            FILE_SORT_COLUMNS, File.id),
+    ('files.download_file', lambda: queries.visible_file_query(1).limit(1).statement, ()),
+    ('files.complete_upload', lambda: Blob.query.filter_by(sha256='0' * 64).statement, ()),
+    # Lists every user on purpose, walking the table in the sort order
+    *_lists('admin.get_all_users', lambda: User.query, USER_SORT_COLUMNS, User.id, ('user',)),
+    *_lists('admin.get_all_repositories', lambda: queries.repositories_with_file_counts(include_owner=True),
+            REPOSITORY_SORT_COLUMNS, Repository.id),
+    *_lists('admin.get_all_share_links', queries.share_links_with_relations, SHARE_LINK_SORT_COLUMNS, ShareLink.id),
+    *_lists('admin.get_link_viewers', lambda: LinkAccessLog.query.filter_by(share_link_id=1),
+            VIEWER_SORT_COLUMNS, LinkAccessLog.id),
+    ('admin.get_download_stats', lambda: queries.repository_download_totals().statement, ()),
+    ('rollups.catch_up', lambda: rollups.pending_downloads(1, 5000), ()),
+    ('rollups.catch_up:gaps', lambda: rollups.gap_downloads([1, 2]), ()),
+    *[(f'tombstones.purge:{name}', lambda batch=batch: batch(1, 1000), ())
+      for name, batch, _ in tombstones.PURGE_STEPS],
+    # The sweep reads the whole (small) table of sessions in progress
+    ('uploads.expire_uploads', lambda: uploads.idle_sessions(datetime(2026, 1, 1), 500), ('upload_session',)),
+    ('tombstones.pending_purges', tombstones.pending_purges_query, ()),
+    ('search.search', lambda: search_query(['budget'], User(id=1, role='user'))[0].statement, ()),
+    *[(f'admin.get_analytics:{metric}:{scope}',
+       lambda metric=metric, scope=scope: series_query(
+           metric, scope, 1, 'hour', datetime(2026, 1, 1), datetime(2026, 1, 2)).statement, ())
+      for metric, scope in [('downloads', 'repository'), ('downloads', 'file'), ('downloads', 'share_link'),
+                            ('views', 'share_link'), ('views', 'repository')]],
+    ('retention.archive_table:download_log', lambda: retention.archive_batch('download_log', 5000, 1), ()),
+    ('retention.archive_table:link_access_log', lambda: retention.archive_batch('link_access_log', 5000, 1), ()),
+    ('retention.read_archive', lambda: retention.segments_query(
+        'download_log', datetime(2026, 1, 1), datetime(2026, 1, 2)).statement, ()),
+    ('auth.login', lambda: User.query.filter_by(username='user').statement, ()),
+]
+
+# A full-text MATCH shows up as a virtual table scan with an M(atch) index
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\w+)\b(?! VIRTUAL TABLE INDEX \d+:M)')
+POSTGRES_SCAN_RE = re.compile(r'Seq Scan on "?(\w+)"?')
+
+def explain(conn, statement):
+    """Return the plan lines for a statement on the current database."""
+    if isinstance(statement, Select) and not statement.get_execution_options().get('include_deleted', False):
+        # As the session runs it, tombstoned repositories left out
+        statement = tombstones.hide_deleted(statement)
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        return [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+    return [row[0] for row in conn.exec_driver_sql(f'EXPLAIN {sql}')]
+
+def full_scans(conn, plan):
+    pattern = SQLITE_SCAN_RE if conn.dialect.name == 'sqlite' else POSTGRES_SCAN_RE
+    tables = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+def check_query_plans():
+    """EXPLAIN every statement in PLAN_CHECKS and return (name, table, plan) for each full scan."""
+    failures = []
+    with db.engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if conn.dialect.name == 'postgresql':
+                # Tiny tables are cheaper to scan; ask whether an index *can* be used
+                conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            for name, build, allow_scan in PLAN_CHECKS:
+                plan = explain(conn, build())
+                for table in full_scans(conn, plan):
+                    if table not in allow_scan:
+                        failures.append((name, table, plan))
+        finally:
+            # EXPLAIN of a DELETE never runs it, but never commit here either
+            trans.rollback()
+    return failures
+
+def main():
+    from server.app import create_app
+    with create_app().app_context():
+        failures = check_query_plans()
+    for name, table, plan in failures:
+        print(f'FULL SCAN {name}: {table}')
+        for line in plan:
+            print(f'    {line}')
+
+    if failures:
+        return 1
+    print(f'{len(PLAN_CHECKS)} query plans checked, no full table scans')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Time-bucketed download and view counts from the admin analytics endpoint."""
+from datetime import datetime
+import pytest
+from server.extensions import db
+from server.models import DownloadLog, LinkAccessLog
+
+DAY = datetime(2026, 1, 5)
+
+
+def at(hour, minute=0):
+    return DAY.replace(hour=hour, minute=minute)
+
+@pytest.fixture
+def downloads(app, make_user, make_repository, make_file):
+    """A file with downloads at 10:15, 10:45 and 12:05 on DAY; returns (repo id, file id)."""
+    owner = make_user()
+    repo_id = make_repository(owner)
+    file_id = make_file(owner, repo_id, b'counted', 'counted.pdf')['id']
+    with app.app_context():
+        db.session.add_all([DownloadLog(file_id=file_id, repository_id=repo_id, downloaded_at=moment)
+                            for moment in (at(10, 15), at(10, 45), at(12, 5))])
+        db.session.commit()
+    return repo_id, file_id
+
+def analytics(client, auth, **args):
+    response = client.get('/api/admin/analytics', headers=auth, query_string=args)
+    assert response.status_code == 200, response.json
+    return response.json
+
+def test_hourly_buckets_include_empty_ones(client, make_user, downloads):
+    repo_id, file_id = downloads
+    admin = make_user('super_admin')
+    result = analytics(client, admin, id=repo_id, start='2026-01-05T10:30:00', end='2026-01-05T13:00:00')
+    # start is aligned to its bucket
+    assert result['start'] == '2026-01-05T10:00:00'
+    assert result['points'] == [{'bucket': '2026-01-05T10:00:00', 'count': 2},
+                                {'bucket': '2026-01-05T11:00:00', 'count': 0},
+                                {'bucket': '2026-01-05T12:00:00', 'count': 1}]
+    assert result['total'] == 3
+
+    by_file = analytics(client, admin, scope='file', id=file_id, interval='day',
+                        start='2026-01-04T00:00:00', end='2026-01-06T00:00:00')
+    assert [point['count'] for point in by_file['points']] == [0, 3]
+
+def test_offset_timestamps_read_as_utc(client, make_user, downloads):
+    repo_id, _ = downloads
+    result = analytics(client, make_user('super_admin'), id=repo_id, interval='minute',
+                       start='2026-01-05T12:15:00+02:00', end='2026-01-05T12:50:00+02:00')
+    assert result['start'] == '2026-01-05T10:15:00'
+    assert result['total'] == 2
+
+def test_views_of_a_repository_through_its_links(app, client, make_user, make_repository, make_share_link,
+                                                 share_link_id):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    links = [share_link_id(make_share_link(owner, repo_id)) for _ in range(2)]
+    with app.app_context():
+        db.session.add_all([LinkAccessLog(share_link_id=link, accessed_at=at(9, minute))
+                            for minute, link in [(1, links[0]), (2, links[1]), (3, links[1])]])
+        db.session.commit()
+
+    admin = make_user('super_admin')
+    window = {'metric': 'views', 'interval': 'hour', 'start': '2026-01-05T09:00:00', 'end': '2026-01-05T10:00:00'}
+    assert analytics(client, admin, scope='repository', id=repo_id, **window)['total'] == 3
+    assert analytics(client, admin, scope='share_link', id=links[1], **window)['total'] == 2
+
+@pytest.mark.parametrize('args, error', [
+    ({'id': 1, 'interval': 'week'}, 'interval must be one of'),
+    ({'id': 1, 'metric': 'uploads'}, 'metric must be one of'),
+    ({'id': 1, 'metric': 'views', 'scope': 'file'}, 'views can be scoped to'),
+    ({'id': 1, 'start': '2026-01-05T10:00:00', 'end': '2026-01-05T09:00:00'}, 'end must be after start'),
+    ({'id': 1, 'interval': 'minute', 'start': '2026-01-01T00:00:00', 'end': '2026-01-05T00:00:00'}, 'at most'),
+    ({'id': 1, 'start': 'yesterday'}, "Invalid timestamp 'yesterday'"),
+    ({}, 'id is required'),
+])
+def test_bad_requests(client, make_user, args, error):
+    response = client.get('/api/admin/analytics', headers=make_user('super_admin'), query_string=args)
+    assert response.status_code == 400
+    assert error in response.json['error']
+
+def test_admins_only(client, make_user):
+    assert client.get('/api/admin/analytics?id=1', headers=make_user()).status_code == 403
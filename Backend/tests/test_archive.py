@@ -0,0 +1,73 @@
+"""Repository export as a ZIP streamed on the fly."""
+import io
+import os
+import zipfile
+from sqlalchemy import func, select
+from server import storage
+from server.archive import archive_entries, generate_zip
+from server.extensions import db
+from server.models import DownloadLog, File
+from server.storage import COPY_BUFFER_SIZE
+from server.writebehind import log_writer
+
+
+def unzip(response):
+    assert response.status_code == 200, response.data
+    return zipfile.ZipFile(io.BytesIO(response.get_data()))
+
+def test_owner_exports_repository(client, make_user, make_repository, make_file):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    make_file(owner, repo_id, b'%PDF minutes ' * 100, 'minutes.pdf')
+    make_file(owner, repo_id, b'%PDF other minutes', 'minutes.pdf')
+    make_file(owner, repo_id, b'\x89PNG not really', 'chart.png')
+
+    response = client.get(f'/api/repositories/{repo_id}/archive', headers=owner)
+    assert response.is_streamed
+    assert response.headers['Accept-Ranges'] == 'none'
+    assert response.headers['Content-Disposition'].endswith('.zip"')
+    archive = unzip(response)
+    assert archive.testzip() is None
+    assert archive.namelist() == ['minutes.pdf', 'minutes (1).pdf', 'chart.png']
+    assert archive.read('minutes (1).pdf') == b'%PDF other minutes'
+    # Compressed formats are stored, the rest deflated
+    assert archive.getinfo('chart.png').compress_type == zipfile.ZIP_STORED
+    assert archive.getinfo('minutes.pdf').compress_type == zipfile.ZIP_DEFLATED
+
+def test_export_refused_to_others(client, make_user, make_repository):
+    owner, other = make_user(), make_user()
+    repo_id = make_repository(owner, files=1)
+    assert client.get(f'/api/repositories/{repo_id}/archive', headers=other).status_code == 403
+    assert client.get(f'/api/repositories/{repo_id}/archive', headers=make_user('super_admin')).status_code == 200
+
+def test_large_file_streamed_in_chunks(app, make_user, make_repository, make_file):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    content = os.urandom(COPY_BUFFER_SIZE * 3)
+    make_file(owner, repo_id, content, 'scan.png')
+
+    with app.test_request_context():
+        chunks = list(generate_zip(archive_entries(File.query.filter_by(repository_id=repo_id))))
+    assert len([chunk for chunk in chunks if chunk]) > 3
+    assert max(len(chunk) for chunk in chunks) <= COPY_BUFFER_SIZE + 1024
+    assert zipfile.ZipFile(io.BytesIO(b''.join(chunks))).read('scan.png') == content
+
+def test_missing_content_skipped(app, client, make_user, make_repository, make_file):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    make_file(owner, repo_id, b'kept', 'kept.pdf')
+    gone = make_file(owner, repo_id, b'content removed from disk', 'gone.pdf')
+    with app.app_context():
+        os.remove(storage.absolute_path(db.session.get(File, gone['id']).file_path))
+
+    assert unzip(client.get(f'/api/repositories/{repo_id}/archive', headers=owner)).namelist() == ['kept.pdf']
+
+def test_shared_export_logged_per_file(app, client, make_user, make_repository, make_share_link):
+    owner = make_user()
+    repo_id = make_repository(owner, files=3)
+    token = make_share_link(owner, repo_id)
+
+    assert len(unzip(client.get(f'/api/share/{token}/archive')).namelist()) == 3
+    log_writer.flush_now()
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).where(DownloadLog.repository_id == repo_id)) == 3
@@ -0,0 +1,64 @@
+"""Access of deleted, unapproved and demoted users, checked against the user cache."""
+import time
+import pytest
+from flask_jwt_extended import decode_token
+from sqlalchemy import delete, update
+from server import cache
+from server.extensions import db
+from server.models import User
+
+
+@pytest.fixture
+def ttl_elapsed(app, monkeypatch):
+    """Moves the user cache's clock past USER_CACHE_TTL, as if the entries had aged."""
+    def elapse():
+        now = time.monotonic() + app.config['USER_CACHE_TTL'] + 1
+        monkeypatch.setattr(cache.time, 'monotonic', lambda: now)
+    return elapse
+
+def user_id(app, auth):
+    with app.app_context():
+        return int(decode_token(auth['Authorization'].split()[1])['sub'])
+
+def change_user(app, uid, statement):
+    # Another worker changes the row: this process's cache is not told
+    with app.app_context():
+        db.session.execute(statement.where(User.id == uid))
+        db.session.commit()
+
+def test_deleted_user_refused(app, client, make_user, ttl_elapsed):
+    auth = make_user()
+    uid = user_id(app, auth)
+    change_user(app, uid, delete(User))
+
+    ttl_elapsed()
+    assert client.get('/api/repositories', headers=auth).status_code == 401
+
+def test_unapproved_user_refused(app, client, make_user, ttl_elapsed):
+    auth = make_user()
+    uid = user_id(app, auth)
+    change_user(app, uid, update(User).values(is_approved=False))
+
+    ttl_elapsed()
+    assert client.get('/api/repositories', headers=auth).status_code == 401
+
+def test_unapproved_by_admin_refused_at_once(app, client, make_user):
+    admin, auth = make_user('super_admin'), make_user()
+    uid = user_id(app, auth)
+    assert client.get('/api/repositories', headers=auth).status_code == 200
+
+    response = client.post(f'/api/admin/users/{uid}/approve', headers=admin, json={'approved': False})
+    assert response.status_code == 200
+    assert client.get('/api/repositories', headers=auth).status_code == 401
+
+def test_demoted_admin_loses_admin_routes(app, client, make_user, ttl_elapsed):
+    admin = make_user('super_admin')
+    assert client.get('/api/admin/users', headers=admin).status_code == 200
+    change_user(app, user_id(app, admin), update(User).values(role='user'))
+
+    ttl_elapsed()
+    assert client.get('/api/admin/users', headers=admin).status_code == 403
+    assert client.get('/api/repositories', headers=admin).status_code == 200
+
+def test_regular_user_refused_admin_routes(client, make_user):
+    assert client.get('/api/admin/users', headers=make_user()).status_code == 403
@@ -0,0 +1,60 @@
+"""Uploading several files in one request."""
+import io
+from server import storage
+from server.extensions import db
+from server.models import File
+
+
+def batch(client, auth, repo_id, files, **form):
+    return client.post(f'/api/files/repositories/{repo_id}/upload/batch', headers=auth, content_type='multipart/form-data',
+                       data={'files': [(io.BytesIO(content), name) for name, content in files], **form})
+
+def test_every_part_stored(app, client, make_user, make_repository):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    response = batch(client, owner, repo_id, [('a.pdf', b'first'), ('b.pdf', b'second'), ('c.pdf', b'first')],
+                     tags='minutes, 2026')
+    assert response.status_code == 201, response.json
+    assert response.json['uploaded'] == 3 and response.json['failed'] == 0
+    files = [result['file'] for result in response.json['results']]
+    assert [f['filename'] for f in files] == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert all(f['id'] for f in files)
+
+    tagged = client.get(f'/api/repositories/{repo_id}?tag=minutes', headers=owner).json['files']
+    assert sorted(f['filename'] for f in tagged) == ['a.pdf', 'b.pdf', 'c.pdf']
+    with app.app_context():
+        # Identical content is stored once
+        blobs = [db.session.get(File, f['id']).blob_id for f in files]
+    assert blobs[0] == blobs[2] != blobs[1]
+
+def test_bad_parts_reported_by_index(client, make_user, make_repository):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    response = batch(client, owner, repo_id, [('a.pdf', b'kept'), ('script.exe', b'MZ'), ('b.pdf', b'kept too')])
+    assert response.status_code == 207
+    assert response.json['uploaded'] == 2 and response.json['failed'] == 1
+    assert response.json['results'][1] == {'index': 1, 'filename': 'script.exe', 'error': 'File type not allowed'}
+
+    refused = batch(client, owner, repo_id, [('script.exe', b'MZ')])
+    assert refused.status_code == 400 and refused.json['failed'] == 1
+
+def test_failed_write_reported(client, monkeypatch, make_user, make_repository):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    stage_many = storage.stage_many
+    def second_fails(streams):
+        results = stage_many(streams)
+        return [OSError('disk full') if i == 1 else result for i, result in enumerate(results)]
+    monkeypatch.setattr(storage, 'stage_many', second_fails)
+
+    response = batch(client, owner, repo_id, [('a.pdf', b'one'), ('b.pdf', b'two')])
+    assert response.status_code == 207
+    assert response.json['results'][1]['error'] == 'Could not store file'
+
+def test_limits(app, client, make_user, make_repository):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    assert batch(client, owner, repo_id, []).status_code == 400
+    limit = app.config['UPLOAD_BATCH_MAX_FILES']
+    too_many = batch(client, owner, repo_id, [(f'{i}.pdf', b'x') for i in range(limit + 1)])
+    assert too_many.status_code == 400
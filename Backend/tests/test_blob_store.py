@@ -0,0 +1,50 @@
+"""Reference counting of the content-addressed blob store under concurrent release."""
+import io
+import os
+from server import storage, tombstones
+from server.extensions import db
+from server.models import Blob, PendingUnlink
+
+
+def stage(content):
+    return storage.stage_stream(io.BytesIO(content))
+
+def test_acquire_blob_released_meanwhile(app):
+    with app.app_context():
+        blob = storage.store_staged(stage(b'released meanwhile'))
+        db.session.commit()
+        # Its last reference is released by another request after this one read it
+        Blob.query.filter_by(id=blob.id).delete()
+        db.session.commit()
+
+        assert storage.acquire_blob(blob) is None
+        stored = storage.store_staged(stage(b'released meanwhile'))
+        db.session.commit()
+        assert Blob.query.filter_by(sha256=blob.sha256).one().ref_count == 1
+        assert os.path.exists(stored.path)
+
+def test_stored_again_before_unlink(app):
+    with app.app_context():
+        blob = storage.store_staged(stage(b'purged then uploaded again'))
+        db.session.delete(blob)
+        db.session.add(PendingUnlink(path=blob.path, sha256=blob.sha256))
+        db.session.commit()
+
+        # Uploaded again, not yet committed, when the purge gets to the queued unlink
+        again = storage.store_staged(stage(b'purged then uploaded again'))
+        assert PendingUnlink.query.filter_by(sha256=blob.sha256).count() == 0
+        db.session.commit()
+
+        tombstones.unlink_pending()
+        assert os.path.exists(again.path)
+
+def test_unlink_pending_removes_released_content(app):
+    with app.app_context():
+        blob = storage.store_staged(stage(b'released for good'))
+        db.session.delete(blob)
+        db.session.add(PendingUnlink(path=blob.path, sha256=blob.sha256))
+        db.session.commit()
+
+        assert tombstones.unlink_pending() == 1
+        assert not os.path.exists(blob.path)
+        assert PendingUnlink.query.count() == 0
@@ -0,0 +1,84 @@
+"""Write-behind batching of DownloadLog and LinkAccessLog rows."""
+import time
+from datetime import datetime
+from sqlalchemy import func, select
+from server.extensions import db
+from server.models import LinkAccessLog
+from server.writebehind import LogWriter
+
+# Flushes only when a test asks for it
+IDLE = {'LOG_WRITE_BEHIND': True, 'LOG_FLUSH_INTERVAL': 3600.0}
+
+
+def access_rows(app, link):
+    with app.app_context():
+        return db.session.scalar(select(func.count()).where(LinkAccessLog.share_link_id == link))
+
+def test_rows_wait_for_the_flush(app, worker, make_user, make_repository, make_share_link, share_link_id):
+    owner = make_user()
+    link = share_link_id(make_share_link(owner, make_repository(owner)))
+    writer = worker(LogWriter, LOG_BATCH_SIZE=10, **IDLE)
+
+    with app.app_context():
+        for i in range(5):
+            writer.add(LinkAccessLog, share_link_id=link, ip_address=f'10.0.0.{i}')
+    queued_by = datetime.utcnow()
+    assert access_rows(app, link) == 0
+    assert writer.stats()['pending'] == 5
+
+    writer.flush_now()
+    assert access_rows(app, link) == 5
+    assert writer.stats() == {'enabled': True, 'pending': 0, 'queued': 5, 'written': 5, 'dropped': 0, 'failed': 0}
+    with app.app_context():
+        # Stamped when queued, not when written
+        latest = db.session.scalar(select(func.max(LinkAccessLog.accessed_at))
+                                   .where(LinkAccessLog.share_link_id == link))
+    assert latest <= queued_by
+
+def test_full_batch_wakes_the_writer(app, worker, make_user, make_repository, make_share_link, share_link_id):
+    owner = make_user()
+    link = share_link_id(make_share_link(owner, make_repository(owner)))
+    writer = worker(LogWriter, LOG_BATCH_SIZE=3, **IDLE)
+
+    with app.app_context():
+        writer.add_many(LinkAccessLog, [{'share_link_id': link}] * 3)
+    deadline = time.monotonic() + 5
+    while access_rows(app, link) < 3 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert access_rows(app, link) == 3
+
+def test_full_queue_drops_and_counts(app, worker, make_user, make_repository, make_share_link, share_link_id):
+    owner = make_user()
+    link = share_link_id(make_share_link(owner, make_repository(owner)))
+    writer = worker(LogWriter, LOG_QUEUE_SIZE=3, LOG_BATCH_SIZE=100, **IDLE)
+
+    with app.app_context():
+        writer.add_many(LinkAccessLog, [{'share_link_id': link}] * 5)
+    assert writer.stats()['dropped'] == 2
+    assert writer.stats()['queued'] == 3
+
+    writer.flush_now()
+    assert access_rows(app, link) == 3
+
+def test_bad_row_does_not_lose_the_batch(app, worker, make_user, make_repository, make_share_link, share_link_id):
+    owner = make_user()
+    link = share_link_id(make_share_link(owner, make_repository(owner)))
+    writer = worker(LogWriter, **IDLE)
+
+    with app.app_context():
+        writer.add_many(LinkAccessLog, [{'share_link_id': link}, {'share_link_id': None},
+                                        {'share_link_id': link}])
+    writer.flush_now()
+    assert access_rows(app, link) == 2
+    assert writer.stats()['written'] == 2
+    assert writer.stats()['failed'] == 1
+
+def test_disabled_writes_inline(app, worker, make_user, make_repository, make_share_link, share_link_id):
+    owner = make_user()
+    link = share_link_id(make_share_link(owner, make_repository(owner)))
+    writer = worker(LogWriter, LOG_WRITE_BEHIND=False)
+
+    with app.app_context():
+        writer.add(LinkAccessLog, share_link_id=link)
+    assert access_rows(app, link) == 1
+    assert writer.stats()['written'] == 1
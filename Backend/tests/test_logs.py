@@ -0,0 +1,57 @@
+"""JSON application logs: request ids, the access log and the bounded queue records wait in."""
+import json
+import logging
+import queue
+import re
+import sys
+from flask import g
+from server.logs import JsonFormatter, RequestQueueHandler, SamplingFilter
+
+
+def record(level=logging.INFO, msg='hello %s', args=('world',), **extra):
+    return logging.makeLogRecord({'name': 'server.test', 'levelno': level, 'levelname': logging.getLevelName(level),
+                                  'msg': msg, 'args': args, **extra})
+
+def test_request_id_echoed_or_generated(client):
+    response = client.get('/api/repositories', headers={'X-Request-ID': 'upstream-42'})
+    assert response.headers['X-Request-ID'] == 'upstream-42'
+    assert re.fullmatch('[0-9a-f]{32}', client.get('/api/repositories').headers['X-Request-ID'])
+
+def test_access_log_fields(client, make_user, caplog):
+    auth = make_user()
+    with caplog.at_level(logging.INFO, logger='server.access'):
+        client.get('/api/repositories', headers=auth)
+    [entry] = [r for r in caplog.records if r.name == 'server.access' and r.path == '/api/repositories']
+    assert entry.getMessage() == 'GET /api/repositories 200'
+    assert (entry.method, entry.status, entry.endpoint) == ('GET', 200, 'repositories.get_repositories')
+    assert entry.duration_ms >= 0
+
+def test_records_carry_request_id_and_extras(app):
+    handler = RequestQueueHandler(queue.Queue())
+    with app.test_request_context('/'):
+        g.request_id = 'req-1'
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            handler.handle(record(logging.ERROR, repository_id=7, exc_info=sys.exc_info()))
+
+    entry = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+    assert entry['level'] == 'ERROR'
+    assert entry['logger'] == 'server.test'
+    assert entry['msg'] == 'hello world'
+    assert entry['request_id'] == 'req-1'
+    assert entry['repository_id'] == 7
+    assert 'ZeroDivisionError' in entry['exc']
+    assert entry['ts'].endswith('+00:00')
+
+def test_full_queue_drops_and_counts():
+    handler = RequestQueueHandler(queue.Queue(maxsize=2))
+    for _ in range(5):
+        handler.handle(record())
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+def test_sampling_keeps_warnings():
+    sampler = SamplingFilter(0.0)
+    assert not sampler.filter(record(logging.INFO))
+    assert sampler.filter(record(logging.WARNING))
@@ -0,0 +1,108 @@
+"""Metrics of several processes added up through the files of the metrics store."""
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+import pytest
+from server.metrics import MERGED_FILE, Counter, Gauge, Histogram, MetricsRegistry
+
+
+@pytest.fixture
+def store(tmp_path):
+    """A registry of its own on an empty store, with one metric of each kind."""
+    registry = MetricsRegistry()
+    registry.directory = str(tmp_path)
+    return SimpleNamespace(
+        registry=registry,
+        requests=Counter(registry, 'requests_total', 'Requests.', ('status',)),
+        in_flight=Gauge(registry, 'in_flight', 'Requests being handled.'),
+        latency=Histogram(registry, 'latency_seconds', 'Latency.', buckets=(0.1, 1.0)),
+        path=lambda name: os.path.join(str(tmp_path), name),
+    )
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def exited_pid():
+    child = subprocess.Popen([sys.executable, '-c', ''])
+    child.wait()
+    return child.pid
+
+def other_process(store, pid, requests=0, in_flight=0, latency=None, token='other'):
+    """Writes the file another worker with this pid would have written."""
+    samples = [['requests_total', ['200'], requests], ['in_flight', [], in_flight]]
+    if latency:
+        samples.append(['latency_seconds', [], latency])
+    with open(store.path(f'{pid}.json'), 'w') as f:
+        json.dump({'pid': pid, 'token': token, 'samples': samples}, f)
+
+def test_live_processes_added_up(store):
+    store.requests.inc('200', amount=2)
+    store.in_flight.inc()
+    store.latency.observe(value=0.05)
+    # The parent pytest process stands in for a live worker
+    other_process(store, os.getppid(), requests=3, in_flight=4, latency=[0, 1, 1, 7.5])
+
+    totals = store.registry.collect()
+    assert totals[('requests_total', ('200',))] == 5
+    assert totals[('in_flight', ())] == 5
+    assert totals[('latency_seconds', ())] == [1, 1, 1, 7.55]
+
+def test_exited_process_folded_in(store):
+    store.requests.inc('200')
+    pid = exited_pid()
+    other_process(store, pid, requests=10, in_flight=3)
+
+    totals = store.registry.collect()
+    # Its counters keep counting, its gauges no longer describe anything running
+    assert totals[('requests_total', ('200',))] == 11
+    assert ('in_flight', ()) not in totals
+    assert not os.path.exists(store.path(f'{pid}.json'))
+    assert store.registry.collect() == totals
+    assert load(store.path(MERGED_FILE))['samples'] == [['requests_total', ['200'], 10]]
+
+def test_file_of_an_earlier_process_with_this_pid(store):
+    other_process(store, os.getpid(), requests=6, token='earlier')
+    store.requests.inc('200')
+    store.registry.write()
+
+    assert load(store.path(f'{os.getpid()}.json'))['token'] != 'earlier'
+    assert store.registry.collect()[('requests_total', ('200',))] == 7
+
+def test_forked_worker_starts_from_zero(store):
+    store.requests.inc('200', amount=5)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            store.requests.inc('200', amount=2)
+            store.registry.write()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert store.registry.collect()[('requests_total', ('200',))] == 7
+
+def test_samples_of_other_code_versions_ignored(store):
+    with open(store.path(f'{exited_pid()}.json'), 'w') as f:
+        json.dump({'pid': 0, 'token': 'old', 'samples': [
+            ['removed_total', [], 4], ['requests_total', ['200', 'GET'], 4], ['latency_seconds', [], [1, 2.0]],
+            ['requests_total', ['500'], 1],
+        ]}, f)
+    totals = store.registry.collect()
+    assert totals == {('requests_total', ('500',)): 1}
+
+def test_render(store):
+    store.requests.inc('a "quoted" status')
+    store.latency.observe(value=0.5)
+    store.latency.observe(value=3)
+    lines = store.registry.render().splitlines()
+    assert '# TYPE latency_seconds histogram' in lines
+    assert 'requests_total{status="a \\"quoted\\" status"} 1' in lines
+    assert [line for line in lines if line.startswith('latency_seconds')] == [
+        'latency_seconds_bucket{le="0.1"} 0',
+        'latency_seconds_bucket{le="1.0"} 1',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        'latency_seconds_sum 3.5',
+        'latency_seconds_count 2',
+    ]
@@ -0,0 +1,42 @@
+"""Keyset pagination of the list endpoints."""
+import base64
+import json
+import pytest
+from server.pagination import encode_cursor
+
+
+def raw_cursor(*payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+def test_pages_follow_cursor(client, make_user, make_repository):
+    auth = make_user()
+    ids = [make_repository(auth) for _ in range(5)]
+    seen = []
+    response = client.get('/api/repositories?limit=2&sort=-created_at&fields=id', headers=auth)
+    while True:
+        assert response.status_code == 200, response.json
+        assert all(item.keys() == {'id'} for item in response.json)
+        seen += [item['id'] for item in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        response = client.get(f'/api/repositories?limit=2&sort=-created_at&fields=id&cursor={cursor}', headers=auth)
+    assert seen == ids[::-1]
+
+@pytest.mark.parametrize('sort, cursor', [
+    ('id', raw_cursor('id', [1], 1)),
+    ('id', raw_cursor('id', {'a': 1}, 1)),
+    ('id', raw_cursor('id', '7', 1)),
+    ('id', raw_cursor('id', True, 1)),
+    ('created_at', raw_cursor('created_at', 5, 1)),
+    ('created_at', raw_cursor('created_at', {'dt': 'yesterday'}, 1)),
+    ('created_at', raw_cursor('created_at', {'dt': [1]}, 1)),
+    ('created_at', raw_cursor('created_at', {'dt': '2026-01-01T00:00:00'}, [1])),
+    ('id', raw_cursor('id', 1)),
+    ('id', 'not-a-cursor!'),
+    ('id', encode_cursor('-id', 1, 1)),
+])
+def test_bad_cursor_is_refused(client, make_user, sort, cursor):
+    response = client.get(f'/api/repositories?limit=2&sort={sort}&cursor={cursor}', headers=make_user())
+    assert response.status_code == 400
+    assert response.json['error']
@@ -0,0 +1,39 @@
+"""Admission control of the password hashing pool."""
+import time
+import pytest
+from server.passwords import PasswordHasher, HashingBusy
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher()
+    hasher.workers = 1
+    hasher.max_pending = 1
+    yield hasher
+    if hasher._executor is not None:
+        hasher._executor.shutdown(cancel_futures=True)
+
+def wait_for_idle(hasher, seconds=10):
+    deadline = time.monotonic() + seconds
+    while hasher.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return hasher.stats()['in_flight']
+
+def test_timed_out_job_holds_its_slot_until_it_finishes(hasher):
+    # Start the worker process first, so the slow job is running when the wait times out
+    assert hasher._run(abs, -1) == 1
+
+    hasher.timeout = 0.2
+    with pytest.raises(HashingBusy):
+        hasher._run(time.sleep, 1.5)
+    assert hasher.stats()['in_flight'] == 1
+
+    # Still running: a new job is turned away instead of queueing behind it
+    with pytest.raises(HashingBusy):
+        hasher._run(abs, -2)
+    assert hasher.stats()['rejected'] == 1
+
+    assert wait_for_idle(hasher) == 0
+    hasher.timeout = 10.0
+    assert hasher._run(abs, -3) == 3
+    assert hasher.stats()['timed_out'] == 1
@@ -0,0 +1,28 @@
+import pytest
+from server.extensions import db
+from server.models import User
+
+
+def test_within_budget(client, query_budget, make_user):
+    auth = make_user()
+    with query_budget(5) as profile:
+        assert client.get('/api/repositories', headers=auth).status_code == 200
+    assert 0 < profile.count <= 5
+
+def test_budget_exceeded(client, query_budget, make_user):
+    auth = make_user()
+    with pytest.raises(pytest.fail.Exception, match=r'statements executed, budget is 0'):
+        with query_budget(0):
+            client.get('/api/repositories', headers=auth)
+
+def test_repeated_statement_fails(app, query_budget):
+    with pytest.raises(pytest.fail.Exception, match=r'6x SELECT'):
+        with app.app_context(), query_budget(10, repeat_threshold=5):
+            for user_id in range(6):
+                db.session.get(User, user_id + 1000)
+
+def test_repeated_statement_allowed(app, query_budget):
+    with app.app_context(), query_budget(10, repeat_threshold=None) as profile:
+        for user_id in range(6):
+            db.session.get(User, user_id + 1000)
+    assert profile.count == 6
@@ -0,0 +1,68 @@
+"""Statement counts of the list and detail endpoints.
+
+Each endpoint runs a fixed number of statements however many rows it
+returns: one repository with one file costs the same as several
+repositories with several files each. The counts include the user lookup
+of the token check (the caches are cleared before every request).
+"""
+from server.cache import payload_cache, user_cache
+
+
+def statements(client, query_budget, budget, url, auth=None):
+    """Statements run by one GET of url; query_budget fails the test above budget or on repeated shapes."""
+    for cache in (payload_cache, user_cache):
+        cache.clear()
+    with query_budget(budget) as profile:
+        response = client.get(url, headers=auth or {})
+    assert response.status_code == 200, response.json
+    return profile.count
+
+
+def test_get_repositories(client, query_budget, make_user, make_repository):
+    one, many = make_user(), make_user()
+    make_repository(one, files=1)
+    for _ in range(4):
+        make_repository(many, files=6)
+
+    assert statements(client, query_budget, 2, '/api/repositories', one) == 2
+    assert statements(client, query_budget, 2, '/api/repositories', many) == 2
+
+def test_get_repository(client, query_budget, make_user, make_repository):
+    owner = make_user()
+    small = make_repository(owner, files=1)
+    large = make_repository(owner, files=8)
+    meeting = client.post(f'/api/repositories/{large}/meetings', headers=owner,
+                          json={'title': 'Review', 'platform': 'zoom', 'meeting_url': 'https://example.com/m'})
+    assert meeting.status_code == 201, meeting.json
+
+    assert statements(client, query_budget, 4, f'/api/repositories/{small}', owner) == 4
+    assert statements(client, query_budget, 4, f'/api/repositories/{large}', owner) == 4
+
+def test_share_view(client, query_budget, make_user, make_repository, make_share_link):
+    owner = make_user()
+    small = make_share_link(owner, make_repository(owner, files=1))
+    large = make_share_link(owner, make_repository(owner, files=8))
+
+    assert statements(client, query_budget, 3, f'/api/share/{small}') == 3
+    assert statements(client, query_budget, 3, f'/api/share/{large}') == 3
+
+def test_get_all_repositories(client, query_budget, make_user, make_repository):
+    admin, owner = make_user('super_admin'), make_user()
+    make_repository(owner, files=1)
+    assert statements(client, query_budget, 2, '/api/admin/repositories', admin) == 2
+
+    for _ in range(3):
+        make_repository(make_user(), files=4)
+    assert statements(client, query_budget, 2, '/api/admin/repositories', admin) == 2
+
+def test_get_all_share_links(client, query_budget, make_user, make_repository, make_share_link):
+    admin, owner = make_user('super_admin'), make_user()
+    make_share_link(owner, make_repository(owner))
+    assert statements(client, query_budget, 2, '/api/admin/share-links', admin) == 2
+
+    for _ in range(3):
+        creator = make_user()
+        repo_id = make_repository(creator)
+        for permission in ('view', 'edit'):
+            make_share_link(creator, repo_id, permission)
+    assert statements(client, query_budget, 2, '/api/admin/share-links', admin) == 2
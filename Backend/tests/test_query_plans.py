@@ -0,0 +1,15 @@
+"""Plans of the statements the routes run, on the migrated schema."""
+from tests.query_plans import PLAN_CHECKS, check_query_plans
+
+
+def test_no_unexpected_full_scans(app):
+    with app.app_context():
+        failures = check_query_plans()
+    assert not failures, '\n'.join(f'{name}: full scan of {table}\n    ' + '\n    '.join(plan)
+                                   for name, table, plan in failures)
+
+def test_route_lists_are_checked_with_cursors():
+    names = {name for name, _, _ in PLAN_CHECKS}
+    for route in ('repositories.get_repositories', 'repositories.get_repository:files',
+                  'share.access_shared_repository:files', 'admin.get_all_repositories', 'admin.get_all_share_links'):
+        assert f'{route}?sort=-created_at&cursor' in names
@@ -0,0 +1,76 @@
+"""Conditional and byte-range downloads."""
+import pytest
+from werkzeug.http import http_date
+
+CONTENT = bytes(range(256)) * 4
+FUTURE = http_date(4102444800)  # 2100-01-01
+
+
+@pytest.fixture
+def download(client, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), CONTENT, 'report.pdf')['id']
+
+    def get(**headers):
+        return client.get(f'/api/files/{file_id}/download', headers={**auth, **headers})
+    return get
+
+def parts(response):
+    """(Content-Range, body) of each part of a multipart/byteranges response."""
+    boundary = response.mimetype_params['boundary'].encode()
+    found = []
+    for part in response.data.split(b'--' + boundary)[1:-1]:
+        head, body = part.split(b'\r\n\r\n', 1)
+        ranges = [line.split(b': ', 1)[1].decode() for line in head.split(b'\r\n') if line.startswith(b'Content-Range')]
+        found.append((ranges[0], body[:-2]))
+    return found
+
+def test_multiple_ranges(download):
+    response = download(Range='bytes=0-1,5-6')
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=report.pdf'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert parts(response) == [(f'bytes 0-1/{len(CONTENT)}', CONTENT[0:2]), (f'bytes 5-6/{len(CONTENT)}', CONTENT[5:7])]
+
+def test_overlapping_and_adjacent_ranges_are_merged(download):
+    response = download(Range='bytes=10-19,0-4,15-29,5-7')
+    assert parts(response) == [(f'bytes 0-7/{len(CONTENT)}', CONTENT[0:8]), (f'bytes 10-29/{len(CONTENT)}', CONTENT[10:30])]
+
+    single = download(Range='bytes=0-9,10-19')
+    assert single.status_code == 206
+    assert single.headers['Content-Range'] == f'bytes 0-19/{len(CONTENT)}'
+    assert single.data == CONTENT[0:20]
+
+@pytest.mark.parametrize('conditional', [{'If-Modified-Since': FUTURE}, {'If-None-Match': 'etag'}])
+def test_not_modified_before_ranges(download, conditional):
+    if 'If-None-Match' in conditional:
+        conditional = {'If-None-Match': download().headers['ETag']}
+    for ranges in ('bytes=0-1', 'bytes=0-1,5-6', 'bytes=' + ','.join(f'{i}-{i}' for i in range(0, 80, 4))):
+        assert download(Range=ranges, **conditional).status_code == 304
+
+def test_stale_if_range_sends_the_whole_file(download):
+    etag = download().headers['ETag']
+    for ranges in ('bytes=0-1', 'bytes=0-1,5-6'):
+        current = download(Range=ranges, **{'If-Range': etag})
+        assert current.status_code == 206
+        stale = download(Range=ranges, **{'If-Range': '"stale"'})
+        assert stale.status_code == 200
+        assert stale.data == CONTENT
+
+def test_too_many_ranges_send_the_whole_file(download):
+    response = download(Range='bytes=' + ','.join(f'{i}-{i}' for i in range(0, 80, 4)))
+    assert response.status_code == 200
+    assert response.data == CONTENT
+
+def test_unsatisfiable_ranges(download):
+    for ranges in (f'bytes={len(CONTENT)}-', f'bytes={len(CONTENT)}-{len(CONTENT) + 5},{len(CONTENT) + 10}-'):
+        response = download(Range=ranges)
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+def test_parse_byte_ranges():
+    from server.ranges import parse_byte_ranges
+    assert parse_byte_ranges('bytes=5-6,0-1,-3,10-') == [(5, 7), (0, 2), (-3, None), (10, None)]
+    for malformed in (None, '', 'items=0-1', 'bytes=1', 'bytes=5-2', 'bytes=a-b', 'bytes=0-1,,2-3'):
+        assert parse_byte_ranges(malformed) == []
@@ -0,0 +1,87 @@
+"""Log rows moved to archive segments by archive_table() and read back from them."""
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from server import analytics, retention, rollups
+from server.extensions import db
+from server.models import DownloadLog, LinkAccessLog, LogSegment
+
+DAY = datetime(2026, 2, 10)
+OLD = DAY.replace(hour=23, minute=30)
+
+
+def archive_all(table_name):
+    # Rows earlier tests left behind are archived along with the test's own
+    return retention.archive_table(table_name, older_than=datetime.utcnow() + timedelta(days=1))
+
+def live_ids(model, ids):
+    return set(db.session.scalars(select(model.id).where(model.id.in_(ids))))
+
+@pytest.fixture
+def repository(make_user, make_repository, make_file, make_share_link, share_link_id):
+    """A repository with one file and one share link; returns (repo id, file id, link id)."""
+    owner = make_user()
+    repo_id = make_repository(owner)
+    file_id = make_file(owner, repo_id, b'archived', 'archived.pdf')['id']
+    return repo_id, file_id, share_link_id(make_share_link(owner, repo_id))
+
+def add(*rows):
+    db.session.add_all(rows)
+    db.session.commit()
+    return [row.id for row in rows]
+
+def test_old_downloads_read_back_from_segments(app, repository):
+    repo_id, file_id, link_id = repository
+    with app.app_context():
+        moments = [OLD, OLD + timedelta(minutes=20), OLD + timedelta(hours=1)]
+        ids = add(DownloadLog(file_id=file_id, repository_id=repo_id, downloaded_at=moments[0]),
+                  DownloadLog(file_id=file_id, repository_id=repo_id, share_link_id=link_id, downloaded_at=moments[1]),
+                  DownloadLog(file_id=file_id, repository_id=repo_id, downloaded_at=moments[2]))
+        # The newest row always stays
+        add(DownloadLog(file_id=file_id, repository_id=repo_id, downloaded_at=datetime.utcnow()))
+        rollups.catch_up(settle_seconds=0)
+        assert archive_all('download_log') >= 3
+        assert live_ids(DownloadLog, ids) == set()
+
+        segments = retention.segments_query('download_log', OLD, OLD + timedelta(days=2)).all()
+        assert [segment.day for segment in segments] == [OLD.date(), OLD.date() + timedelta(days=1)]
+        assert all(os.path.exists(segment.path) for segment in segments)
+        archived = [row for row in retention.read_archive('download_log', OLD, OLD + timedelta(days=2))
+                    if row['file_id'] == file_id]
+        assert [(row['id'], row['share_link_id'], row['downloaded_at']) for row in archived] == \
+            [(ids[0], None, moments[0]), (ids[1], link_id, moments[1]), (ids[2], None, moments[2])]
+
+        # Analytics count archived rows like live ones
+        points = analytics.series('downloads', 'file', file_id, 'day', DAY, OLD + timedelta(days=1))
+        assert [point['count'] for point in points] == [2, 1]
+
+def test_uncounted_downloads_stay(app, repository):
+    repo_id, file_id, _ = repository
+    with app.app_context():
+        rollups.catch_up(settle_seconds=0)
+        [pending] = add(DownloadLog(file_id=file_id, repository_id=repo_id, downloaded_at=OLD))
+        archive_all('download_log')
+        assert live_ids(DownloadLog, [pending]) == {pending}
+
+        [newest] = add(DownloadLog(file_id=file_id, repository_id=repo_id, downloaded_at=OLD))
+        rollups.catch_up(settle_seconds=0)
+        archive_all('download_log')
+        # Its id would be handed out again once the row was gone
+        assert live_ids(DownloadLog, [pending, newest]) == {newest}
+
+def test_views_counted_across_archive_and_table(app, repository):
+    _, _, link_id = repository
+    with app.app_context():
+        archived = add(LinkAccessLog(share_link_id=link_id, accessed_at=OLD),
+                       LinkAccessLog(share_link_id=link_id, accessed_at=OLD + timedelta(days=1)))
+        [live] = add(LinkAccessLog(share_link_id=link_id, accessed_at=datetime.utcnow()))
+        archive_all('link_access_log')
+        assert live_ids(LinkAccessLog, archived + [live]) == {live}
+        assert db.session.scalar(select(LogSegment.row_count).where(LogSegment.table_name == 'link_access_log',
+                                                                     LogSegment.last_id == archived[-1])) >= 1
+
+        start, end = DAY, datetime.utcnow() + timedelta(days=1)
+        points = analytics.series('views', 'share_link', link_id, 'day', start, end)
+        assert sum(point['count'] for point in points) == 3
+        assert points[0]['count'] == 1
@@ -0,0 +1,77 @@
+"""Search over files, repositories and meetings: FTS5 on SQLite, and the LIKE scan used elsewhere."""
+import io
+import itertools
+import pytest
+from server.extensions import db
+
+_words = itertools.count()
+
+
+@pytest.fixture(params=['fts5', 'like'])
+def backend(request, app, monkeypatch):
+    """Runs a test against the FTS5 index and again as a database without one."""
+    if request.param == 'like':
+        with app.app_context():
+            monkeypatch.setattr(db.engine.dialect, 'name', 'unindexed')
+    return request.param
+
+@pytest.fixture
+def word():
+    """A word no other test has used, so results only hold this test's documents."""
+    return lambda: f'zq{next(_words)}x{id(_words) % 997}'
+
+def upload(client, auth, repo_id, filename, tags=''):
+    response = client.post(f'/api/files/repositories/{repo_id}/upload', headers=auth, content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(filename.encode()), filename), 'tags': tags})
+    assert response.status_code == 201, response.json
+
+def search(client, auth, q, **args):
+    response = client.get('/api/search', headers=auth, query_string={'q': q, **args})
+    assert response.status_code == 200, response.json
+    return sorted((row['type'], row['title']) for row in response.json)
+
+def test_finds_every_kind(backend, client, make_user, word):
+    owner = make_user()
+    topic = word()
+    repo = client.post('/api/repositories', headers=owner,
+                       json={'name': 'Council', 'description': f'Papers on {topic} and roads'}).json['id']
+    upload(client, owner, repo, f'{topic}_report.pdf')
+    upload(client, owner, repo, 'notes.pdf', tags=topic)
+    client.post(f'/api/repositories/{repo}/meetings', headers=owner,
+                json={'title': f'{topic} review', 'platform': 'zoom'})
+
+    assert search(client, owner, topic) == [
+        ('file', 'notes.pdf'), ('file', f'{topic}_report.pdf'), ('meeting', f'{topic} review'),
+        ('repository', 'Council')]
+    # Terms match as word prefixes
+    assert search(client, owner, topic[:-1], type='meeting') == [('meeting', f'{topic} review')]
+
+def test_every_term_must_match(backend, client, make_user, make_repository, word):
+    owner = make_user()
+    repo = make_repository(owner)
+    first, second = word(), word()
+    upload(client, owner, repo, f'{first}.pdf', tags=second)
+    upload(client, owner, repo, f'{first}_draft.pdf')
+
+    assert search(client, owner, f'{first} {second}') == [('file', f'{first}.pdf')]
+    assert len(search(client, owner, first)) == 2
+
+def test_only_visible_repositories(backend, client, make_user, make_repository, word):
+    owner, other = make_user(), make_user()
+    topic = word()
+    upload(client, owner, make_repository(owner), f'{topic}.pdf')
+
+    assert search(client, other, topic) == []
+    assert search(client, make_user('super_admin'), topic) == [('file', f'{topic}.pdf')]
+
+def test_query_syntax_is_ignored(backend, client, make_user, make_repository, word):
+    owner = make_user()
+    topic = word()
+    upload(client, owner, make_repository(owner), f'{topic}.pdf')
+    assert search(client, owner, f'("{topic}"* -:^') == [('file', f'{topic}.pdf')]
+
+def test_bad_requests(client, make_user):
+    owner = make_user()
+    assert client.get('/api/search?q=', headers=owner).status_code == 400
+    assert client.get('/api/search?q=!!', headers=owner).status_code == 400
+    assert client.get('/api/search?q=budget&type=user', headers=owner).status_code == 400
@@ -0,0 +1,63 @@
+"""The shared repository view and its cached payload."""
+from sqlalchemy import update
+from server.cache import payload_cache
+from server.extensions import db
+from server.models import Repository, ShareLink
+
+
+def test_upload_changes_etag(client, make_user, make_repository, make_share_link, make_file):
+    owner = make_user()
+    repo_id = make_repository(owner, files=1)
+    token = make_share_link(owner, repo_id)
+    before = client.get(f'/api/share/{token}')
+    assert client.get(f'/api/share/{token}', headers={'If-None-Match': before.headers['ETag']}).status_code == 304
+
+    make_file(owner, repo_id, b'another file', 'new.pdf')
+    after = client.get(f'/api/share/{token}', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert [f['filename'] for f in after.json['files']] == ['file0.pdf', 'new.pdf']
+
+def test_version_bumped_by_another_worker(app, client, make_user, make_repository, make_share_link):
+    owner = make_user()
+    repo_id = make_repository(owner, files=1)
+    token = make_share_link(owner, repo_id)
+    assert client.get(f'/api/share/{token}').json['name'].startswith('repository')
+
+    # Another process renames and bumps the row; this one's cached payload is left alone
+    with app.app_context():
+        db.session.execute(update(Repository).where(Repository.id == repo_id)
+                           .values(name='renamed', content_version=Repository.content_version + 1))
+        db.session.commit()
+    assert client.get(f'/api/share/{token}').json['name'] == 'renamed'
+
+def test_cache_key_ignores_arg_order_and_unused_args(client, make_user, make_repository, make_share_link):
+    owner = make_user()
+    token = make_share_link(owner, make_repository(owner, files=3))
+    first = client.get(f'/api/share/{token}?limit=2&sort=-id&utm_source=mail')
+    second = client.get(f'/api/share/{token}?sort=-id&limit=2')
+    assert first.data == second.data
+    assert payload_cache.stats()['size'] == 1
+    assert payload_cache.stats()['hits'] >= 1
+
+def test_revoked_link_refused_at_once(app, client, make_user, make_repository, make_share_link):
+    owner = make_user()
+    token = make_share_link(owner, make_repository(owner, files=1))
+    assert client.get(f'/api/share/{token}').status_code == 200
+
+    # Revoked by another worker: nothing in this process is told about it
+    with app.app_context():
+        db.session.execute(update(ShareLink).where(ShareLink.token == token).values(is_active=False))
+        db.session.commit()
+    response = client.get(f'/api/share/{token}')
+    assert response.status_code == 403
+    assert response.json['error'] == 'This share link has been revoked'
+
+def test_link_of_deleted_repository_not_found(client, make_user, make_repository, make_share_link):
+    admin, owner = make_user('super_admin'), make_user()
+    repo_id = make_repository(owner, files=1)
+    token = make_share_link(owner, repo_id)
+    assert client.get(f'/api/share/{token}').status_code == 200
+
+    assert client.delete(f'/api/admin/repositories/{repo_id}', headers=admin).status_code == 202
+    assert client.get(f'/api/share/{token}').status_code == 404
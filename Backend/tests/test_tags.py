@@ -0,0 +1,42 @@
+"""Normalized tags: per-repository facet counts and filtering files by tag."""
+from server.tags import parse_tags
+
+
+def test_parse_tags():
+    assert parse_tags(' Minutes,  BUDGET   2026 ,minutes,, ') == ['minutes', 'budget 2026']
+    assert parse_tags('x' * 80) == ['x' * 50]
+    assert parse_tags(','.join(f't{i}' for i in range(30))) == [f't{i}' for i in range(20)]
+    assert parse_tags(None) == []
+
+def test_facets_counted_per_repository(client, make_user, make_repository, make_file):
+    owner = make_user()
+    repo_id, other_repo = make_repository(owner), make_repository(owner)
+    make_file(owner, repo_id, b'1', 'a.pdf', tags='Minutes, Budget')
+    make_file(owner, repo_id, b'2', 'b.pdf', tags='minutes')
+    make_file(owner, repo_id, b'3', 'c.pdf', tags='roads, budget')
+    make_file(owner, other_repo, b'4', 'd.pdf', tags='minutes')
+
+    facets = client.get(f'/api/repositories/{repo_id}/tags', headers=owner)
+    assert facets.json == [{'tag': 'budget', 'count': 2}, {'tag': 'minutes', 'count': 2}, {'tag': 'roads', 'count': 1}]
+    assert client.get(f'/api/repositories/{other_repo}/tags', headers=owner).json == [{'tag': 'minutes', 'count': 1}]
+    assert client.get(f'/api/repositories/{repo_id}/tags', headers=make_user()).status_code == 403
+
+def test_files_filtered_by_every_tag(client, make_user, make_repository, make_file, make_share_link):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    uploaded = make_file(owner, repo_id, b'1', 'a.pdf', tags=' Minutes , Budget ')
+    make_file(owner, repo_id, b'2', 'b.pdf', tags='minutes')
+    make_file(owner, repo_id, b'3', 'c.pdf', tags='budget')
+    assert uploaded['tags'] == 'minutes, budget'
+
+    def names(url, auth=None):
+        response = client.get(url, headers=auth or {})
+        assert response.status_code == 200, response.json
+        return sorted(f['filename'] for f in response.json['files'])
+
+    assert names(f'/api/repositories/{repo_id}?tag=minutes', owner) == ['a.pdf', 'b.pdf']
+    assert names(f'/api/repositories/{repo_id}?tag=minutes&tag=BUDGET', owner) == ['a.pdf']
+    assert names(f'/api/repositories/{repo_id}?tag=minutes,budget', owner) == ['a.pdf']
+    assert names(f'/api/repositories/{repo_id}?tag=roads', owner) == []
+    token = make_share_link(owner, repo_id)
+    assert names(f'/api/share/{token}?tag=budget') == ['a.pdf', 'c.pdf']
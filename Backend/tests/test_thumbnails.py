@@ -0,0 +1,87 @@
+"""Thumbnail rendering and the endpoint serving it."""
+import io
+import time
+from datetime import datetime, timedelta
+from PIL import Image
+from server import storage
+from server.extensions import db
+from server.models import File, Thumbnail
+from server.thumbnails import generate, thumbnail_worker
+
+
+def png(width=640, height=480):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(out, 'PNG')
+    return out.getvalue()
+
+def rendered(timeout=10):
+    """Waits for the background renders queued so far."""
+    deadline = time.monotonic() + timeout
+    while thumbnail_worker.pending() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not thumbnail_worker.pending()
+
+def test_generate_fits_the_box(app, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), png(), 'photo.png')['id']
+    rendered()
+    with app.app_context():
+        thumb = generate(db.session.get(File, file_id), 'small', force=True)
+        assert thumb.status == 'ready'
+        assert (thumb.width, thumb.height) == (200, 150)
+        with Image.open(storage.absolute_path(thumb.path)) as img:
+            assert img.format == 'JPEG' and img.size == (200, 150)
+
+def test_generate_records_failure(app, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), b'not an image', 'broken.png')['id']
+    rendered()
+    with app.app_context():
+        thumb = generate(db.session.get(File, file_id), 'small')
+        assert thumb.status == 'failed' and thumb.path is None
+
+def test_endpoint_serves_rendition(client, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), png(), 'photo.png')['id']
+    rendered()
+    response = client.get(f'/api/files/{file_id}/thumbnail')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    cached = client.get(f'/api/files/{file_id}/thumbnail', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+    assert client.get(f'/api/files/{file_id}/thumbnail?size=huge').status_code == 400
+
+def test_endpoint_renders_missing_rendition(app, client, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), png(), 'photo.png')['id']
+    rendered()
+    with app.app_context():
+        Thumbnail.query.filter_by(file_id=file_id).delete()
+        db.session.commit()
+
+    response = client.get(f'/api/files/{file_id}/thumbnail')
+    assert response.status_code == 202 and response.headers['Retry-After']
+    rendered()
+    assert client.get(f'/api/files/{file_id}/thumbnail').status_code == 200
+
+def test_failed_rendition_retried_after_backoff(app, client, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), b'not an image', 'broken.png')['id']
+    rendered()
+    assert client.get(f'/api/files/{file_id}/thumbnail').status_code == 404
+
+    retry_after = app.config['THUMBNAIL_RETRY_AFTER']
+    with app.app_context():
+        Thumbnail.query.filter_by(file_id=file_id).update(
+            {'updated_at': datetime.utcnow() - timedelta(seconds=retry_after + 60)}, synchronize_session=False)
+        db.session.commit()
+    assert client.get(f'/api/files/{file_id}/thumbnail').status_code == 202
+    rendered()
+    # Failed again: refused until the next backoff runs out
+    assert client.get(f'/api/files/{file_id}/thumbnail').status_code == 404
+
+def test_unsupported_type(client, make_user, make_repository, make_file):
+    auth = make_user()
+    file_id = make_file(auth, make_repository(auth), b'plain text', 'notes.docx')['id']
+    assert client.get(f'/api/files/{file_id}/thumbnail').status_code == 404
@@ -0,0 +1,82 @@
+"""Deleted repositories: hidden at once as tombstones, purged later a batch at a time."""
+import os
+import pytest
+from sqlalchemy import func, select
+from server import tombstones
+from server.extensions import db
+from server.models import DownloadLog, File, FileTag, ShareLink
+from server.writebehind import log_writer
+
+
+@pytest.fixture
+def delete(client, make_user, monkeypatch):
+    """Deletes a repository as a super admin, leaving the purge to the test instead of the background purger."""
+    monkeypatch.setattr(tombstones.repository_purger, 'wake', lambda: None)
+    admin = make_user('super_admin')
+
+    def run(repo_id):
+        response = client.delete(f'/api/admin/repositories/{repo_id}', headers=admin)
+        assert response.status_code == 202, response.json
+        return response.json
+    run.admin = admin
+    return run
+
+def paths(repo_id):
+    return db.session.scalars(select(File.file_path).where(File.repository_id == repo_id)).all()
+
+def test_deleted_repository_hidden(client, make_user, make_repository, make_file, make_share_link, delete):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    file_id = make_file(owner, repo_id, b'hidden at once', 'tombstoned.pdf', tags='tombstoned')['id']
+    token = make_share_link(owner, repo_id)
+
+    result = delete(repo_id)
+    assert result['status_url'].endswith(f'/api/admin/repositories/{repo_id}/deletion')
+    assert client.get(f'/api/repositories/{repo_id}', headers=owner).status_code == 404
+    assert repo_id not in [repo['id'] for repo in client.get('/api/repositories', headers=owner).json]
+    assert client.get(f'/api/files/{file_id}/download', headers=owner).status_code == 404
+    assert client.get(f'/api/share/{token}').status_code == 404
+    assert client.get('/api/search', headers=owner, query_string={'q': 'tombstoned'}).json == []
+
+    status = client.get(result['status_url'], headers=delete.admin).json
+    assert status['status'] == 'purging'
+    assert status['remaining']['file'] == 1 and status['remaining']['share_link'] == 1
+
+def test_deletion_status_of_a_live_repository(client, make_user, make_repository, delete):
+    repo_id = make_repository(make_user())
+    assert client.get(f'/api/admin/repositories/{repo_id}/deletion', headers=delete.admin).status_code == 404
+    assert client.delete(f'/api/admin/repositories/{repo_id}', headers=make_user()).status_code == 403
+
+def test_purge_resumes_and_keeps_shared_content(app, client, make_user, make_repository, make_file,
+                                                make_share_link, delete):
+    owner = make_user()
+    repo_id = make_repository(owner, files=4)
+    shared = make_file(owner, repo_id, b'kept by another repository', 'shared.pdf', tags='purged')
+    other_id = make_repository(owner)
+    kept = make_file(owner, other_id, b'kept by another repository', 'kept.pdf')
+    token = make_share_link(owner, repo_id)
+    assert client.get(f"/api/files/{shared['id']}/download", query_string={'share_token': token}).status_code == 200
+    with app.app_context():
+        log_writer.flush_now()
+        assert db.session.scalar(select(func.count()).where(DownloadLog.repository_id == repo_id)) == 1
+        stored = set(paths(repo_id))
+
+    delete(repo_id)
+    with app.app_context():
+        # Stopped part way, as a purge interrupted by a restart would be
+        assert tombstones.purge_repository(repo_id, batch_size=2, max_batches=3) is False
+        assert db.session.scalar(select(func.count()).where(DownloadLog.repository_id == repo_id)) == 0
+        assert len(paths(repo_id)) == 3
+
+        assert tombstones.purge_repository(repo_id, batch_size=2) is True
+        assert paths(repo_id) == []
+        assert db.session.scalar(select(func.count()).where(ShareLink.repository_id == repo_id)) == 0
+        assert db.session.scalar(select(func.count()).where(FileTag.file_id == shared['id'])) == 0
+        # Only the content no other file refers to is gone from disk
+        [kept_path] = paths(other_id)
+        assert {path: os.path.exists(path) for path in stored} == {path: path == kept_path for path in stored}
+
+    status = client.get(f'/api/admin/repositories/{repo_id}/deletion', headers=delete.admin).json
+    assert status['status'] == 'purged'
+    assert set(status['remaining'].values()) == {0}
+    assert client.get(f"/api/files/{kept['id']}/download", headers=owner).data == b'kept by another repository'
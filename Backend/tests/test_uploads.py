@@ -0,0 +1,82 @@
+"""Expiry of abandoned chunked uploads and the running hashes kept for them."""
+import os
+import time
+from datetime import datetime, timedelta
+from server import storage
+from server.extensions import db
+from server.models import UploadSession
+from server.uploads import running_hashes, expire_uploads
+
+DAY = 86400
+
+
+def start_upload(client, auth, repo_id, content=b'0123456789'):
+    response = client.post(f'/api/files/repositories/{repo_id}/uploads', headers=auth,
+                           json={'filename': 'minutes.pdf', 'size': len(content)})
+    assert response.status_code == 201, response.json
+    upload_id = response.json['upload_id']
+    chunk = client.put(f'/api/files/uploads/{upload_id}', headers={**auth, 'Content-Range': f'bytes 0-4/{len(content)}'},
+                       data=content[:5])
+    assert chunk.status_code == 200, chunk.json
+    return upload_id
+
+def idle_for(app, upload_id, seconds):
+    with app.app_context():
+        UploadSession.query.filter_by(id=upload_id).update(
+            {'updated_at': datetime.utcnow() - timedelta(seconds=seconds)}, synchronize_session=False)
+        db.session.commit()
+
+def test_idle_upload_expires(app, client, make_user, make_repository):
+    auth = make_user()
+    repo_id = make_repository(auth)
+    idle, active = start_upload(client, auth, repo_id), start_upload(client, auth, repo_id)
+    with app.app_context():
+        idle_path = db.session.get(UploadSession, idle).file_path
+    idle_for(app, idle, DAY + 60)
+    idle_for(app, active, DAY + 60)
+    # A chunk written since makes the session active again
+    resumed = client.put(f'/api/files/uploads/{active}', headers={**auth, 'Content-Range': 'bytes 5-9/10'}, data=b'56789')
+    assert resumed.status_code == 200, resumed.json
+
+    with app.app_context():
+        assert expire_uploads(DAY) == 1
+        assert db.session.get(UploadSession, idle) is None
+        assert db.session.get(UploadSession, active) is not None
+    assert not os.path.exists(idle_path)
+    assert running_hashes.take(idle) is None
+    assert client.get(f'/api/files/uploads/{idle}', headers=auth).status_code == 404
+    assert client.post(f'/api/files/uploads/{active}/complete', headers=auth).status_code == 201
+
+def test_finished_uploads_drop_their_hash(client, make_user, make_repository):
+    auth = make_user()
+    repo_id = make_repository(auth)
+    cancelled = start_upload(client, auth, repo_id)
+    assert client.delete(f'/api/files/uploads/{cancelled}', headers=auth).status_code == 200
+    assert running_hashes.take(cancelled) is None
+
+    completed = start_upload(client, auth, repo_id, b'0123456789')
+    client.put(f'/api/files/uploads/{completed}', headers={**auth, 'Content-Range': 'bytes 5-9/10'}, data=b'56789')
+    assert client.post(f'/api/files/uploads/{completed}/complete', headers=auth).status_code == 201
+    assert running_hashes.take(completed) is None
+
+def test_prune_drops_hashes_of_sessions_gone_elsewhere(app, client, make_user, make_repository):
+    auth = make_user()
+    upload_id = start_upload(client, auth, make_repository(auth))
+    with app.app_context():
+        # As if another worker completed it
+        UploadSession.query.filter_by(id=upload_id).delete()
+        db.session.commit()
+        assert running_hashes.prune(DAY) >= 1
+    assert running_hashes.take(upload_id) is None
+
+def test_orphaned_staging_files_are_removed(app):
+    with app.app_context():
+        old, recent = storage.staging_path('pdf'), storage.staging_path('pdf')
+        for path in (old, recent):
+            open(path, 'wb').close()
+        past = time.time() - DAY - 60
+        os.utime(old, (past, past))
+
+        expire_uploads(DAY)
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
@@ -0,0 +1,64 @@
+"""Share-link views counted per process and merged into ShareLink.view_count as deltas."""
+import pytest
+from server.extensions import db
+from server.models import ShareLink
+from server.writebehind import ViewCounter, view_counter
+
+IDLE = {'LOG_WRITE_BEHIND': True, 'VIEW_COUNT_FLUSH_INTERVAL': 3600.0}
+
+
+def view_count(app, link):
+    with app.app_context():
+        return db.session.get(ShareLink, link).view_count or 0
+
+def test_deltas_from_workers_add_up(app, worker, make_user, make_repository, make_share_link, share_link_id):
+    owner = make_user()
+    repo_id = make_repository(owner)
+    first, second = share_link_id(make_share_link(owner, repo_id)), share_link_id(make_share_link(owner, repo_id))
+    # Two processes counting the same links
+    one, other = worker(ViewCounter, **IDLE), worker(ViewCounter, **IDLE)
+
+    for _ in range(3):
+        one.increment(first)
+    other.increment(first, 2)
+    other.increment(second)
+    assert one.pending(first) == 3 and other.pending(first) == 2
+    assert view_count(app, first) == 0
+
+    one.flush_now()
+    other.flush_now()
+    assert view_count(app, first) == 5
+    assert view_count(app, second) == 1
+    assert one.stats() == {'enabled': True, 'pending_links': 0, 'pending_views': 0, 'merged': 3}
+
+def test_failed_merge_keeps_the_views(app, worker, monkeypatch, make_user, make_repository, make_share_link,
+                                      share_link_id):
+    owner = make_user()
+    link = share_link_id(make_share_link(owner, make_repository(owner)))
+    counter = worker(ViewCounter, **IDLE)
+    counter.increment(link, 4)
+
+    def unavailable(conn, params):
+        raise RuntimeError('database unavailable')
+    with monkeypatch.context() as patch:
+        patch.setattr(ViewCounter, '_apply', staticmethod(unavailable))
+        with app.app_context(), pytest.raises(RuntimeError):
+            counter.flush()
+    assert counter.pending(link) == 4
+
+    counter.flush_now()
+    assert view_count(app, link) == 4
+
+def test_share_view_counted_and_listed_with_pending(app, client, make_user, make_repository, make_share_link,
+                                                    share_link_id):
+    admin, owner = make_user('super_admin'), make_user()
+    token = make_share_link(owner, make_repository(owner))
+    link = share_link_id(token)
+    for _ in range(2):
+        assert client.get(f'/api/share/{token}').status_code == 200
+
+    # Not merged yet, but the admin list already includes this process's views
+    listed = client.get('/api/admin/share-links', headers=admin).json
+    assert next(item for item in listed if item['id'] == link)['view_count'] == 2
+    view_counter.flush_now()
+    assert view_count(app, link) == 2